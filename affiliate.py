@@ -0,0 +1,208 @@
+# affiliate.py
+"""
+Affiliate-/UTM-regler per merchant, kompilert én gang fra config.
+
+Config (ENV AFFIL_RULES: JSON direkte, eller sti til JSON-fil):
+{
+  "rules": [
+    {"hosts": ["amazon.com", "amazon.de"],          # matcher også underdomener (www.)
+     "params": {"tag": "pbw-20"},                   # settes alltid (overskriver)
+     "utm": {"utm_source": "purebloomworld"},       # settes bare hvis de mangler
+     "strip": ["ref", "ref_", "psc", "th"],         # fjernes (støy/sporing)
+     "https": true}                                 # tving https
+  ],
+  "default": {"utm": {"utm_medium": "affiliate"}}   # for verter uten egen regel
+}
+AFFIL_TAG (gammel ENV) gir en Amazon-regel med tag=AFFIL_TAG hvis ingen finnes.
+
+Alle URL-er normaliseres: vert i små bokstaver, fragment fjernes, query flettes
+med riktig encoding (ingen strengkonkatenering).
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Hashable, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import hashlib
+import json
+import os
+import threading
+
+AMAZON_HOSTS = ["amazon.com", "amazon.co.uk", "amazon.de", "amazon.se", "amazon.nl",
+                "amazon.fr", "amazon.es", "amazon.it", "amazon.ca"]
+
+
+@dataclass(frozen=True)
+class Rule:
+    params: Tuple[Tuple[str, str], ...] = ()
+    utm: Tuple[Tuple[str, str], ...] = ()
+    strip: FrozenSet[str] = frozenset()
+    https: bool = False
+
+    @classmethod
+    def from_config(cls, cfg: Dict) -> "Rule":
+        return cls(
+            params=tuple((str(k), str(v)) for k, v in (cfg.get("params") or {}).items()),
+            utm=tuple((str(k), str(v)) for k, v in (cfg.get("utm") or {}).items()),
+            strip=frozenset(str(s).lower() for s in cfg.get("strip") or ()),
+            https=bool(cfg.get("https", False)),
+        )
+
+    def apply(self, url: str) -> str:
+        parts = urlsplit(url.strip())
+        scheme = "https" if self.https and parts.scheme in ("http", "https") else parts.scheme
+        query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                 if k.lower() not in self.strip]
+        if self.params:
+            override = {k for k, _ in self.params}
+            query = [(k, v) for k, v in query if k not in override]
+            query.extend(self.params)
+        if self.utm:
+            present = {k for k, _ in query}
+            query.extend((k, v) for k, v in self.utm if k not in present)
+        netloc = parts.netloc.lower()
+        return urlunsplit((scheme, netloc, parts.path or "/", urlencode(query), ""))
+
+
+NORMALIZE_ONLY = Rule()
+
+
+@dataclass
+class RuleEngine:
+    by_host: Dict[str, Rule] = field(default_factory=dict)
+    default: Rule = NORMALIZE_ONLY
+    version: str = "0"
+
+    @classmethod
+    def compile(cls, config: Dict) -> "RuleEngine":
+        by_host: Dict[str, Rule] = {}
+        for cfg in config.get("rules") or ():
+            rule = Rule.from_config(cfg)
+            for host in cfg.get("hosts") or ():
+                by_host[str(host).lower().lstrip(".")] = rule
+        default = Rule.from_config(config["default"]) if config.get("default") else NORMALIZE_ONLY
+        canon = json.dumps(config, sort_keys=True, separators=(",", ":"))
+        version = hashlib.blake2b(canon.encode("utf-8"), digest_size=6).hexdigest()
+        return cls(by_host=by_host, default=default, version=version)
+
+    def rule_for(self, host: str) -> Rule:
+        host = host.lower()
+        while host:
+            rule = self.by_host.get(host)
+            if rule is not None:
+                return rule
+            _, _, host = host.partition(".")
+        return self.default
+
+    def rewrite(self, url: str) -> str:
+        if not url:
+            return url
+        host = urlsplit(url).hostname or ""
+        return self.rule_for(host).apply(url)
+
+
+def load_config(raw: str = "", tag: str = "") -> Dict:
+    raw = raw.strip()
+    config: Dict = {}
+    if raw:
+        if raw.startswith("{"):
+            config = json.loads(raw)
+        else:
+            with open(raw, encoding="utf-8") as f:
+                config = json.load(f)
+    if tag:
+        rules: List[Dict] = list(config.get("rules") or [])
+        covered = {h for r in rules for h in r.get("hosts") or ()}
+        if not covered.intersection(AMAZON_HOSTS):
+            rules.append({"hosts": AMAZON_HOSTS, "params": {"tag": tag}})
+        config = {**config, "rules": rules}
+    return config
+
+
+def _load_engine() -> RuleEngine:
+    try:
+        return RuleEngine.compile(load_config(os.getenv("AFFIL_RULES", ""),
+                                              os.getenv("AFFIL_TAG", "").strip()))
+    except (OSError, ValueError) as e:
+        print(f"[WARN] AFFIL_RULES unusable ({e}); URLs are only normalised")
+        return RuleEngine()
+
+
+ENGINE = _load_engine()
+
+
+def set_rules(config: Dict) -> RuleEngine:
+    """Bytt regelsett (ny versjon => gamle cache-oppføringer brukes ikke lenger)."""
+    global ENGINE
+    ENGINE = RuleEngine.compile(config)
+    return ENGINE
+
+
+def rewrite(url: str) -> str:
+    return ENGINE.rewrite(url)
+
+
+class LRU:
+    """Liten trådsikker LRU (redirect-cachen)."""
+
+    def __init__(self, maxsize: int = 50_000):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable):
+        with self._lock:
+            val = self._items.get(key)
+            if val is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return val
+
+    def put(self, key: Hashable, val) -> None:
+        with self._lock:
+            self._items[key] = val
+            self._items.move_to_end(key)
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+# pid -> (regelversjon, ferdig redirect-URL); feil versjon = miss
+REDIRECTS = LRU(int(os.getenv("REDIRECT_CACHE_SIZE", "50000") or 50000))
+
+
+def cached_target(pid: str) -> Optional[str]:
+    hit = REDIRECTS.get(pid)
+    if hit is None or hit[0] != ENGINE.version:
+        return None
+    return hit[1]
+
+
+def remember_target(pid: str, url: str) -> str:
+    engine = ENGINE
+    target = engine.rewrite(url)
+    REDIRECTS.put(pid, (engine.version, target))
+    return target
+
+
+def forget(pids: Optional[Iterable[str]] = None) -> None:
+    """Katalog-lytter: produkt(er) endret. None = alt."""
+    if pids is None:
+        REDIRECTS.clear()
+        return
+    for pid in pids:
+        REDIRECTS.pop(pid)
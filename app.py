@@ -1,12 +1,43 @@
-from flask import Flask
+# app.py
+"""
+ASGI-inngangen: create_app() setter sammen hele tjenesten.
 
-app = Flask(__name__)
+- Monterer alle rutere: main (agent: /healthz, /debug/*, /metrics, /trigger/*, /jobs),
+  site_routes (/top, /topsellers.json, /catalog.*, /search, /history/*, /img, /r/{pid})
+  og landing (/)
+- Innstillinger leses én gang (config.get_settings)
+- Tunge delsystemer lastes ved første bruk: HTTP-klienter (httpx), GitHub-pipelinen,
+  idé-motoren og Pillow
+- Oppstartstider per fase logges når startup er ferdig og vises på /debug/startup
+  (boottime.py); bench_boot.py måler kald start og time-to-healthy utenfra
 
-@app.route("/")
-def index():
-    return "AtomicBot is running."
+Kjør:  uvicorn app:app --host 0.0.0.0 --port $PORT   (eller: uvicorn --factory app:create_app)
+"""
+from boottime import BOOT   # først, så importtiden under telles
 
-@app.route("/heartbeat")
-def heartbeat():
-    print("💓 Heartbeat triggered (no Discord)")
-    return "Heartbeat OK (Flask running via python)"
+with BOOT.phase("fastapi"):
+    from fastapi import FastAPI
+
+
+def create_app() -> FastAPI:
+    with BOOT.phase("modules"):
+        import landing
+        import main
+        import metrics
+        import site_routes
+        from config import get_settings
+
+    with BOOT.phase("app"):
+        settings = get_settings()
+        app = FastAPI(title=settings.service_name)
+        app.state.settings = settings
+        app.add_middleware(metrics.MetricsMiddleware)
+        app.include_router(main.router)
+        app.include_router(site_routes.router)
+        app.include_router(landing.router)
+        app.add_event_handler("startup", main.startup_event)
+        app.add_event_handler("shutdown", main.shutdown_event)
+    return app
+
+
+app = create_app()
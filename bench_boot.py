@@ -0,0 +1,150 @@
+# bench_boot.py
+"""
+Kald start: tid fra `uvicorn app:app` startes til første 200 på /healthz.
+
+- Hver kjøring er en ny prosess (samme kommando som Procfile), med Discord/GitHub
+  på lokale stand-ins og uten tilstandsfiler
+- Med --products N lastes en syntetisk JSONL-feed ved oppstart (første kjøring
+  skriver snapshot, de neste leser det, som på en worker som restartes)
+- Rapporterer median/min time-to-healthy og fordelingen fra /debug/startup
+- --save skriver resultatet som baseline-JSON; med en baseline feiler kjøringen
+  (exit 1) hvis median time-to-healthy er mer enn --threshold dårligere
+
+Kjør:  python bench_boot.py [--runs 5] [--products 0]
+                            [--baseline data/boot_baseline.json] [--save] [--threshold 0.25]
+"""
+import argparse, http.client, json, os, platform, socket, statistics, subprocess, sys, tempfile, time
+
+from standin import StandIn, FakeGitHub
+
+DEFAULT_BASELINE = "data/boot_baseline.json"
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get(port: int, path: str, timeout: float = 1.0):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        conn.request("GET", path)
+        r = conn.getresponse()
+        return r.status, r.read()
+    finally:
+        conn.close()
+
+
+def boot_once(env: dict, timeout: float = 60.0) -> dict:
+    port = free_port()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited with {proc.returncode}: {proc.stderr.read().decode()[-2000:]}")
+            if time.perf_counter() - t0 > timeout:
+                raise RuntimeError(f"no healthy response within {timeout:.0f}s")
+            try:
+                status, _ = get(port, "/healthz", timeout=0.5)
+            except OSError:
+                status = None
+            if status == 200:
+                break
+            time.sleep(0.005)
+        healthy = time.perf_counter() - t0
+        _, body = get(port, "/debug/startup")
+        return {"healthy_s": healthy, **json.loads(body)}
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def summarize(runs: list) -> dict:
+    phases = {}
+    for r in runs:
+        for k, v in r["phases_ms"].items():
+            phases.setdefault(k, []).append(v)
+    return {
+        "healthy_s_median": round(statistics.median(r["healthy_s"] for r in runs), 3),
+        "healthy_s_min": round(min(r["healthy_s"] for r in runs), 3),
+        "ready_s_median": round(statistics.median(r["ready_s"] for r in runs), 3),
+        "phases_ms_median": {k: round(statistics.median(v), 1) for k, v in phases.items()},
+    }
+
+
+def run(args, env: dict) -> dict:
+    runs = []
+    for i in range(args.runs):
+        r = boot_once(env)
+        runs.append(r)
+        print(f"run {i + 1}: healthy {r['healthy_s'] * 1e3:6.0f} ms  (server: ready {r['ready_s'] * 1e3:.0f} ms, "
+              f"first healthy {r['first_healthy_s'] * 1e3:.0f} ms since {r['origin']} start)")
+    out = summarize(runs)
+    print(f"time-to-healthy median {out['healthy_s_median'] * 1e3:.0f} ms, min {out['healthy_s_min'] * 1e3:.0f} ms")
+    for k, v in out["phases_ms_median"].items():
+        print(f"  {k:<16}{v:9.1f} ms")
+    return out
+
+
+def main_cli(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--products", type=int, default=0, help="syntetisk katalog-feed ved oppstart (0 = demo)")
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--save", action="store_true", help="skriv resultatet som ny baseline")
+    ap.add_argument("--threshold", type=float, default=0.25)
+    args = ap.parse_args(argv)
+
+    github = FakeGitHub()
+    with StandIn() as discord_srv, StandIn(github) as github_srv, tempfile.TemporaryDirectory() as d:
+        env = dict(os.environ)
+        env.update({
+            "DISCORD_WEBHOOK": discord_srv.url + "/webhook",
+            "GH_API": github_srv.url, "GH_TOKEN": "bench", "GH_OWNER": "o", "GH_REPO": "r",
+            "GH_BLOB_CACHE": "", "SCHEDULER_STATE": "", "CLICK_LOG": "", "IMG_CACHE_DIR": "",
+            "CATALOG_FEED": "", "CATALOG_SNAPSHOT": "", "JOBS_LEASE": "", "TOPSELLER_SHARED": "",
+            "HEARTBEAT_MINUTES": "0", "TOPSELLER_ENABLE": "false",
+        })
+        if args.products:
+            from bench_loader import make_feed
+            env["CATALOG_FEED"], _ = make_feed(args.products, d)
+            env["CATALOG_SNAPSHOT"] = os.path.join(d, "catalog.snap")
+        summary = run(args, env)
+
+    results = {
+        "meta": {"runs": args.runs, "products": args.products, "python": platform.python_version(),
+                 "machine": platform.machine(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        **summary,
+    }
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    try:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    except OSError:
+        print(f"no baseline at {args.baseline} (use --save)")
+        return 0
+    old, cur = baseline["healthy_s_median"], results["healthy_s_median"]
+    if cur > old * (1 + args.threshold):
+        print(f"REGRESSION time-to-healthy {old * 1e3:.0f} -> {cur * 1e3:.0f} ms")
+        return 1
+    print(f"OK: within {args.threshold:.0%} of {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,83 @@
+# bench_catalog.py
+"""
+Minne/throughput: dataclass-liste (gammel sorted()) vs Catalog vs ColumnarCatalog.
+
+Kjør:  python bench_catalog.py [10000 100000 1000000]
+"""
+import gc, random, sys, time, tracemalloc
+
+from products import Product, Catalog, _rank_key
+from columnar import ColumnarCatalog
+
+
+CATEGORIES = ("Health", "Lifestyle", "Tech", "Eco")
+TAGS = ["kitchen", "outdoor", "travel", "audio", "smart-home", "fitness", "reusable", "charging",
+        "sleep", "garden", "office", "gaming", "pets", "baby", "skincare", "coffee"]
+
+
+def synth(n: int, seed: int = 1):
+    rnd = random.Random(seed)
+    return [
+        Product(
+            id=f"sku-{i}",
+            title=f"Product {i % 5000} {rnd.choice('ABCDEFGH')}",
+            image=f"https://img.example/{i % 5000}.jpg",
+            url=f"https://shop.example/dp/{i}",
+            price=round(rnd.uniform(5, 500), 2) if i % 17 else None,
+            score=round(rnd.uniform(0, 10), 2),
+            category=CATEGORIES[i % len(CATEGORIES)],
+            tags=tuple(rnd.sample(TAGS, rnd.randint(0, 3))),
+        )
+        for i in range(n)
+    ]
+
+
+def measure_mem(build):
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    cur, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, cur
+
+
+def per_call(fn, repeat: int) -> float:
+    t = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t) / repeat * 1e6
+
+
+def run(n: int) -> None:
+    print(f"\n== {n:,} products ==")
+    # top10 for columnar måles etter en score-endring (uten top-cache)
+    print(f"{'backend':<12}{'mem MB':>10}{'top10 µs':>14}{'rescore ms':>12}")
+
+    rows, mem = measure_mem(lambda: synth(n))
+    top = per_call(lambda: sorted(rows, key=_rank_key)[:10], 3)
+    t = time.perf_counter()
+    for p in rows:
+        p.score = p.score * 0.9
+    resc = (time.perf_counter() - t) * 1e3
+    print(f"{'list':<12}{mem / 1e6:>10.1f}{top:>14.1f}{resc:>12.1f}")
+
+    cat, mem_c = measure_mem(lambda: Catalog(rows))
+    top = per_call(lambda: cat.top(10), 1000)
+    print(f"{'catalog':<12}{(mem + mem_c) / 1e6:>10.1f}{top:>14.1f}{'-':>12}")
+    del cat
+
+    del rows
+    # bygg fra ferske Product-objekter så strengene telles med
+    col, mem_col = measure_mem(lambda: ColumnarCatalog(synth(n)))
+    top = per_call(lambda: (col.rescore(lambda price, score: score), col.top(10)), 5)
+    t = time.perf_counter()
+    col.rescore(lambda price, score: score * 0.9)
+    resc = (time.perf_counter() - t) * 1e3
+    print(f"{'columnar':<12}{mem_col / 1e6:>10.1f}{top:>14.1f}{resc:>12.1f}")
+    print(f"{'(cached)':<12}{'':>10}{per_call(lambda: col.top(10), 1000):>14.1f}")
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    for n in sizes:
+        run(n)
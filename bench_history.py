@@ -0,0 +1,106 @@
+# bench_history.py
+"""
+rank_history.RankHistory: størrelse, skrivetid og spørringstid for år med timesrangeringer.
+
+- Syntetisk katalog der scorene vandrer litt hver time; topp N lagres per time
+- Sjekker at alt som leses tilbake (at, rank_over_time, movers, etter gjenåpning,
+  avrevet hale og komprimering) er likt det som ble skrevet
+
+Kjør:  python bench_history.py [--years 3] [--n 50] [--products 400]
+"""
+import argparse, os, random, sys, tempfile, time
+
+from rank_history import DAY, RankHistory
+
+T0 = 1_600_000_000
+
+
+def synth_runs(years: float, n: int, products: int, seed: int = 3):
+    """(t, [(pid, score, pris), ...]) per time, beste først."""
+    rnd = random.Random(seed)
+    scores = {f"sku-{i}": rnd.uniform(0, 10) for i in range(products)}
+    prices = {pid: round(rnd.uniform(5, 500), 2) if rnd.random() > 0.05 else None for pid in scores}
+    pids = list(scores)
+    for h in range(int(years * 365 * 24)):
+        for pid in rnd.sample(pids, max(products // 50, 1)):      # noen få endres per time
+            scores[pid] = min(max(scores[pid] + rnd.gauss(0, 0.3), 0.0), 10.0)
+        if rnd.random() < 0.01:
+            pid = rnd.choice(pids)
+            prices[pid] = round(rnd.uniform(5, 500), 2)
+        top = sorted(pids, key=lambda p: (-round(scores[p], 4), p))[:n]
+        yield T0 + h * 3600, [(p, round(scores[p], 4), prices[p]) for p in top]
+
+
+def timed(fn, repeat: int = 20) -> float:
+    t = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t) / repeat * 1e3
+
+
+def main_cli(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--years", type=float, default=3)
+    ap.add_argument("--n", type=int, default=50)
+    ap.add_argument("--products", type=int, default=400)
+    args = ap.parse_args(argv)
+
+    runs = list(synth_runs(args.years, args.n, args.products))
+    truth = {t: rows for t, rows in runs}
+    times = [t for t, _ in runs]
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "rank.bin")
+        h = RankHistory(path, compact_every=0)
+        t = time.perf_counter()
+        for ts, rows in runs:
+            h.append(rows, ts)
+        dt = time.perf_counter() - t
+        size = os.path.getsize(path)
+        print(f"{len(runs):,} rangeringer x {args.n}: {size / 1e6:.2f} MB "
+              f"({size / len(runs):.0f} B/rangering, indeks {os.path.getsize(path + '.idx') / 1e3:.1f} kB), "
+              f"append {dt / len(runs) * 1e6:.0f} µs")
+
+        rnd = random.Random(5)
+        reader = RankHistory(path)            # som en annen worker: bare indeksen lastes
+        for ts in rnd.sample(times, 200):
+            snap = reader.at(ts + rnd.randrange(3600))
+            assert snap.t == ts and [tuple(e) for e in snap.entries] == [tuple(r) for r in truth[ts]], ts
+        mid = times[len(times) // 2]
+        pid = truth[mid][0][0]
+        week = reader.rank_over_time(pid, mid, mid + 7 * DAY)
+        assert len(week) == 7 * 24 + 1
+        for row in week:
+            ranks = [r[0] for r in truth[row["t"]]]
+            assert row["rank"] == (ranks.index(pid) + 1 if pid in ranks else None)
+        print(f"at(t)                     {timed(lambda: reader.at(mid)):8.2f} ms")
+        print(f"rank_over_time 1 uke      {timed(lambda: reader.rank_over_time(pid, mid, mid + 7 * DAY)):8.2f} ms")
+        print(f"rank_over_time 1 år       {timed(lambda: reader.rank_over_time(pid, mid, mid + 365 * DAY), 3):8.2f} ms")
+        print(f"movers (30 dager)         {timed(lambda: reader.movers(mid - 30 * DAY, mid)):8.2f} ms")
+        m = reader.movers(mid - 30 * DAY, mid)
+        print(f"  opp {len(m['up'])}, ned {len(m['down'])}, nye {len(m['new'])}, ute {len(m['dropped'])}")
+
+        # avrevet hale: skriveren kutter den og fortsetter
+        with open(path, "ab") as f:
+            f.write(b"\x40\x02\x05")
+        h2 = RankHistory(path, compact_every=0)
+        h2.append(runs[-1][1], times[-1] + 3600)
+        assert h2.at(times[-1] + 7200).t == times[-1] + 3600 and h2.at(times[-1]).t == times[-1]
+
+        t = time.perf_counter()
+        rep = h2.compact(now=times[-1] + 3600)
+        print(f"compact: {rep['snapshots']:,} rangeringer beholdt, {rep['bytes_before'] / 1e6:.2f} -> "
+              f"{rep['bytes_after'] / 1e6:.2f} MB på {time.perf_counter() - t:.2f} s")
+        for ts in rnd.sample(times, 200):
+            assert [tuple(e) for e in reader.at(ts).entries] == [tuple(r) for r in truth[ts]], ts
+
+        daily = RankHistory(path, compact_every=0, hourly_days=90)
+        rep = daily.compact(now=times[-1])
+        print(f"compact, timer bare siste 90 dager: {rep['bytes_after'] / 1e6:.2f} MB")
+        recent = times[-24 * 30]
+        assert [tuple(e) for e in reader.at(recent).entries] == [tuple(r) for r in truth[recent]]
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
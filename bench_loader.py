@@ -0,0 +1,68 @@
+# bench_loader.py
+"""
+Innlasting av katalog: json.load av JSON-array vs strømmende JSONL-feed (med og uten
+skriving av snapshot) vs mmap-snapshot.
+Hver variant kjøres i egen prosess så peak RSS blir målt hver for seg.
+
+Kjør:  python bench_loader.py [antall produkter]   (default 200000)
+"""
+import json, os, random, resource, subprocess, sys, tempfile, time
+
+def make_feed(n: int, d: str):
+    rnd = random.Random(7)
+    jsonl, arr = os.path.join(d, "feed.jsonl"), os.path.join(d, "feed.json")
+    rows = ({
+        "id": f"sku-{i}",
+        "title": f"Product {i % 5000} {rnd.choice('ABCDEFGH')}",
+        "image": f"https://img.example/{i % 5000}.jpg",
+        "url": f"https://shop.example/dp/{i}",
+        "price": round(rnd.uniform(5, 500), 2),
+        "score": round(rnd.uniform(0, 10), 2),
+    } for i in range(n))
+    with open(jsonl, "w") as f, open(arr, "w") as g:
+        g.write("[")
+        for i, r in enumerate(rows):
+            line = json.dumps(r)
+            f.write(line + "\n")
+            g.write(("," if i else "") + line)
+        g.write("]")
+    return jsonl, arr
+
+def child(mode: str, path: str, snap: str):
+    t0 = time.perf_counter()
+    if mode == "json.load":
+        from catalog_loader import validate
+        from products import Catalog
+        with open(path) as f:
+            Catalog(validate(r) for r in json.load(f))
+    elif mode == "feed":
+        from catalog_loader import load_feed
+        from products import Catalog
+        load_feed(path, Catalog(), snapshot=None)
+    elif mode == "feed+snap":
+        from catalog_loader import load_feed
+        from products import Catalog
+        load_feed(path, Catalog(), snapshot=snap)
+    elif mode == "snapshot":
+        from catalog_loader import load_snapshot
+        from products import Catalog
+        load_snapshot(snap, Catalog())
+    dt = time.perf_counter() - t0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"mode": mode, "seconds": dt, "peak_rss_mb": rss}))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(*sys.argv[2:5])
+        sys.exit(0)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    with tempfile.TemporaryDirectory() as d:
+        jsonl, arr = make_feed(n, d)
+        snap = os.path.join(d, "catalog.snap")
+        print(f"{n:,} products  feed {os.path.getsize(jsonl) / 1e6:.1f} MB")
+        for mode, path in (("json.load", arr), ("feed", jsonl), ("feed+snap", jsonl), ("snapshot", jsonl)):
+            out = subprocess.run([sys.executable, __file__, "--child", mode, path, snap],
+                                 capture_output=True, text=True, check=True).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"{mode:<10} {r['seconds']:>7.2f} s   peak RSS {r['peak_rss_mb']:>7.1f} MB")
+        print(f"snapshot size {os.path.getsize(snap) / 1e6:.1f} MB")
@@ -0,0 +1,141 @@
+# bench_redirect.py
+"""
+Latens for /r/{pid}: regelmotor (miss), LRU-treff, klikk-telling, og hele
+ASGI-stakken in-process (uten/med klikk-telling, og med metrics-middleware).
+
+Kjør:  python bench_redirect.py [antall produkter] [antall requests]
+"""
+import asyncio, random, statistics, sys, time
+
+from fastapi import FastAPI
+
+import affiliate
+import clicks
+import metrics
+import products
+import site_routes
+
+RULES = {
+    "rules": [{"hosts": affiliate.AMAZON_HOSTS, "params": {"tag": "pbw-20"},
+               "strip": ["ref", "ref_", "psc", "th"], "https": True,
+               "utm": {"utm_source": "purebloomworld", "utm_medium": "affiliate"}}],
+    "default": {"utm": {"utm_source": "purebloomworld"}},
+}
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p))]
+
+
+def report(name, lat_s, total_s=None):
+    us = [x * 1e6 for x in lat_s]
+    line = f"{name:<24} p50 {pct(us, .50):7.1f} µs  p95 {pct(us, .95):7.1f} µs  p99 {pct(us, .99):7.1f} µs"
+    if total_s:
+        line += f"  {len(lat_s) / total_s:9.0f} req/s"
+    print(line)
+
+
+async def asgi_get(app, path):
+    """Minimal ASGI-kall uten HTTP-klient (måler bare appen)."""
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+             "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80)}
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(msg):
+        nonlocal status
+        if msg["type"] == "http.response.start":
+            status = msg["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def main(n_products: int, n_requests: int):
+    products.CATALOG.load(
+        products.Product(id=f"amz-{i}", title=f"P {i}", image="",
+                         url=f"https://www.amazon.com/dp/B{i:09d}?ref=sr_1_{i % 7}&th=1",
+                         price=9.99, score=random.random() * 10)
+        for i in range(n_products))
+    affiliate.set_rules(RULES)
+    pids = [f"amz-{random.randrange(n_products)}" for _ in range(n_requests)]
+    urls = [products.get_product(p).url for p in pids]
+
+    lat = []
+    for u in urls[:20000]:
+        t = time.perf_counter()
+        affiliate.ENGINE.rewrite(u)
+        lat.append(time.perf_counter() - t)
+    report("rule engine (miss)", lat)
+
+    for p in pids:                                   # varm opp cachen
+        affiliate.remember_target(p, products.get_product(p).url)
+    lat = []
+    for p in pids:
+        t = time.perf_counter()
+        affiliate.cached_target(p)
+        lat.append(time.perf_counter() - t)
+    report("LRU hit", lat)
+
+    tracker = clicks.ClickTracker(log_path=None)
+    lat = []
+    for p in pids:
+        t = time.perf_counter()
+        tracker.hit(p)
+        lat.append(time.perf_counter() - t)
+    report("click hit()", lat)
+    t = time.perf_counter()
+    tracker.flush()
+    tracker.apply(products.CATALOG)
+    print(f"click flush+apply        {(time.perf_counter() - t) * 1e3:.1f} ms for {len(pids)} clicks")
+
+    hist = metrics.Histogram("bench_seconds", "bench", ("method", "route"))
+    lat = []
+    for _ in range(len(pids)):
+        t = time.perf_counter()
+        hist.observe(0.0001, "GET", "/r/{pid}")
+        lat.append(time.perf_counter() - t)
+    report("histogram observe()", lat)
+
+    async def noop(scope, receive, send):   # måler bare middleware-kostnaden
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+    for label, inner in (("ASGI no-op", noop), ("ASGI no-op +metrics", metrics.MetricsMiddleware(noop))):
+        lat = []
+        for _ in range(len(pids)):
+            t = time.perf_counter()
+            await asgi_get(inner, "/r/x")
+            lat.append(time.perf_counter() - t)
+        report(label, lat)
+
+    app = FastAPI()
+    app.include_router(site_routes.router)
+    metered = FastAPI()
+    metered.include_router(site_routes.router)
+    metered.add_middleware(metrics.MetricsMiddleware)
+    real_hit = clicks.hit
+    for label, hit, app in (("ASGI /r/{pid} no clicks", lambda pid: None, app),
+                            ("ASGI /r/{pid}", real_hit, app),
+                            ("ASGI /r/{pid} +metrics", real_hit, metered)):
+        clicks.hit = hit
+        for p in pids[:1000]:
+            await asgi_get(app, f"/r/{p}")
+        lat = []
+        t0 = time.perf_counter()
+        for p in pids:
+            t = time.perf_counter()
+            status = await asgi_get(app, f"/r/{p}")
+            lat.append(time.perf_counter() - t)
+            assert status == 302
+        report(label, lat, time.perf_counter() - t0)
+    clicks.hit = real_hit
+    print(f"cache hits {affiliate.REDIRECTS.hits}, size {len(affiliate.REDIRECTS)}")
+
+
+if __name__ == "__main__":
+    n_products = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    asyncio.run(main(n_products, n_requests))
@@ -0,0 +1,174 @@
+# bench_routes.py
+"""
+Last/latens for alle rutene, in-process via httpx.ASGITransport (ingen uvicorn, ingen nett).
+
+- Syntetisk katalog med valgfri størrelse
+- Discord og GitHub peker på lokale stand-ins (standin.StandIn + FakeGitHub)
+- Rapporterer req/s og p50/p95/p99 per rute
+- --save skriver resultatet som baseline-JSON; med en baseline feiler kjøringen
+  (exit 1) hvis p95 er mer enn --threshold dårligere, eller req/s tilsvarende lavere
+
+Kjør:  python bench_routes.py [--products 100000] [--requests 2000] [--concurrency 8]
+                              [--baseline data/bench_baseline.json] [--save] [--threshold 0.25]
+"""
+import argparse, asyncio, json, os, platform, random, sys, time
+
+from standin import StandIn, FakeGitHub
+
+DEFAULT_BASELINE = "data/bench_baseline.json"
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p))]
+
+
+class Route:
+    def __init__(self, name, app, path, status=200, headers=None, share=1.0):
+        self.name = name
+        self.app = app
+        self.path = path            # str eller callable(rnd) -> str
+        self.status = status
+        self.headers = headers or {}
+        self.share = share          # andel av --requests (trege ruter kjøres færre ganger)
+
+
+def setup_env(discord_url: str, github_url: str) -> None:
+    """Må kjøres før app/main importeres (de leser ENV ved import)."""
+    os.environ.update({
+        "DISCORD_WEBHOOK": discord_url + "/webhook",
+        "GH_API": github_url, "GH_TOKEN": "bench", "GH_OWNER": "o", "GH_REPO": "r",
+        "GH_BLOB_CACHE": "", "SCHEDULER_STATE": "", "CLICK_LOG": "",
+        "CATALOG_FEED": "", "CATALOG_SNAPSHOT": "", "JOBS_LEASE": "", "TOPSELLER_SHARED": "",
+        "HEARTBEAT_MINUTES": "0", "IDEAS_ENABLE": "false", "TOPSELLER_ENABLE": "false",
+        "RANK_HISTORY": "", "TRIGGER_RATE_PER_MIN": "1000000", "TRIGGER_BURST": "1000000",
+    })
+
+
+async def drive(route: Route, n: int, concurrency: int, seed: int = 1):
+    import httpx
+
+    rnd = random.Random(seed)
+    paths = [route.path(rnd) if callable(route.path) else route.path for _ in range(n)]
+    lat = []
+    transport = httpx.ASGITransport(app=route.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 headers=route.headers, follow_redirects=False) as client:
+        for p in paths[:min(50, n)]:                 # oppvarming (caches, lazy oppsett)
+            await client.get(p)
+        it = iter(paths)
+
+        async def worker():
+            for p in it:
+                t = time.perf_counter()
+                r = await client.get(p)
+                lat.append(time.perf_counter() - t)
+                if r.status_code != route.status:
+                    raise AssertionError(f"{route.name}: {p} -> {r.status_code}")
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - t0
+    ms = [x * 1e3 for x in lat]
+    return {"n": len(ms), "rps": round(len(ms) / wall, 1),
+            "p50_ms": round(pct(ms, .50), 3), "p95_ms": round(pct(ms, .95), 3),
+            "p99_ms": round(pct(ms, .99), 3)}
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """Liste med regresjoner (tom = OK)."""
+    bad = []
+    for name, cur in results["routes"].items():
+        old = baseline.get("routes", {}).get(name)
+        if not old:
+            continue
+        if cur["p95_ms"] > old["p95_ms"] * (1 + threshold):
+            bad.append(f"{name}: p95 {old['p95_ms']} -> {cur['p95_ms']} ms")
+        if cur["rps"] < old["rps"] * (1 - threshold):
+            bad.append(f"{name}: {old['rps']} -> {cur['rps']} req/s")
+    return bad
+
+
+async def run(args, discord_srv: StandIn, github: FakeGitHub) -> dict:
+    from bench_catalog import synth
+    import main, products
+    from app import create_app
+
+    app = create_app()
+    await main.startup_event()
+    try:
+        products.CATALOG.load(synth(args.products))
+        n_products = len(products.CATALOG)
+
+        def product_path(rnd):
+            return f"/r/sku-{rnd.randrange(n_products)}"
+
+        gz = {"Accept-Encoding": "gzip"}
+        routes = [
+            Route("site /top", app, "/top", headers=gz),
+            Route("site /topsellers.json", app, "/topsellers.json", headers=gz),
+            Route("site /r/{pid}", app, product_path, status=302),
+            Route("site /catalog.json", app, "/catalog.json?limit=50"),
+            Route("landing /", app, "/", headers=gz),
+            Route("main /healthz", app, "/healthz"),
+            Route("main /metrics", app, "/metrics", share=0.1),
+            Route("main /trigger/topsellers", app, "/trigger/topsellers", status=202, share=0.05),
+        ]
+        out = {}
+        for route in routes:
+            if args.only and args.only not in route.name:
+                continue
+            n = max(int(args.requests * route.share), 20)
+            out[route.name] = res = await drive(route, n, args.concurrency)
+            print(f"{route.name:<26} {res['rps']:9.0f} req/s  p50 {res['p50_ms']:7.3f} ms  "
+                  f"p95 {res['p95_ms']:7.3f} ms  p99 {res['p99_ms']:7.3f} ms")
+    finally:
+        await main.shutdown_event()
+    print(f"stand-ins: discord {len(discord_srv.requests)} posts, "
+          f"github {len(github.calls)} API calls")
+    return {
+        "meta": {"products": args.products, "requests": args.requests,
+                 "concurrency": args.concurrency, "python": platform.python_version(),
+                 "machine": platform.machine(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "routes": out,
+    }
+
+
+def main_cli(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--products", type=int, default=100_000)
+    ap.add_argument("--requests", type=int, default=2000, help="requests per rute")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--only", default="", help="bare ruter som inneholder denne teksten")
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--save", action="store_true", help="skriv resultatet som ny baseline")
+    ap.add_argument("--threshold", type=float, default=0.25)
+    args = ap.parse_args(argv)
+
+    github = FakeGitHub()
+    with StandIn() as discord_srv, StandIn(github) as github_srv:
+        setup_env(discord_srv.url, github_srv.url)
+        results = asyncio.run(run(args, discord_srv, github))
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    try:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    except OSError:
+        print(f"no baseline at {args.baseline} (use --save)")
+        return 0
+    bad = compare(results, baseline, args.threshold)
+    for line in bad:
+        print(f"REGRESSION {line}")
+    if not bad:
+        print(f"OK: within {args.threshold:.0%} of {args.baseline}")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
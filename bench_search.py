@@ -0,0 +1,75 @@
+# bench_search.py
+"""
+search.SearchIndex: byggetid, minne og latens per spørringstype.
+
+Kjør:  python bench_search.py [100000 1000000]
+"""
+import gc, sys, time, tracemalloc
+
+from bench_catalog import synth
+from products import Catalog, Product
+from search import SearchIndex
+
+QUERIES = [
+    ("alt (ingen filter)", {}),
+    ("tekst, vanlig ord", {"q": "product"}),
+    ("tekst, sjeldent", {"q": "product 4242"}),
+    ("prefiks", {"q": "product 42"}),
+    ("kategori", {"category": "Tech"}),
+    ("kategori + tag", {"category": "Eco", "tags": ["outdoor"]}),
+    ("pris 10-20", {"min_price": 10, "max_price": 20}),
+    ("score >= 9.9", {"min_score": 9.9}),
+    ("tekst + pris", {"q": "product a", "min_price": 100, "max_price": 200}),
+    ("kategori, pris stigende", {"category": "Health", "sort": "price_asc"}),
+    ("tag, side 50", {"tags": ["kitchen"], "offset": 1000}),
+]
+
+
+def per_call(fn, repeat: int, rounds: int = 5) -> float:
+    """Beste av `rounds` gjennomsnitt (mindre støy fra GC og andre prosesser)."""
+    best = float("inf")
+    for _ in range(rounds):
+        t = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, (time.perf_counter() - t) / repeat * 1e3)
+    return best
+
+
+def run(n: int) -> None:
+    print(f"\n== {n:,} products ==")
+    cat = Catalog(synth(n))
+    gc.collect()
+    tracemalloc.start()
+    probe = SearchIndex(cat)
+    probe.search(limit=1)
+    mem, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del probe
+    index = SearchIndex(cat)
+    t = time.perf_counter()
+    index.search(limit=1)
+    print(f"build {(time.perf_counter() - t) * 1e3:.0f} ms, index {mem / 1e6:.1f} MB")
+    print(f"{'query':<26}{'hits':>9}{'ms':>9}")
+    for name, kw in QUERIES:
+        total = index.search(**kw)["total"]
+        ms = per_call(lambda: index.search(**kw), 10)
+        print(f"{name:<26}{total:>9}{ms:>9.2f}")
+    # inkrementell oppdatering
+    p = cat.get("sku-7")
+    ms = per_call(lambda: cat.upsert(Product(p.id, p.title + " x", p.image, p.url, p.price, p.score,
+                                             p.category, p.tags)), 100)
+    print(f"{'upsert (katalog, kø)':<26}{'':>9}{ms:>9.3f}")
+    t = time.perf_counter()
+    index.search(limit=1)
+    print(f"{'søk etter 500 upserts':<26}{'':>9}{(time.perf_counter() - t) * 1e3:>9.2f}")
+    cat.set_scores({f"sku-{i}": 9.99 for i in range(1, 200)})
+    t = time.perf_counter()
+    total = index.search(min_score=9.9)["total"]
+    print(f"{'score >= 9.9, 199 nye':<26}{total:>9}{(time.perf_counter() - t) * 1e3:>9.2f}")
+    assert index.builds == 1, index.builds
+
+
+if __name__ == "__main__":
+    for n in [int(a) for a in sys.argv[1:]] or [100_000]:
+        run(n)
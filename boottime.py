@@ -0,0 +1,89 @@
+# boottime.py
+"""
+Oppstartstider: hvor lang tid går fra prosessen starter til første friske /healthz?
+
+- Faser måles med BOOT.phase("navn") (import av fastapi, våre moduler, katalog, ...)
+- Tiden før appen importeres (python + uvicorn) regnes fra prosessens starttid
+  i /proc (Linux); uten /proc starter klokka når denne modulen importeres
+- BOOT.ready() kalles når startup er ferdig: logger én linje med fordelingen
+- BOOT.healthy() kalles av /healthz: første kall gir time-to-healthy
+- Vises på /debug/startup og som metrikker (pbw_startup_*); bench_boot.py
+  måler det samme utenfra
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+import os
+import time
+
+import metrics
+
+PHASES = metrics.gauge("pbw_startup_phase_seconds", "Startup time by phase", ("phase",))
+READY = metrics.gauge("pbw_startup_ready_seconds", "Process start to end of app startup")
+HEALTHY = metrics.gauge("pbw_startup_first_healthy_seconds", "Process start to first /healthz response")
+
+
+def process_start() -> Optional[float]:
+    """Prosessens starttid (epoch-sek, ~10 ms oppløsning), eller None utenfor Linux."""
+    try:
+        with open("/proc/self/stat", "rb") as f:
+            stat = f.read()
+        with open("/proc/uptime", "rb") as f:
+            uptime = float(f.read().split()[0])
+        # feltene etter "(comm)"; starttime (ticks etter boot) er felt 22, indeks 19 etter comm
+        ticks = int(stat.rsplit(b")", 1)[1].split()[19])
+        return time.time() - (uptime - ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class BootTimer:
+    def __init__(self, started: Optional[float] = None):
+        now = time.time()
+        self.origin = "process" if started is not None else "import"
+        self.started = started if started is not None and started <= now else now
+        self.phases: Dict[str, float] = {}
+        if self.origin == "process":
+            self._record("python+uvicorn", now - self.started)
+        self.ready_s: Optional[float] = None
+        self.first_healthy_s: Optional[float] = None
+
+    def _record(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        PHASES.set(self.phases[name], name)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, time.perf_counter() - t)
+
+    def elapsed(self) -> float:
+        return time.time() - self.started
+
+    def ready(self) -> None:
+        self.ready_s = self.elapsed()
+        READY.set(self.ready_s)
+        parts = ", ".join(f"{k} {v * 1e3:.0f} ms" for k, v in self.phases.items())
+        print(f"[INFO] startup ready in {self.ready_s:.2f}s (since {self.origin}): {parts}")
+
+    def healthy(self) -> None:
+        if self.first_healthy_s is not None:
+            return
+        self.first_healthy_s = self.elapsed()
+        HEALTHY.set(self.first_healthy_s)
+        print(f"[INFO] first healthy response {self.first_healthy_s:.2f}s after {self.origin} start")
+
+    def stats(self) -> dict:
+        return {
+            "origin": self.origin,
+            "phases_ms": {k: round(v * 1e3, 1) for k, v in self.phases.items()},
+            "ready_s": None if self.ready_s is None else round(self.ready_s, 3),
+            "first_healthy_s": None if self.first_healthy_s is None else round(self.first_healthy_s, 3),
+            "uptime_s": round(self.elapsed(), 1),
+        }
+
+
+BOOT = BootTimer(process_start())
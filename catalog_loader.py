@@ -0,0 +1,290 @@
+# catalog_loader.py
+"""
+Bulk-innlasting av katalogen fra produktfeed + binær snapshot for rask oppstart.
+
+- Feed: JSONL/NDJSON eller CSV (kolonner: id,title,image,url,price,score,
+  category,tags; tags som liste eller "a|b|c"),
+  leses linje for linje, valideres til Product og går rett inn i katalogbyggingen
+  (ingen mellomliste av hele feeden)
+- Ny katalog byttes inn atomisk (CATALOG.load), ugyldige rader telles og hoppes over
+- Snapshot: kompakt binærfil som mmap-es ved oppstart i stedet for å parse feeden;
+  sparer JSON-parsing og validering (Product-objektene lages fortsatt, rett inn i
+  katalogen). Målinger: bench_loader.py
+- boot_catalog() er blokkerende; main.py kjører den i en tråd
+
+ENV:
+- CATALOG_FEED      (valgfri) sti til feed
+- CATALOG_SNAPSHOT  (default: data/catalog.snap)
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional
+import csv
+import gzip
+import io
+import json
+import math
+import mmap
+import os
+import struct
+import time
+from array import array
+from itertools import chain
+
+import metrics
+from products import Product, CATALOG
+
+FEED_PATH = os.getenv("CATALOG_FEED", "").strip()
+SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT", "data/catalog.snap").strip()
+
+CHUNK_SIZE = 5000
+MAX_ERRORS_KEPT = 20
+
+# -------- validering --------
+def _opt_float(v, name: str) -> Optional[float]:
+    if v is None or v == "":
+        return None
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} is not a number: {v!r}")
+    if math.isnan(f) or f < 0:
+        raise ValueError(f"{name} must be >= 0: {v!r}")
+    return f
+
+def validate(row: Dict) -> Product:
+    """Rå feed-rad -> Product. ValueError ved ugyldig rad."""
+    pid = str(row.get("id") or "").strip()
+    title = str(row.get("title") or "").strip()
+    url = str(row.get("url") or "").strip()
+    if not pid:
+        raise ValueError("missing id")
+    if not title:
+        raise ValueError("missing title")
+    if not url.startswith(("http://", "https://")):
+        raise ValueError(f"bad url: {url[:80]!r}")
+    return Product(
+        id=pid,
+        title=title,
+        image=str(row.get("image") or "").strip(),
+        url=url,
+        price=_opt_float(row.get("price"), "price"),
+        score=_opt_float(row.get("score"), "score") or 0.0,
+        category=str(row.get("category") or "").strip(),
+        tags=_tags(row.get("tags")),
+    )
+
+def _tags(v) -> tuple:
+    if not v:
+        return ()
+    if isinstance(v, str):
+        v = v.replace(",", "|").split("|")
+    elif not isinstance(v, (list, tuple)):
+        raise ValueError(f"tags must be a list or string: {v!r}")
+    return tuple(dict.fromkeys(t for t in (str(x).strip().lower() for x in v) if t))
+
+# -------- feed-lesing --------
+@dataclass
+class LoadReport:
+    path: str
+    rows: int = 0
+    loaded: int = 0
+    rejected: int = 0
+    errors: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+    source: str = "feed"
+
+    def reject(self, lineno: int, err: Exception) -> None:
+        self.rejected += 1
+        if len(self.errors) < MAX_ERRORS_KEPT:
+            self.errors.append(f"line {lineno}: {err}")
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+def _raw_rows(path: str) -> Iterator[tuple]:
+    """(linjenr, dict | Exception) for hver rad i feeden."""
+    base = path[:-3] if path.endswith(".gz") else path
+    with _open_text(path) as f:
+        if base.endswith(".csv"):
+            for lineno, row in enumerate(csv.DictReader(f), start=2):
+                yield lineno, row
+            return
+        batch: List[tuple] = []
+        for lineno, line in enumerate(f, start=1):
+            line = line.strip()
+            if line:
+                batch.append((lineno, line))
+            if len(batch) >= CHUNK_SIZE:
+                yield from _parse_lines(batch)
+                batch = []
+        yield from _parse_lines(batch)
+
+def _parse_lines(batch: List[tuple]) -> Iterator[tuple]:
+    """Én json.loads per bit (mye raskere enn per linje); linje for linje bare om biten har feil."""
+    if not batch:
+        return
+    try:
+        objs = json.loads("[" + ",".join(line for _, line in batch) + "]")
+        if len(objs) != len(batch):
+            raise ValueError("line count mismatch")
+    except ValueError:
+        objs = []
+        for _, line in batch:
+            try:
+                objs.append(json.loads(line))
+            except ValueError as e:
+                objs.append(e)
+    for (lineno, _), obj in zip(batch, objs):
+        if isinstance(obj, Exception) or isinstance(obj, dict):
+            yield lineno, obj
+        else:
+            yield lineno, ValueError("row is not an object")
+
+def iter_feed(path: str, report: Optional[LoadReport] = None,
+              chunk_size: int = CHUNK_SIZE) -> Iterator[List[Product]]:
+    """Validerte produkter i biter på chunk_size."""
+    report = report or LoadReport(path)
+    chunk: List[Product] = []
+    for lineno, row in _raw_rows(path):
+        report.rows += 1
+        if isinstance(row, Exception):
+            report.reject(lineno, row)
+            continue
+        try:
+            chunk.append(validate(row))
+        except ValueError as e:
+            report.reject(lineno, e)
+            continue
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def load_feed(path: str, catalog=CATALOG, snapshot: Optional[str] = SNAPSHOT_PATH) -> LoadReport:
+    """Les feeden rett inn i en ny katalog og bytt den inn i én operasjon."""
+    t0 = time.perf_counter()
+    report = LoadReport(path)
+    chunks = iter_feed(path, report)
+    first = next(chunks, None)
+    if first is None:   # ingen gyldige rader: behold katalogen vi har
+        raise ValueError(f"feed {path} had no valid rows ({report.rejected} rejected)")
+    catalog.load(chain(first, chain.from_iterable(chunks)))
+    metrics.RANKING.observe(time.perf_counter() - t0, "load")
+    report.loaded = len(catalog)
+    if snapshot:
+        write_snapshot(snapshot, catalog.iter_ranked())
+    report.seconds = time.perf_counter() - t0
+    return report
+
+# -------- binær snapshot --------
+# Layout: header | rader | strengtabell (slutt-offset per streng, i tegn) | utf-8-blob
+# header: magic, formatversjon, antall rader, antall strenger, blob-lengde i bytes
+_HEADER = struct.Struct("<8sIIIQ")
+# per rad: price (NaN = None), score, strengindeks for id/title/image/url/category/tags
+# (tags lagres som én streng skilt med _TAG_SEP)
+_RECORD = struct.Struct("<dd6I")
+_MAGIC = b"PBWSNAP1"
+_FORMAT = 2
+_TAG_SEP = "\x1f"
+
+def write_snapshot(path: str, products: Iterable[Product]) -> int:
+    table: Dict[str, int] = {}       # like strenger (f.eks. bilder) lagres én gang
+    records = bytearray()
+    count = 0
+
+    def idx(s: str) -> int:
+        i = table.get(s)
+        if i is None:
+            i = table[s] = len(table)
+        return i
+
+    for p in products:
+        price = math.nan if p.price is None else p.price
+        records += _RECORD.pack(price, p.score, idx(p.id), idx(p.title), idx(p.image), idx(p.url),
+                                idx(p.category), idx(_TAG_SEP.join(p.tags)))
+        count += 1
+
+    ends, pos = array("I"), 0
+    for s in table:                  # dict beholder innsettingsrekkefølge = indeks
+        pos += len(s)
+        ends.append(pos)
+    blob = "".join(table).encode("utf-8")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"   # flere workere kan bygge snapshoten samtidig
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _FORMAT, count, len(table), len(blob)))
+        f.write(records)
+        f.write(ends.tobytes())
+        f.write(blob)
+    os.replace(tmp, path)
+    return count
+
+def iter_snapshot(path: str) -> Iterator[Product]:
+    """Produktene i snapshoten, lest fra mmap mens de konsumeres (ingen mellomliste)."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic, fmt, count, nstr, blob_len = _HEADER.unpack_from(mm, 0)
+        if magic != _MAGIC or fmt != _FORMAT:
+            raise ValueError(f"not a catalog snapshot: {path}")
+        rec_start = _HEADER.size
+        tab_start = rec_start + count * _RECORD.size
+        blob_start = tab_start + nstr * 4
+        if len(mm) != blob_start + blob_len:
+            raise ValueError(f"truncated catalog snapshot: {path}")
+        mv = memoryview(mm)
+        records = mv[rec_start:tab_start]
+        try:
+            # hele blobben dekodes én gang; hver streng er et slice av den
+            text = str(mv[blob_start:], "utf-8")
+            ends = array("I")
+            ends.frombytes(mv[tab_start:blob_start])
+            strings = [text[a:b] for a, b in zip(chain((0,), ends), ends)]
+            del text
+            tag_sets: Dict[int, tuple] = {}   # få unike tag-strenger; del tuplene
+
+            def tags(g: int) -> tuple:
+                t = tag_sets.get(g)
+                if t is None:
+                    t = tag_sets[g] = tuple(strings[g].split(_TAG_SEP)) if strings[g] else ()
+                return t
+
+            for price, score, i, t, m, u, c, g in _RECORD.iter_unpack(records):
+                yield Product(strings[i], strings[t], strings[m], strings[u],
+                              None if price != price else price, score, strings[c], tags(g))
+        finally:
+            records.release()
+            mv.release()
+
+def read_snapshot(path: str) -> List[Product]:
+    return list(iter_snapshot(path))
+
+def load_snapshot(path: str = SNAPSHOT_PATH, catalog=CATALOG) -> LoadReport:
+    t0 = time.perf_counter()
+    catalog.load(iter_snapshot(path))
+    metrics.RANKING.observe(time.perf_counter() - t0, "load")
+    return LoadReport(path, rows=len(catalog), loaded=len(catalog),
+                      seconds=time.perf_counter() - t0, source="snapshot")
+
+def boot_catalog(feed: str = FEED_PATH, snapshot: str = SNAPSHOT_PATH, catalog=CATALOG) -> Optional[LoadReport]:
+    """
+    Ved oppstart: bruk snapshot hvis den er nyere enn feeden, ellers parse
+    feeden (og skriv ny snapshot). Uten feed/snapshot beholdes PRODUCT_DB.
+    """
+    try:
+        snap_mtime = os.path.getmtime(snapshot) if snapshot else None
+    except OSError:
+        snap_mtime = None
+    feed_mtime = os.path.getmtime(feed) if feed and os.path.exists(feed) else None
+
+    if snap_mtime is not None and (feed_mtime is None or snap_mtime >= feed_mtime):
+        try:
+            return load_snapshot(snapshot, catalog)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"[WARN] catalog snapshot unusable ({e}); falling back to feed")
+    if feed_mtime is not None:
+        return load_feed(feed, catalog, snapshot)
+    return None
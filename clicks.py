@@ -0,0 +1,226 @@
+# clicks.py
+"""
+Klikk-telling på /r/{pid} som nesten ikke koster noe per request.
+
+- hit(pid): øker en teller i minnet (ingen IO, ingen lås — kalles fra event-loopen)
+- flush(): bytter ut tellerne og skriver dem som én linje i en append-only logg
+  (JSONL). Deretter leses alle nye linjer i loggen (også fra andre workere) og
+  foldes inn i et tidsdempet aggregat (halveringstid CLICK_HALF_LIFE_H).
+- apply(catalog): score = grunnscore + CLICK_WEIGHT * log1p(dempede klikk),
+  skrevet tilbake i én batch (catalog.set_scores)
+- Loggen komprimeres til én aggregat-linje når den blir stor. Append og
+  komprimering tar flock på <logg>.lock (leader.file_lock), så klikk en annen
+  worker skriver underveis ikke går tapt når loggen byttes ut
+- flush() gjør fil-IO og kan vente på låsen: ta ut tellerne med take() på
+  event-loopen og kjør flush(counts) i en tråd
+
+ENV:
+- CLICK_LOG           (default: data/clicks.log)
+- CLICK_FLUSH_SEC     (default: 30)
+- CLICK_HALF_LIFE_H   (default: 72)
+- CLICK_WEIGHT        (default: 0.5)
+- CLICK_LOG_MAX_MB    (default: 8)
+"""
+from __future__ import annotations
+from typing import Dict, Optional, Tuple
+import json
+import math
+import os
+import time
+
+import metrics
+from leader import file_lock
+
+LOG_PATH = os.getenv("CLICK_LOG", "data/clicks.log").strip()
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "").strip() or default)
+    except ValueError:
+        return default
+
+
+FLUSH_SEC = _env_float("CLICK_FLUSH_SEC", 30)
+HALF_LIFE_S = _env_float("CLICK_HALF_LIFE_H", 72) * 3600
+WEIGHT = _env_float("CLICK_WEIGHT", 0.5)
+LOG_MAX_BYTES = int(_env_float("CLICK_LOG_MAX_MB", 8) * 1e6)
+MIN_VALUE = 0.01   # under dette glemmes produktet (boost ~0)
+
+
+class ClickTracker:
+    def __init__(self, log_path: Optional[str] = LOG_PATH, half_life_s: float = HALF_LIFE_S,
+                 weight: float = WEIGHT, clock=time.time):
+        self.log_path = log_path
+        self.half_life_s = half_life_s
+        self.weight = weight
+        self.clock = clock
+        self._counts: Dict[str, int] = {}
+        self._agg: Dict[str, Tuple[float, float]] = {}    # pid -> (verdi, tidspunkt)
+        self._base: Dict[str, float] = {}                 # score før boost
+        self._applied: Dict[str, float] = {}              # score vi sist skrev
+        self._offset = 0
+        self._inode: Optional[int] = None
+        self.total_hits = 0
+        self.flushes = 0
+
+    # -------- varm sti --------
+    def hit(self, pid: str) -> None:
+        counts = self._counts
+        counts[pid] = counts.get(pid, 0) + 1
+
+    # -------- aggregat --------
+    def _decayed(self, value: float, since: float, now: float) -> float:
+        if now <= since:
+            return value
+        return value * math.exp(-math.log(2) * (now - since) / self.half_life_s)
+
+    def _add(self, pid: str, n: float, t: float) -> None:
+        old = self._agg.get(pid)
+        if old is None:
+            self._agg[pid] = (float(n), t)
+            return
+        value, since = old
+        if t >= since:
+            self._agg[pid] = (self._decayed(value, since, t) + n, t)
+        else:   # eldre linje (annen worker): demp bidraget i stedet
+            self._agg[pid] = (value + self._decayed(n, t, since), since)
+
+    def value(self, pid: str, now: Optional[float] = None) -> float:
+        old = self._agg.get(pid)
+        if old is None:
+            return 0.0
+        return self._decayed(old[0], old[1], self.clock() if now is None else now)
+
+    def _fold_line(self, line: str) -> None:
+        try:
+            rec = json.loads(line)
+            t = float(rec["t"])
+        except (ValueError, KeyError, TypeError):
+            return
+        if "agg" in rec:    # komprimert aggregat erstatter alt før det
+            self._agg = {pid: (float(v), t) for pid, v in rec["agg"].items()}
+            return
+        for pid, n in rec.get("c", {}).items():
+            self._add(pid, n, t)
+
+    def _read_new(self) -> None:
+        """Fold inn alt som er lagt til i loggen siden sist (alle workere)."""
+        if not self.log_path:
+            return
+        try:
+            st = os.stat(self.log_path)
+        except OSError:
+            return
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            # ny fil (komprimert/rotert): les fra start
+            self._inode, self._offset, self._agg = st.st_ino, 0, {}
+        if st.st_size == self._offset:
+            return
+        with open(self.log_path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1          # bare hele linjer
+        for line in data[:end].splitlines():
+            self._fold_line(line.decode("utf-8", "replace"))
+        self._offset += end
+
+    def load(self) -> None:
+        self._read_new()
+
+    @property
+    def lock_path(self) -> Optional[str]:
+        return self.log_path + ".lock" if self.log_path else None
+
+    def take(self) -> Dict[str, int]:
+        """Bytt ut tellerne (på event-loopen, samme tråd som hit())."""
+        counts, self._counts = self._counts, {}
+        return counts
+
+    def flush(self, counts: Optional[Dict[str, int]] = None) -> int:
+        """Skriv tellerne til loggen og oppdater aggregatet. Returnerer antall klikk."""
+        if counts is None:
+            counts = self.take()
+        n = sum(counts.values())
+        now = self.clock()
+        with file_lock(self.lock_path):
+            if counts:
+                self.total_hits += n
+                if self.log_path:
+                    line = json.dumps({"t": round(now, 3), "c": counts}, separators=(",", ":")) + "\n"
+                    try:
+                        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+                        with open(self.log_path, "a", encoding="utf-8") as f:
+                            f.write(line)
+                    except OSError as e:
+                        print(f"[WARN] click log write failed: {e}")
+                        for pid, c in counts.items():
+                            self._add(pid, c, now)
+                else:
+                    for pid, c in counts.items():
+                        self._add(pid, c, now)
+            self._read_new()
+            self._maybe_compact(now)
+        self.flushes += 1
+        return n
+
+    def _maybe_compact(self, now: float) -> None:
+        """Kall med låsen holdt og loggen lest til slutten (_read_new)."""
+        if not self.log_path or self._offset < LOG_MAX_BYTES:
+            return
+        agg = {pid: round(self.value(pid, now), 4) for pid in self._agg}
+        agg = {pid: v for pid, v in agg.items() if v >= MIN_VALUE}
+        tmp = f"{self.log_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"t": round(now, 3), "agg": agg}, separators=(",", ":")) + "\n")
+            os.replace(tmp, self.log_path)
+        except OSError as e:
+            print(f"[WARN] click log compaction failed: {e}")
+
+    # -------- tilbake til katalogen --------
+    def apply(self, catalog) -> int:
+        """Skriv grunnscore + klikk-boost tilbake i katalogen. Returnerer antall endret."""
+        now = self.clock()
+        scores: Dict[str, float] = {}
+        for pid in set(self._agg) | set(self._applied):
+            p = catalog.get(pid)
+            if p is None:
+                continue
+            base = self._base.get(pid)
+            if base is None or self._applied.get(pid) != p.score:
+                base = self._base[pid] = p.score
+            value = self.value(pid, now)
+            if value < MIN_VALUE:
+                self._agg.pop(pid, None)
+                self._applied.pop(pid, None)
+                self._base.pop(pid, None)
+                if p.score != base:
+                    scores[pid] = base
+                continue
+            new = round(base + self.weight * math.log1p(value), 4)
+            self._applied[pid] = new
+            if new != p.score:
+                scores[pid] = new
+        if not scores:
+            return 0
+        t0 = time.perf_counter()
+        n = catalog.set_scores(scores)
+        metrics.RANKING.observe(time.perf_counter() - t0, "rescore")
+        return n
+
+    def stats(self) -> dict:
+        return {
+            "pending": sum(self._counts.values()),
+            "total_hits": self.total_hits,
+            "flushes": self.flushes,
+            "tracked": len(self._agg),
+            "log_bytes": self._offset,
+        }
+
+
+TRACKER = ClickTracker()
+
+
+def hit(pid: str) -> None:
+    TRACKER.hit(pid)
@@ -0,0 +1,370 @@
+# columnar.py
+"""
+Kolonnebasert katalog (valgfri, krever numpy).
+
+Samme grensesnitt som products.Catalog, men lagrer pris og score i
+sammenhengende numpy-arrays og id/tittel/bilde/url/kategori som internerte
+strenger (tags som delte tupler).
+Product-objekter lages først når en rad faktisk returneres (top/get/filter).
+
+Aktiveres med ENV CATALOG_BACKEND=columnar.
+"""
+from __future__ import annotations
+from bisect import bisect_right
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+import sys
+import threading
+
+import numpy as np
+
+from products import Product, rank_key
+
+_NO_PRICE = 1e9   # samme fallback som _rank_key
+LAZY_PAGES = 8    # sider per versjon før full rekkefølge bygges (iter_ranked)
+
+
+class ColumnarCatalog:
+    def __init__(self, products: Iterable[Product] = (), capacity: int = 1024):
+        self._lock = threading.RLock()
+        self._listeners: List[Callable[[Optional[List[str]]], None]] = []
+        self._score_listeners: List[Callable[[Optional[List[str]]], None]] = []
+        self.version = 0
+        self._reset(max(capacity, 16))
+        self.load(products)
+
+    # -------- intern lagring --------
+    def _reset(self, capacity: int) -> None:
+        self._n = 0                                   # antall rader brukt (inkl. slettede)
+        self._ids: List[Optional[str]] = []
+        self._titles: List[str] = []
+        self._images: List[str] = []
+        self._urls: List[str] = []
+        self._categories: List[str] = []
+        self._tags: List[tuple] = []
+        self._row: Dict[str, int] = {}
+        self._price = np.full(capacity, np.nan, dtype=np.float64)
+        self._score = np.zeros(capacity, dtype=np.float64)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._top_cache: tuple = (-1, np.empty(0, dtype=np.int64))
+        self._order_cache: tuple = (-1, [])           # (versjon, full rekkefølge)
+        self._lazy_pages: tuple = (-1, 0)             # (versjon, sider hentet uten full rekkefølge)
+
+    def _grow(self, need: int) -> None:
+        cap = len(self._score)
+        if need <= cap:
+            return
+        while cap < need:
+            cap *= 2
+        for name, fill in (("_price", np.nan), ("_score", 0.0), ("_alive", False)):
+            old = getattr(self, name)
+            new = np.full(cap, fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _set_row(self, i: int, p: Product) -> None:
+        self._ids[i] = sys.intern(p.id)
+        self._titles[i] = sys.intern(p.title)
+        self._images[i] = sys.intern(p.image)
+        self._urls[i] = sys.intern(p.url)
+        self._categories[i] = sys.intern(p.category)
+        self._tags[i] = p.tags
+        self._price[i] = np.nan if p.price is None else p.price
+        self._score[i] = p.score
+        self._alive[i] = True
+
+    def _product(self, i: int) -> Product:
+        price = self._price[i]
+        return Product(
+            id=self._ids[i],
+            title=self._titles[i],
+            image=self._images[i],
+            url=self._urls[i],
+            price=None if np.isnan(price) else float(price),
+            score=float(self._score[i]),
+            category=self._categories[i],
+            tags=self._tags[i],
+        )
+
+    def _compact(self) -> None:
+        # fjern slettede rader når de utgjør over halvparten
+        keep = np.flatnonzero(self._alive[:self._n])
+        rows = [self._product(int(i)) for i in keep]
+        self._reset(max(len(rows) * 2, 16))
+        self._append_many(rows)
+
+    def _append_many(self, products: List[Product]) -> None:
+        start, count = self._n, len(products)
+        end = start + count
+        self._grow(end)
+        intern = sys.intern
+        ids = [intern(p.id) for p in products]
+        self._ids += ids
+        self._titles += [intern(p.title) for p in products]
+        self._images += [intern(p.image) for p in products]
+        self._urls += [intern(p.url) for p in products]
+        self._categories += [intern(p.category) for p in products]
+        self._tags += [p.tags for p in products]
+        self._price[start:end] = np.fromiter(
+            (np.nan if p.price is None else p.price for p in products),
+            dtype=np.float64, count=count)
+        self._score[start:end] = np.fromiter(
+            (p.score for p in products), dtype=np.float64, count=count)
+        self._alive[start:end] = True
+        self._row.update(zip(ids, range(start, end)))
+        self._n = end
+
+    # -------- samme API som products.Catalog --------
+    def add_listener(self, fn: Callable[[Optional[List[str]]], None]) -> None:
+        """fn(pids) etter upsert/remove, fn(None) etter load. Rene score-endringer varsles ikke."""
+        self._listeners.append(fn)
+
+    def add_score_listener(self, fn: Callable[[Optional[List[str]]], None]) -> None:
+        """fn(pids) etter set_scores, fn(None) etter rescore (alle scorer kan være endret)."""
+        self._score_listeners.append(fn)
+
+    def _changed(self, pids: Optional[List[str]], listeners=None) -> None:
+        for fn in self._listeners if listeners is None else listeners:
+            fn(pids)
+
+    def load(self, products: Iterable[Product], expect_version: Optional[int] = None) -> bool:
+        """
+        Erstatt hele katalogen; bygges ved siden av og byttes inn i én operasjon.
+        Med expect_version bare hvis katalogen ikke er endret siden; ellers False.
+        """
+        rows = list({p.id: p for p in products}.values())
+        fresh = ColumnarCatalog.__new__(ColumnarCatalog)
+        fresh._reset(max(len(rows), 16))
+        fresh._append_many(rows)
+        with self._lock:
+            if expect_version is not None and self.version != expect_version:
+                return False
+            self.__dict__.update(fresh.__dict__)
+            self.version += 1
+        self._changed(None)
+        return True
+
+    def upsert(self, p: Product) -> None:
+        with self._lock:
+            i = self._row.get(p.id)
+            if i is None:
+                self._append_many([p])
+            else:
+                self._set_row(i, p)
+            self.version += 1
+        self._changed([p.id])
+
+    def remove(self, pid: str) -> bool:
+        with self._lock:
+            i = self._row.pop(pid, None)
+            if i is None:
+                return False
+            self._alive[i] = False
+            self._ids[i] = None
+            self.version += 1
+            if len(self._row) * 2 < self._n:
+                self._compact()
+        self._changed([pid])
+        return True
+
+    # load() kan kjøre i en tråd og bytter alle kolonnene; rad-nummer og kolonner leses under låsen
+    def get(self, pid: str) -> Optional[Product]:
+        with self._lock:
+            i = self._row.get(pid)
+            return None if i is None else self._product(i)
+
+    def top(self, limit: int = 10) -> List[Product]:
+        with self._lock:
+            return [self._product(int(i)) for i in self._top_rows(limit)]
+
+    def __len__(self) -> int:
+        return len(self._row)
+
+    def __contains__(self, pid: str) -> bool:
+        return pid in self._row
+
+    # -------- vektoriserte operasjoner --------
+    def _top_rows(self, limit: int) -> np.ndarray:
+        version, rows = self._top_cache
+        if version == self.version and len(rows) >= limit:
+            return rows[:limit]
+        n = self._n
+        alive = np.flatnonzero(self._alive[:n])
+        if limit <= 0 or len(alive) == 0:
+            return alive[:0]
+        scores = self._score[alive]
+        if limit < len(alive):
+            # kandidater: alle med score >= k-te beste (tar med likhet ved grensen)
+            kth = np.partition(-scores, limit - 1)[limit - 1]
+            cand = alive[-scores <= kth]
+        else:
+            cand = alive
+        # få kandidater igjen — endelig rekkefølge med samme nøkkel som Catalog
+        cand = sorted(
+            (int(i) for i in cand),
+            key=lambda i: (-self._score[i],
+                           _NO_PRICE if np.isnan(self._price[i]) else self._price[i],
+                           self._titles[i].lower(), self._ids[i]),
+        )[:limit]
+        rows = np.asarray(cand, dtype=np.int64)
+        self._top_cache = (self.version, rows)
+        return rows
+
+    def _row_key(self, i: int) -> tuple:
+        price = self._price[i]
+        return (-float(self._score[i]), _NO_PRICE if np.isnan(price) else float(price),
+                self._titles[i].lower(), self._ids[i])
+
+    def _rows_after(self, after: Optional[tuple], limit: int) -> List[int]:
+        """
+        De `limit` neste levende radene etter nøkkelen `after` (eksklusiv), i
+        ranking-rekkefølge. Bare kandidatene sorteres (partition + lexsort på dem),
+        ikke hele katalogen; kall under self._lock.
+        """
+        n = self._n
+        alive = self._alive[:n]
+        score = -self._score[:n]
+        price = np.nan_to_num(self._price[:n], nan=_NO_PRICE)
+        head: List[int] = []
+        if after is None:
+            rows = np.flatnonzero(alive)
+        else:
+            s0, p0 = after[0], after[1]
+            same = score == s0
+            rows = np.flatnonzero(alive & ((score > s0) | (same & (price > p0))))
+            # lik (score, pris) som cursoren: tittel/id avgjør, som i Catalog
+            tie = np.flatnonzero(alive & same & (price == p0))
+            if len(tie):
+                head = sorted((i for i in map(int, tie) if self._row_key(i) > after), key=self._row_key)
+        want = limit - len(head)
+        if want <= 0 or len(rows) == 0:
+            return head[:limit]
+        if want < len(rows):
+            # kandidater: alle med score <= den want-te beste (tar med likhet ved grensen)
+            kth = np.partition(score[rows], want - 1)[want - 1]
+            rows = rows[score[rows] <= kth]
+        perm = np.lexsort((price[rows], score[rows]))
+        rows = rows[perm]
+        rs, rp = score[rows], price[rows]
+        if want < len(rows):
+            # ta med hele gruppen med lik (score, pris) som siste rad vi trenger
+            cut = want
+            while cut < len(rows) and rs[cut] == rs[want - 1] and rp[cut] == rp[want - 1]:
+                cut += 1
+            rows, rs, rp = rows[:cut], rs[:cut], rp[:cut]
+        return head + self._break_ties(rows, rs, rp)[:want]
+
+    def _break_ties(self, rows: np.ndarray, rs: np.ndarray, rp: np.ndarray) -> List[int]:
+        """Rader sortert på (score, pris): løp med lik (score, pris) sorteres på tittel/id."""
+        order = rows.tolist()
+        tie = (rs[1:] == rs[:-1]) & (rp[1:] == rp[:-1])
+        if tie.any():
+            edges = np.flatnonzero(np.diff(np.concatenate(([0], tie.astype(np.int8), [0]))))
+            for a, b in zip(edges[::2], edges[1::2]):
+                order[a:b + 1] = sorted(order[a:b + 1], key=self._row_key)
+        return order
+
+    def _order(self, lazy_ok: bool) -> Optional[List[int]]:
+        """
+        Full ranking-rekkefølge for gjeldende versjon, eller None når en side heller
+        bør hentes med _rows_after. Den fulle sorteringen bygges først når den lønner
+        seg: ved full gjennomgang, eller etter LAZY_PAGES sider på samme versjon.
+        Kall under self._lock.
+        """
+        version, order = self._order_cache
+        if version == self.version:
+            return order
+        if lazy_ok:
+            version, pages = self._lazy_pages
+            pages = pages + 1 if version == self.version else 1
+            self._lazy_pages = (self.version, pages)
+            if pages <= LAZY_PAGES:
+                return None
+        order = self._rows_after(None, self._n)
+        self._order_cache = (self.version, order)
+        return order
+
+    def iter_ranked(self, after: Optional[tuple] = None, chunk: int = 256) -> Iterator[Product]:
+        """
+        Samme kontrakt som Catalog.iter_ranked; fortsetter fra siste nøkkel per bit.
+        Første bit etter en endring hentes uten å sortere hele katalogen (O(n));
+        går gjennomgangen videre, brukes (og bygges) den fulle rekkefølgen.
+        """
+        last = after
+        lazy_ok = True
+        while True:
+            with self._lock:
+                order = self._order(lazy_ok)
+                if order is None:
+                    rows = self._rows_after(last, chunk)
+                else:
+                    i = 0 if last is None else bisect_right(order, last, key=self._row_key)
+                    rows = order[i:i + chunk]
+                batch = [self._product(r) for r in rows]
+            if not batch:
+                return
+            yield from batch
+            last = rank_key(batch[-1])
+            lazy_ok = False
+
+    def iter_ranked_ids(self, chunk: int = 1024) -> Iterator[str]:
+        """Som Catalog.iter_ranked_ids; leser rekkefølgen for gjeldende versjon."""
+        with self._lock:
+            order, ids = self._order(False), self._ids   # _compact lager nye lister
+        for r in order:
+            pid = ids[r]
+            if pid is not None:
+                yield pid
+
+    def filter_price(self, lo: float = 0.0, hi: float = float("inf"),
+                     limit: Optional[int] = None) -> List[Product]:
+        """Produkter med lo <= pris <= hi, i rangert rekkefølge (tittel/id ved likhet, som Catalog)."""
+        with self._lock:
+            n = self._n
+            price = self._price[:n]
+            mask = self._alive[:n] & (price >= lo) & (price <= hi)
+            rows = np.flatnonzero(mask)
+            rs, rp = -self._score[rows], price[rows]
+            perm = np.lexsort((rp, rs))
+            rows, rs, rp = rows[perm], rs[perm], rp[perm]
+            if limit is not None and limit < len(rows):
+                # ta med hele gruppen med lik (score, pris) ved grensen før tittel/id avgjør
+                cut = max(limit, 0)
+                while 0 < cut < len(rows) and rs[cut] == rs[cut - 1] and rp[cut] == rp[cut - 1]:
+                    cut += 1
+                rows, rs, rp = rows[:cut], rs[:cut], rp[:cut]
+            order = self._break_ties(rows, rs, rp)
+            if limit is not None:
+                order = order[:limit]
+            return [self._product(i) for i in order]
+
+    def rescore(self, fn: Callable[[np.ndarray, np.ndarray], np.ndarray]) -> None:
+        """
+        Beregn alle scorer på nytt i én batch.
+        fn(prices, scores) -> nye scores (prices har NaN der pris mangler).
+        """
+        with self._lock:
+            n = self._n
+            new = np.asarray(fn(self._price[:n], self._score[:n]), dtype=np.float64)
+            new = np.where(self._alive[:n], new, self._score[:n])
+            if np.array_equal(new, self._score[:n]):
+                return
+            self._score[:n] = new
+            self.version += 1
+        self._changed(None, self._score_listeners)
+
+    def set_scores(self, scores: Dict[str, float]) -> int:
+        """Oppdater score for mange id-er på én gang. Returnerer antall endrede."""
+        with self._lock:
+            pids = [pid for pid in scores if pid in self._row]
+            rows = np.fromiter((self._row[pid] for pid in pids), dtype=np.int64, count=len(pids))
+            vals = np.fromiter((scores[pid] for pid in pids), dtype=np.float64, count=len(pids))
+            diff = self._score[rows] != vals   # som Catalog: uendrede scorer gir ingen ny versjon
+            if diff.any():
+                self._score[rows[diff]] = vals[diff]
+                self.version += 1
+                pids = [pid for pid, d in zip(pids, diff.tolist()) if d]
+            else:
+                pids = []
+        if pids:
+            self._changed(pids, self._score_listeners)
+        return len(pids)
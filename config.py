@@ -0,0 +1,72 @@
+# config.py
+"""
+Innstillinger for appen, lest fra ENV én gang (get_settings() husker resultatet).
+
+Delsystemene (http_pool, sources, imgproxy, clicks, ...) leser fortsatt sine egne
+variabler ved import, se ENV-listene der. Variablene her er dokumentert i main.py.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Optional
+import os
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    val = os.getenv(name, "").strip().lower()
+    if val in ("1", "true", "yes", "y", "on"):
+        return True
+    if val in ("0", "false", "no", "n", "off"):
+        return False
+    return default
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "").strip() or default)
+    except Exception:
+        return default
+
+
+@dataclass(frozen=True)
+class Settings:
+    service_name: str
+    discord_webhook: str
+    heartbeat_minutes: int
+    topseller_enable: bool
+    topseller_interval_min: int
+    topseller_share_sec: int
+    ideas_enable: bool
+    gh_token: str
+    gh_owner: str
+    gh_repo: str
+    gh_branch: str
+
+    @property
+    def github_configured(self) -> bool:
+        return bool(self.gh_token and self.gh_owner and self.gh_repo)
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            service_name=os.getenv("SERVICE_NAME", "purebloomworld-agent").strip(),
+            discord_webhook=os.getenv("DISCORD_WEBHOOK", "").strip(),
+            heartbeat_minutes=env_int("HEARTBEAT_MINUTES", 60),
+            topseller_enable=env_bool("TOPSELLER_ENABLE", False),
+            topseller_interval_min=env_int("TOPSELLER_INTERVAL_MIN", 60),
+            topseller_share_sec=env_int("TOPSELLER_SHARE_SEC", 30),
+            ideas_enable=env_bool("IDEAS_ENABLE", True),
+            gh_token=os.getenv("GH_TOKEN", "").strip(),
+            gh_owner=os.getenv("GH_OWNER", "").strip(),
+            gh_repo=os.getenv("GH_REPO", "").strip(),
+            gh_branch=os.getenv("GH_BRANCH", "main").strip(),
+        )
+
+
+_settings: Optional[Settings] = None
+
+
+def get_settings() -> Settings:
+    global _settings
+    if _settings is None:
+        _settings = Settings.from_env()
+    return _settings
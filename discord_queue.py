@@ -0,0 +1,254 @@
+# discord_queue.py
+"""
+Bakgrunns-dispatcher for Discord-webhook.
+
+- enqueue() legger meldingen i kø og returnerer med en gang (ingen nettverks-venting)
+- Begrenset kø: er den full, droppes nye meldinger (telles i stats)
+- Like meldinger slås sammen mens de venter ("(×3)"); advarsler ("⚠️ ...", eller
+  enqueue(..., collapse=True)) droppes i tillegg om de nettopp er sendt (innen dedup_window sek)
+- Små meldinger som kommer tett slås sammen til én post (maks 2000 tegn)
+- Følger Discords rate-limit-headere og retry_after ved 429
+- Svar som ikke er 2xx (etter retry av 429/5xx) telles som failed
+"""
+from __future__ import annotations
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Set, Tuple
+import asyncio
+import hashlib
+import time
+
+import http_pool
+
+DISCORD_LIMIT = 2000
+SEPARATOR = "\n\n"
+WARN_PREFIXES = ("⚠️", "⚠")
+
+
+@dataclass
+class _Pending:
+    text: str
+    count: int = 1
+    collapse: bool = False
+
+
+def _key(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _label(p: _Pending) -> str:
+    return p.text if p.count == 1 else f"{p.text} (×{p.count})"
+
+
+def split_long(text: str, limit: int = DISCORD_LIMIT) -> List[str]:
+    """Del en for lang melding på linjeskift (eller hardt om nødvendig)."""
+    out: List[str] = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        out.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text:
+        out.append(text)
+    return out
+
+
+def pack(messages: List[str], limit: int = DISCORD_LIMIT) -> List[str]:
+    """Slå sammen meldinger til så få poster som mulig, hver <= limit tegn."""
+    return [post for post, _ in _pack(messages, limit)]
+
+
+def _pack(messages: List[str], limit: int = DISCORD_LIMIT) -> List[Tuple[str, Set[int]]]:
+    """Som pack, men med indeksene til meldingene hver post inneholder (deler av)."""
+    posts: List[Tuple[str, Set[int]]] = []
+    cur, owners = "", set()
+    for i, msg in enumerate(messages):
+        for part in split_long(msg, limit):
+            if not cur:
+                cur = part
+            elif len(cur) + len(SEPARATOR) + len(part) <= limit:
+                cur = cur + SEPARATOR + part
+            else:
+                posts.append((cur, owners))
+                cur, owners = part, set()
+            owners.add(i)
+    if cur:
+        posts.append((cur, owners))
+    return posts
+
+
+class DiscordDispatcher:
+    def __init__(self, webhook: str, maxsize: int = 200, batch_window: float = 0.5,
+                 dedup_window: float = 300.0, max_retries: int = 5):
+        self.webhook = webhook
+        self.maxsize = maxsize
+        self.batch_window = batch_window
+        self.dedup_window = dedup_window
+        self.max_retries = max_retries
+
+        self._pending: "OrderedDict[str, _Pending]" = OrderedDict()
+        self._recent: Dict[str, float] = {}       # nøkkel -> tidspunkt sendt
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._blocked_until = 0.0                 # monotonic; rate-limit-pause
+        self._busy = False                        # en batch er under sending
+
+        self.sent = 0
+        self.posts = 0
+        self.dropped = 0
+        self.deduped = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self._latencies: Deque[float] = deque(maxlen=200)
+
+    # -------- API for kallere --------
+    def enqueue(self, message: str, collapse: Optional[bool] = None) -> bool:
+        """Legg melding i kø. Returnerer False hvis den ble droppet.
+
+        collapse=True: dropp meldingen om den er sendt innen dedup_window
+        (default: bare advarsler, dvs. meldinger som starter med ⚠️).
+        """
+        if not self.webhook or not message:
+            return False
+        if collapse is None:
+            collapse = message.startswith(WARN_PREFIXES)
+        k = _key(message)
+        pending = self._pending.get(k)
+        if pending is not None:
+            pending.count += 1
+            pending.collapse = pending.collapse or collapse
+            self.deduped += 1
+            return True
+        sent_at = self._recent.get(k) if collapse else None
+        if sent_at is not None and time.monotonic() - sent_at < self.dedup_window:
+            self.deduped += 1
+            return True
+        if len(self._pending) >= self.maxsize:
+            self.dropped += 1
+            return False
+        self._pending[k] = _Pending(message, collapse=collapse)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    def stats(self) -> dict:
+        lat = sorted(self._latencies)
+        return {
+            "queue_depth": len(self._pending),
+            "sent": self.sent,
+            "posts": self.posts,
+            "dropped": self.dropped,
+            "deduped": self.deduped,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+            "latency_ms_avg": round(sum(lat) / len(lat) * 1000, 1) if lat else None,
+            "latency_ms_p95": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))] * 1000, 1) if lat else None,
+        }
+
+    # -------- livssyklus --------
+    def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        if self._pending:
+            self._wakeup.set()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Prøv å tømme køen innen timeout, stopp deretter workeren."""
+        if self._task is None:
+            return
+        deadline = time.monotonic() + timeout
+        while (self._pending or self._busy) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        self._task.cancel()
+        # en avbrutt POST kan svelge CancelledError i httpx; ikke heng på den
+        await asyncio.wait([self._task], timeout=1.0)
+        self._task = None
+
+    # -------- worker --------
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            await self._wakeup.wait()
+            # samle opp et lite vindu med meldinger før vi sender
+            await asyncio.sleep(self.batch_window)
+            self._wakeup.clear()
+            batch = list(self._pending.items())
+            self._pending.clear()
+            if not batch:
+                continue
+            now = time.monotonic()
+            for k, p in batch:
+                if p.collapse:
+                    self._recent[k] = now
+            self._prune_recent(now)
+            lost: Set[int] = set()
+            self._busy = True
+            try:
+                for post, owners in _pack([_label(p) for _, p in batch]):
+                    if not await self._post(post):
+                        lost |= owners
+            finally:
+                self._busy = False
+            # bare meldinger der alle postene kom fram telles som sendt (resten står i failed)
+            self.sent += sum(p.count for i, (_, p) in enumerate(batch) if i not in lost)
+
+    def _prune_recent(self, now: float) -> None:
+        if len(self._recent) > 4 * self.maxsize:
+            cutoff = now - self.dedup_window
+            self._recent = {k: t for k, t in self._recent.items() if t >= cutoff}
+
+    async def _post(self, content: str) -> bool:
+        delay = 1.0
+        for _ in range(self.max_retries):
+            wait = self._blocked_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            t0 = time.perf_counter()
+            try:
+                r = await http_pool.request("POST", self.webhook, json={"content": content})
+            except Exception:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+            self._latencies.append(time.perf_counter() - t0)
+            self._note_rate_limit(r)
+            if r.status_code == 429:
+                self.rate_limited += 1
+                self._blocked_until = time.monotonic() + _retry_after(r)
+                continue
+            if r.status_code >= 500:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+            if 200 <= r.status_code < 300:
+                self.posts += 1
+                return True
+            self.failed += 1
+            print(f"[WARN] Discord webhook returned {r.status_code}")
+            return False
+        self.failed += 1
+        return False
+
+    def _note_rate_limit(self, r) -> None:
+        remaining = r.headers.get("x-ratelimit-remaining")
+        reset_after = r.headers.get("x-ratelimit-reset-after")
+        if remaining == "0" and reset_after:
+            try:
+                self._blocked_until = max(self._blocked_until,
+                                          time.monotonic() + float(reset_after))
+            except ValueError:
+                pass
+
+
+def _retry_after(r) -> float:
+    try:
+        return max(float(r.json().get("retry_after", 0)), 0.0) or 1.0
+    except Exception:
+        pass
+    try:
+        return max(float(r.headers.get("retry-after", 1)), 0.0)
+    except ValueError:
+        return 1.0
@@ -1,47 +1,218 @@
 # gh_push.py
-import os, base64, httpx, time
+"""
+GitHub-commits for agenten.
+
+- commit_file(): enkel sync upsert via contents-API (hopper over uendret innhold)
+- CommitPipeline: async, flere filer i én commit via Git Data API
+  (trees/commits/refs), med lokal blob-sha-cache så uendrede filer koster
+  null API-kall, og begrensede retries ved ref-konflikt.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import os, base64, time, hashlib, json, asyncio
+import http_pool
 
 GH_TOKEN = os.getenv("GH_TOKEN") or os.getenv("GITHUB_TOKEN") or os.getenv("GH_PAT")
 GH_OWNER = os.getenv("GH_OWNER", "").strip()
 GH_REPO  = os.getenv("GH_REPO", "").strip()
 GH_BRANCH= os.getenv("GH_BRANCH", "main").strip()
 
-API = "https://api.github.com"
+# Kan pekes mot en lokal fake (se standin.FakeGitHub)
+API = os.getenv("GH_API", "https://api.github.com").strip().rstrip("/")
+
+# Lokal cache av remote blob-sha per fil (overlever restart)
+BLOB_CACHE_PATH = os.getenv("GH_BLOB_CACHE", "data/.gh_blob_cache.json")
 
-def _gh_headers():
-    if not GH_TOKEN:
+def _gh_headers(token: Optional[str] = None):
+    token = token or GH_TOKEN
+    if not token:
         raise RuntimeError("Missing GH token (GH_TOKEN/GITHUB_TOKEN/GH_PAT).")
     return {
-        "Authorization": f"token {GH_TOKEN}",
+        "Authorization": f"token {token}",
         "Accept": "application/vnd.github+json",
         "X-GitHub-Api-Version": "2022-11-28",
         "User-Agent": "pbw-agent"
     }
 
+def git_blob_sha(data: bytes) -> str:
+    """Samme sha som git/GitHub gir en blob med dette innholdet."""
+    h = hashlib.sha1(b"blob %d\0" % len(data))
+    h.update(data)
+    return h.hexdigest()
+
+# sist kjente blob-sha per path for commit_file()
+_contents_sha: Dict[str, str] = {}
+
 def commit_file(path: str, content: str, message: str):
     """
-    Upsert en enkel tekstfil til repoet.
+    Upsert en enkel tekstfil til repoet. True når filen ligger på branchen med dette
+    innholdet; er det allerede identisk, hoppes PUT over (som CommitResult.ok uten commit).
     """
     if not (GH_OWNER and GH_REPO and GH_BRANCH):
         raise RuntimeError("GH_OWNER/GH_REPO/GH_BRANCH must be set.")
 
+    raw = content.encode("utf-8")
+    local_sha = git_blob_sha(raw)
+    if _contents_sha.get(path) == local_sha:
+        return True
+
     url = f"{API}/repos/{GH_OWNER}/{GH_REPO}/contents/{path}"
-    with httpx.Client(timeout=30) as cx:
-        # Finn eksisterende sha (om fil finnes)
-        r = cx.get(url, params={"ref": GH_BRANCH}, headers=_gh_headers())
-        sha = r.json().get("sha") if r.status_code == 200 else None
-
-        data = {
-            "message": message,
-            "content": base64.b64encode(content.encode("utf-8")).decode("ascii"),
-            "branch": GH_BRANCH
-        }
-        if sha: data["sha"] = sha
-
-        r2 = cx.put(url, json=data, headers=_gh_headers())
-        if r2.status_code not in (200,201):
-            raise RuntimeError(f"GitHub push failed: {r2.status_code} {r2.text}")
+    # Finn eksisterende sha (om fil finnes)
+    r = http_pool.request_sync("GET", url, params={"ref": GH_BRANCH}, headers=_gh_headers())
+    sha = r.json().get("sha") if r.status_code == 200 else None
+    if sha == local_sha:
+        _contents_sha[path] = sha
+        return True
+
+    data = {
+        "message": message,
+        "content": base64.b64encode(raw).decode("ascii"),
+        "branch": GH_BRANCH
+    }
+    if sha: data["sha"] = sha
+
+    r2 = http_pool.request_sync("PUT", url, json=data, headers=_gh_headers())
+    if r2.status_code not in (200,201):
+        raise RuntimeError(f"GitHub push failed: {r2.status_code} {r2.text}")
+    _contents_sha[path] = local_sha
     return True
 
+# -------- Git Data API pipeline --------
+class RefConflict(Exception):
+    """Branchen flyttet seg mellom lesing og oppdatering av ref."""
+
+@dataclass
+class CommitResult:
+    ok: bool
+    commit: Optional[str] = None          # ny commit-sha (None hvis ingenting endret)
+    changed: List[str] = field(default_factory=list)
+    api_calls: int = 0
+    error: Optional[str] = None
+
+class CommitPipeline:
+    def __init__(self, owner: str, repo: str, branch: str = "main", token: Optional[str] = None,
+                 api: str = API, cache_path: Optional[str] = BLOB_CACHE_PATH, max_retries: int = 3):
+        self.owner, self.repo, self.branch = owner, repo, branch
+        self.token = token
+        self.api = api.rstrip("/")
+        self.cache_path = cache_path
+        self.max_retries = max_retries
+        self._lock = asyncio.Lock()
+        self._remote: Dict[str, str] = self._load_cache()   # path -> blob-sha på branchen
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.token and self.owner and self.repo and self.branch)
+
+    # -------- cache --------
+    def _load_cache(self) -> Dict[str, str]:
+        if not self.cache_path:
+            return {}
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("repo") == f"{self.owner}/{self.repo}@{self.branch}":
+                return dict(data.get("blobs", {}))
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _save_cache(self) -> None:
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            tmp = self.cache_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"repo": f"{self.owner}/{self.repo}@{self.branch}", "blobs": self._remote}, f)
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            print(f"[WARN] gh blob cache write failed: {e}")
+
+    # -------- API --------
+    async def _call(self, res: CommitResult, method: str, path: str, **kw):
+        res.api_calls += 1
+        url = f"{self.api}/repos/{self.owner}/{self.repo}{path}"
+        return await http_pool.request(method, url, headers=_gh_headers(self.token), **kw)
+
+    async def _json(self, res: CommitResult, method: str, path: str, ok=(200, 201), **kw) -> dict:
+        r = await self._call(res, method, path, **kw)
+        if r.status_code in (409, 422) and method == "PATCH":
+            raise RefConflict(r.text)
+        if r.status_code not in ok:
+            raise RuntimeError(f"GitHub {method} {path}: {r.status_code} {r.text[:200]}")
+        return r.json()
+
+    async def _remote_blobs(self, res: CommitResult, tree_sha: str, paths: List[str]) -> None:
+        """Fyll cachen for paths vi ikke kjenner fra treet på branchen."""
+        tree = await self._json(res, "GET", f"/git/trees/{tree_sha}", params={"recursive": "1"})
+        wanted = set(paths)
+        for entry in tree.get("tree", []):
+            if entry.get("type") == "blob" and entry.get("path") in wanted:
+                self._remote[entry["path"]] = entry["sha"]
+        for p in wanted:
+            self._remote.setdefault(p, "")   # finnes ikke remote
+
+    async def commit(self, files: Dict[str, str], message: str) -> CommitResult:
+        """
+        Commit alle endrede filer i én commit. Uendrede filer (ifølge
+        lokal hash mot cachet remote-sha) gir null API-kall.
+        """
+        res = CommitResult(ok=True)
+        if not self.configured:
+            return CommitResult(ok=False, error="GitHub not configured")
+        blobs = {path: content.encode("utf-8") for path, content in files.items()}
+        local = {path: git_blob_sha(data) for path, data in blobs.items()}
+
+        async with self._lock:
+            if all(self._remote.get(p) == s for p, s in local.items()):
+                return res
+            delay = 0.5
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return await self._attempt(res, blobs, local, message,
+                                               refresh=attempt > 0)
+                except RefConflict as e:
+                    res.error = f"ref conflict: {e}"[:200]
+                    await asyncio.sleep(delay)
+                    delay *= 2
+                except Exception as e:
+                    res.ok, res.error = False, str(e)
+                    return res
+            res.ok = False
+            return res
+
+    async def _attempt(self, res: CommitResult, blobs: Dict[str, bytes], local: Dict[str, str],
+                       message: str, refresh: bool) -> CommitResult:
+        ref = await self._json(res, "GET", f"/git/ref/heads/{self.branch}")
+        head = ref["object"]["sha"]
+        head_commit = await self._json(res, "GET", f"/git/commits/{head}")
+        base_tree = head_commit["tree"]["sha"]
+
+        unknown = [p for p in local if refresh or p not in self._remote]
+        if unknown:
+            await self._remote_blobs(res, base_tree, unknown)
+        changed = [p for p, s in local.items() if self._remote.get(p) != s]
+        if not changed:
+            self._save_cache()
+            res.changed, res.error = [], None
+            return res
+
+        entries = [{"path": p, "mode": "100644", "type": "blob",
+                    "content": blobs[p].decode("utf-8")} for p in changed]
+        tree = await self._json(res, "POST", "/git/trees",
+                                json={"base_tree": base_tree, "tree": entries})
+        commit = await self._json(res, "POST", "/git/commits",
+                                  json={"message": message, "tree": tree["sha"], "parents": [head]})
+        await self._json(res, "PATCH", f"/git/refs/heads/{self.branch}",
+                         json={"sha": commit["sha"], "force": False})
+
+        for p in changed:
+            self._remote[p] = local[p]
+        self._save_cache()
+        res.commit, res.changed, res.error = commit["sha"], changed, None
+        return res
+
 def timestamp():
-    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
\ No newline at end of file
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
@@ -0,0 +1,185 @@
+# http_pool.py
+"""
+Felles HTTP-klienter for alle utgående kall (Discord, GitHub, ...).
+
+- Én AsyncClient + én sync Client per prosess, med keep-alive og connection-pool
+- Lages ved første utgående kall og lukkes ved shutdown; httpx importeres
+  først da (en god del av importtiden ved kald start)
+- Timeout per destinasjon (vertsnavn)
+- Latens og status per vert telles i metrics (pbw_outbound_*)
+
+ENV:
+- HTTP_MAX_CONNECTIONS   (default: 20)
+- HTTP_MAX_KEEPALIVE     (default: 10)
+- HTTP_KEEPALIVE_EXPIRY  (default: 60 sek)
+- HTTP_HTTP2             (default: false; krever pakken h2)
+- HTTP_TIMEOUT           (default: 20 sek)
+- HTTP_TIMEOUTS          (f.eks. "discord.com=15,api.github.com=30")
+"""
+from __future__ import annotations
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+import os
+import threading
+import time
+
+import metrics
+
+if TYPE_CHECKING:
+    import httpx
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "").strip() or default)
+    except Exception:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "").strip() or default)
+    except Exception:
+        return default
+
+
+def _parse_timeouts(raw: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for part in raw.split(","):
+        host, _, secs = part.partition("=")
+        try:
+            out[host.strip().lower()] = float(secs)
+        except ValueError:
+            continue
+    return out
+
+
+MAX_CONNECTIONS = _env_int("HTTP_MAX_CONNECTIONS", 20)
+MAX_KEEPALIVE = _env_int("HTTP_MAX_KEEPALIVE", 10)
+KEEPALIVE_EXPIRY = _env_float("HTTP_KEEPALIVE_EXPIRY", 60.0)
+DEFAULT_TIMEOUT = _env_float("HTTP_TIMEOUT", 20.0)
+HTTP2 = os.getenv("HTTP_HTTP2", "").strip().lower() in ("1", "true", "yes", "y", "on")
+
+# Standard timeouts per vert; kan overstyres med HTTP_TIMEOUTS
+HOST_TIMEOUTS: Dict[str, float] = {
+    "discord.com": 15.0,
+    "api.github.com": 30.0,
+}
+HOST_TIMEOUTS.update(_parse_timeouts(os.getenv("HTTP_TIMEOUTS", "")))
+
+USER_AGENT = "PureBloomWorld-Agent"
+
+_async_client: Optional[httpx.AsyncClient] = None
+_sync_client: Optional[httpx.Client] = None
+_sync_lock = threading.Lock()
+
+
+def _http2_enabled() -> bool:
+    if not HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        print("[WARN] HTTP_HTTP2=true men pakken 'h2' mangler; bruker HTTP/1.1")
+        return False
+    return True
+
+
+def _client_kwargs() -> dict:
+    import httpx
+    return dict(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        timeout=DEFAULT_TIMEOUT,
+        http2=_http2_enabled(),
+        headers={"User-Agent": USER_AGENT},
+    )
+
+
+def timeout_for(url: str) -> httpx.Timeout:
+    """Timeout for URL-ens vert (eller nærmeste overordnede domene)."""
+    import httpx
+    host = (urlsplit(url).hostname or "").lower()
+    while host:
+        if host in HOST_TIMEOUTS:
+            return httpx.Timeout(HOST_TIMEOUTS[host])
+        _, _, host = host.partition(".")
+    return httpx.Timeout(DEFAULT_TIMEOUT)
+
+
+def async_client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        import httpx
+        _async_client = httpx.AsyncClient(**_client_kwargs())
+    return _async_client
+
+
+def sync_client() -> httpx.Client:
+    global _sync_client
+    with _sync_lock:
+        if _sync_client is None or _sync_client.is_closed:
+            import httpx
+            _sync_client = httpx.Client(**_client_kwargs())
+        return _sync_client
+
+
+def _observe(url: str, status: str, t0: float) -> None:
+    host = (urlsplit(url).hostname or "").lower()
+    metrics.OUTBOUND_LATENCY.observe(time.perf_counter() - t0, host)
+    metrics.OUTBOUND_REQUESTS.inc(host, status)
+
+
+async def request(method: str, url: str, **kwargs) -> httpx.Response:
+    """Async kall via felles pool, med destinasjons-timeout om ikke annet er gitt."""
+    kwargs.setdefault("timeout", timeout_for(url))
+    t0, status = time.perf_counter(), "error"
+    try:
+        resp = await async_client().request(method, url, **kwargs)
+        status = str(resp.status_code)
+        return resp
+    finally:
+        _observe(url, status, t0)
+
+
+@asynccontextmanager
+async def stream(method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+    """Som request, men kroppen leses av kalleren (aiter_bytes), f.eks. med en størrelsesgrense."""
+    kwargs.setdefault("timeout", timeout_for(url))
+    t0, status = time.perf_counter(), "error"
+    try:
+        async with async_client().stream(method, url, **kwargs) as resp:
+            status = str(resp.status_code)
+            yield resp
+    finally:
+        _observe(url, status, t0)
+
+
+def request_sync(method: str, url: str, **kwargs) -> httpx.Response:
+    kwargs.setdefault("timeout", timeout_for(url))
+    t0, status = time.perf_counter(), "error"
+    try:
+        resp = sync_client().request(method, url, **kwargs)
+        status = str(resp.status_code)
+        return resp
+    finally:
+        _observe(url, status, t0)
+
+
+async def startup() -> None:
+    async_client()
+
+
+async def shutdown() -> None:
+    global _async_client, _sync_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    with _sync_lock:
+        if _sync_client is not None:
+            _sync_client.close()
+            _sync_client = None
@@ -2,16 +2,22 @@
 """
 Daglig idé-dropper til Discord.
 - Kjører 08:00 Europe/Oslo
-- Sender 3 produktideer + 3 artikkelideer
+- Sender 3 produktideer + 3 artikkelideer, vektet trukket av ideas.IdeaEngine
+  (ingen gjentakelser innen IDEAS_NO_REPEAT_DAYS; korpus fra IDEAS_CORPUS)
 - Manuell trigger håndteres i main.py (/trigger/ideas)
+- Planlegges via scheduler.Scheduler (se register_daily_ideas)
+- Motoren (korpus + historikk fra disk) lastes ved første bruk, ikke ved import
 """
 
-import asyncio
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timezone
+from typing import List, Optional
 from zoneinfo import ZoneInfo
-import random
+
+from ideas import Drop, IdeaEngine, builtin_rows, load_engine
+from scheduler import daily
 
 OSLO = ZoneInfo("Europe/Oslo")
+IDEAS_RULE = daily(8, 0, OSLO)
 
 PRODUCT_TOPICS = [
     ("Health", "Magnesium glycinate sleep stack"),
@@ -32,42 +38,58 @@ ARTICLE_TOPICS = [
     ("Eco", "How to cut plastic without pain"),
 ]
 
-def compose_idea_message() -> str:
-    picks_p = random.sample(PRODUCT_TOPICS, k=3)
-    picks_a = random.sample(ARTICLE_TOPICS, k=3)
+_engine: Optional[IdeaEngine] = None
+
+def engine() -> IdeaEngine:
+    global _engine
+    if _engine is None:
+        _engine = load_engine(builtin_rows(PRODUCT_TOPICS, ARTICLE_TOPICS))
+    return _engine
+
+def oslo_today() -> date:
+    return datetime.now(OSLO).date()
+
+def format_drop(drop: Drop) -> str:
     lines = ["💡 **Daily Ideas**",
              "### Products:"]
-    for cat, title in picks_p:
+    for cat, title in drop.products:
         lines.append(f"• **{title}**  _#{cat.lower()}_")
     lines.append("")
     lines.append("### Articles:")
-    for cat, title in picks_a:
+    for cat, title in drop.articles:
         lines.append(f"• **{title}**  _#{cat.lower()}_")
     lines.append("")
     lines.append("_(Affiliate links placeholder: add when approved)_")
     return "\n".join(lines)
 
+def compose_idea_message(day: Optional[date] = None) -> str:
+    """Trekk dagens drop, lagre historikken og formater meldingen."""
+    day = day or oslo_today()
+    eng = engine()
+    drop = eng.draw(day)
+    eng.save(day)
+    return format_drop(drop)
+
+def plan_week(start: Optional[date] = None, dry_run: bool = True) -> List[Drop]:
+    """En hel ukes drops i én batch (dry_run=False merker og lagrer historikken)."""
+    start = start or oslo_today()
+    eng = engine()
+    drops = eng.week(start, dry_run=dry_run)
+    if not dry_run:
+        eng.save(start)
+    return drops
+
 def seconds_until_next_8_oslo(now_utc: datetime | None = None) -> float:
     if not now_utc:
         now_utc = datetime.now(timezone.utc)
-    now_oslo = now_utc.astimezone(OSLO)
-    target = now_oslo.replace(hour=8, minute=0, second=0, microsecond=0)
-    if now_oslo >= target:
-        target = target + timedelta(days=1)
-    # tilbake til UTC
-    target_utc = target.astimezone(timezone.utc)
-    return (target_utc - now_utc).total_seconds()
+    now = now_utc.timestamp()
+    return IDEAS_RULE.next_after(now) - now
 
-async def daily_ideas_scheduler(post_func):
-    """post_func: async function(str) -> bool"""
-    # første vent til 08:00 Oslo
-    delay = seconds_until_next_8_oslo()
-    await asyncio.sleep(max(1, delay))
-    while True:
-        try:
-            msg = compose_idea_message()
-            await post_func(msg)
-        except Exception as e:
-            print(f"[WARN] daily ideas error: {e}")
-        # vent 24h
-        await asyncio.sleep(24 * 60 * 60)
\ No newline at end of file
+def register_daily_ideas(scheduler, post_func):
+    """
+    post_func: async function(str) -> bool
+    Catch-up: bommes 08:00 pga restart/deploy, postes det så snart vi er oppe igjen.
+    """
+    async def job():
+        await post_func(compose_idea_message())
+    return scheduler.add("daily_ideas", job, IDEAS_RULE, misfire="catchup", max_catchup=1)
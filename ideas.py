@@ -0,0 +1,305 @@
+# ideas.py
+"""
+Idé-motor for daglige drops (idea_jobs).
+
+- Korpus: innebygde lister, eller fil (ENV IDEAS_CORPUS) med tusenvis av temaer,
+  JSONL {"kind": "product"|"article", "category": ..., "title": ..., "weight": 1}
+  eller CSV med de samme kolonnene
+- Vektet trekning i O(1): alias-tabell over kategorier (IDEAS_CATEGORY_WEIGHTS,
+  f.eks. "Health=2,Tech=1") og én per kategori over temaene
+- Ingen gjentakelser innen IDEAS_NO_REPEAT_DAYS dager: historikk (tema -> dag)
+  lagres i IDEAS_HISTORY som JSON og beskjæres ved lagring
+- Seed (IDEAS_SEED eller seed=) gir reproduserbare trekninger
+- week(start) lager en hel ukes drops i én batch (uten gjentakelser innad)
+
+Temaer lagres som strenglister + array-baserte alias-tabeller, så minnebruken
+er noen få bytes per tema utover selve tittelen.
+"""
+from __future__ import annotations
+from array import array
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import csv
+import json
+import math
+import os
+import random
+
+CORPUS_PATH = os.getenv("IDEAS_CORPUS", "").strip()
+HISTORY_PATH = os.getenv("IDEAS_HISTORY", "data/ideas_history.json").strip()
+KINDS = ("product", "article")
+MAX_TRIES = 64   # forkastede trekninger (historikk) før vi faller tilbake til skann
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "").strip() or default)
+    except ValueError:
+        return default
+
+
+NO_REPEAT_DAYS = _env_int("IDEAS_NO_REPEAT_DAYS", 30)
+
+
+# -------- alias-tabell (Vose) --------
+class AliasTable:
+    """Trekker indeks i med sannsynlighet weights[i] / sum(weights) i O(1)."""
+
+    __slots__ = ("prob", "alias")
+
+    def __init__(self, weights: Sequence[float]):
+        n = len(weights)
+        if n == 0:
+            raise ValueError("alias table needs at least one weight")
+        total = float(sum(weights))
+        if total <= 0:
+            raise ValueError("weights must sum to > 0")
+        scaled = [w * n / total for w in weights]
+        self.prob = array("d", [0.0]) * n
+        self.alias = array("I", [0]) * n
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in large + small:   # rest pga avrunding
+            self.prob[i] = 1.0
+
+    def __len__(self) -> int:
+        return len(self.prob)
+
+    def sample(self, rnd: random.Random) -> int:
+        i = int(rnd.random() * len(self.prob))
+        return i if rnd.random() < self.prob[i] else self.alias[i]
+
+
+# -------- korpus --------
+@dataclass
+class _Category:
+    name: str
+    titles: List[str] = field(default_factory=list)
+    weights: List[float] = field(default_factory=list)
+    table: Optional[AliasTable] = None
+
+
+class Pool:
+    """Alle temaer av én type (produkt/artikkel), gruppert per kategori."""
+
+    def __init__(self, rows: Iterable[Tuple[str, str, float]], category_weights: Dict[str, float]):
+        by_name: Dict[str, _Category] = {}
+        seen = set()
+        for cat, title, weight in rows:
+            key = title.casefold()
+            if key in seen or weight <= 0:
+                continue
+            seen.add(key)
+            c = by_name.get(cat)
+            if c is None:
+                c = by_name[cat] = _Category(cat)
+            c.titles.append(title)
+            c.weights.append(weight)
+        self.categories: List[_Category] = [c for c in by_name.values() if c.titles]
+        for c in self.categories:
+            c.table = AliasTable(c.weights)
+            c.weights = []   # trengs ikke etter at tabellen er bygd
+        weights = [category_weights.get(c.name.casefold(), 1.0) for c in self.categories]
+        if weights and not any(w > 0 for w in weights):
+            print("[WARN] IDEAS_CATEGORY_WEIGHTS leaves every category at 0; using equal weights")
+            weights = [1.0] * len(weights)
+        self.cat_table = AliasTable(weights) if weights else None
+
+    def __len__(self) -> int:
+        return sum(len(c.titles) for c in self.categories)
+
+    def sample(self, rnd: random.Random) -> Tuple[str, str]:
+        c = self.categories[self.cat_table.sample(rnd)]
+        return c.name, c.titles[c.table.sample(rnd)]
+
+    def all(self) -> Iterator[Tuple[str, str]]:
+        for c in self.categories:
+            for t in c.titles:
+                yield c.name, t
+
+
+def parse_category_weights(raw: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for part in raw.split(","):
+        name, _, w = part.partition("=")
+        try:
+            value = float(w)
+        except ValueError:
+            continue
+        if math.isfinite(value) and value >= 0:   # negative/inf/nan gir ugyldig alias-tabell
+            out[name.strip().casefold()] = value
+    return out
+
+
+def read_corpus(path: str) -> Iterator[Tuple[str, str, str, float]]:
+    """(kind, category, title, weight) per gyldig rad; ugyldige rader hoppes over."""
+    bad = 0
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            rows: Iterable = csv.DictReader(f)
+        else:
+            rows = (line for line in f if line.strip())
+        for row in rows:
+            try:
+                if isinstance(row, str):
+                    row = json.loads(row)
+                kind = str(row.get("kind") or "").strip().lower()
+                title = str(row.get("title") or "").strip()
+                cat = str(row.get("category") or "General").strip()
+                weight = float(row.get("weight") or 1.0)
+                if kind not in KINDS or not title:
+                    raise ValueError(row)
+            except (ValueError, AttributeError, TypeError):
+                bad += 1
+                continue
+            yield kind, cat, title, weight
+    if bad:
+        print(f"[WARN] ideas corpus {path}: skipped {bad} invalid rows")
+
+
+# -------- historikk --------
+class History:
+    """tema (casefold) -> dagnummer (date.toordinal) sist brukt."""
+
+    def __init__(self, path: Optional[str] = HISTORY_PATH, days: int = NO_REPEAT_DAYS):
+        self.path = path
+        self.days = days
+        self.used: Dict[str, int] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.used = {str(k): int(v) for k, v in json.load(f).items()}
+        except (OSError, ValueError, AttributeError):
+            self.used = {}
+
+    def blocked(self, title: str, day: int) -> bool:
+        last = self.used.get(title.casefold())
+        return last is not None and day - last < self.days
+
+    def mark(self, title: str, day: int) -> None:
+        self.used[title.casefold()] = day
+
+    def prune(self, today: int) -> None:
+        self.used = {k: d for k, d in self.used.items() if today - d < self.days}
+
+    def save(self, today: Optional[int] = None) -> None:
+        self.prune(date.today().toordinal() if today is None else today)
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.used, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[WARN] ideas history write failed: {e}")
+
+
+# -------- motor --------
+@dataclass
+class Drop:
+    day: date
+    products: List[Tuple[str, str]]   # (kategori, tittel)
+    articles: List[Tuple[str, str]]
+
+
+class IdeaEngine:
+    def __init__(self, rows: Iterable[Tuple[str, str, str, float]],
+                 history: Optional[History] = None, seed: Optional[int] = None,
+                 category_weights: Optional[Dict[str, float]] = None):
+        rows = list(rows)
+        cw = category_weights or {}
+        self.pools: Dict[str, Pool] = {
+            kind: Pool(((c, t, w) for k, c, t, w in rows if k == kind), cw) for kind in KINDS
+        }
+        self.history = history if history is not None else History(path=None)
+        self.rnd = random.Random(seed)
+
+    def _pick(self, pool: Pool, k: int, day: int) -> List[Tuple[str, str]]:
+        picks: List[Tuple[str, str]] = []
+        taken = set()
+
+        def ok(title: str) -> bool:
+            return title.casefold() not in taken and not self.history.blocked(title, day)
+
+        tries = 0
+        while len(picks) < k and tries < MAX_TRIES and pool.cat_table is not None:
+            tries += 1
+            cat, title = pool.sample(self.rnd)
+            if ok(title):
+                picks.append((cat, title))
+                taken.add(title.casefold())
+        if len(picks) < k:
+            # nesten alt er brukt nylig: skann resten av poolen
+            rest = [(c, t) for c, t in pool.all() if t.casefold() not in taken]
+            free = [ct for ct in rest if not self.history.blocked(ct[1], day)]
+            need = k - len(picks)
+            if len(free) >= need:
+                picks += self.rnd.sample(free, need)
+            else:
+                # korpuset er for lite for vinduet: ta de som ble brukt for lengst siden
+                free_titles = {t for _, t in free}
+                rest = sorted((ct for ct in rest if ct[1] not in free_titles),
+                              key=lambda ct: self.history.used.get(ct[1].casefold(), 0))
+                picks += free + rest[:need - len(free)]
+        for _, title in picks:
+            self.history.mark(title, day)
+        return picks
+
+    def draw(self, day: Optional[date] = None, products: int = 3, articles: int = 3) -> Drop:
+        """Trekk én dags drop og merk temaene i historikken (lagres med save())."""
+        day = day or date.today()
+        n = day.toordinal()
+        return Drop(day, self._pick(self.pools["product"], products, n),
+                    self._pick(self.pools["article"], articles, n))
+
+    def week(self, start: Optional[date] = None, days: int = 7, dry_run: bool = False, **kw) -> List[Drop]:
+        """
+        Flere dagers drops i én batch. dry_run=True er en forhåndsvisning:
+        historikk og RNG-tilstand rulles tilbake etterpå.
+        """
+        start = start or date.today()
+        if dry_run:
+            used, state = dict(self.history.used), self.rnd.getstate()
+        try:
+            return [self.draw(start + timedelta(days=i), **kw) for i in range(days)]
+        finally:
+            if dry_run:
+                self.history.used = used
+                self.rnd.setstate(state)
+
+    def save(self, today: Optional[date] = None) -> None:
+        self.history.save((today or date.today()).toordinal())
+
+
+def builtin_rows(products: Sequence[Tuple[str, str]], articles: Sequence[Tuple[str, str]]):
+    for cat, title in products:
+        yield "product", cat, title, 1.0
+    for cat, title in articles:
+        yield "article", cat, title, 1.0
+
+
+def load_engine(fallback_rows: Iterable[Tuple[str, str, str, float]] = ()) -> IdeaEngine:
+    rows: Iterable = fallback_rows
+    if CORPUS_PATH:
+        try:
+            rows = list(read_corpus(CORPUS_PATH))
+        except (OSError, ValueError) as e:   # ValueError dekker også UnicodeDecodeError
+            print(f"[WARN] IDEAS_CORPUS unreadable ({e}); using built-in topics")
+            rows = fallback_rows
+    seed = os.getenv("IDEAS_SEED", "").strip()
+    return IdeaEngine(rows, History(),
+                      seed=int(seed) if seed.lstrip("-").isdigit() else None,
+                      category_weights=parse_category_weights(os.getenv("IDEAS_CATEGORY_WEIGHTS", "")))
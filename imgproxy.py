@@ -0,0 +1,330 @@
+# imgproxy.py
+"""
+Lokal bildeproxy for produktbilder: /img/{pid}/{size}.
+
+- Kildebildet (ofte 1500px fra Amazon) hentes én gang og lagres på disk
+- Varianter (størrelse x format) lages fra den lokale kopien: WebP når klienten
+  sender Accept: image/webp, ellers JPEG
+- Skalering krever Pillow (i requirements.txt); mangler den, serveres
+  originalen uendret, men fortsatt fra lokal cache. Pillow importeres ved
+  første skalering, ikke ved oppstart
+- Disk-cache med LRU under et størrelsesbudsjett (IMG_CACHE_MB); originaler og
+  varianter deler budsjettet. Fil-IO (og skalering) kjøres i tråd, ikke på event-loopen
+- Samtidige forespørsler etter samme bilde deler én henting/skalering
+  (sources.SingleFlight)
+- ETag avhenger bare av (kilde-URL, størrelse, format, kvalitet), så 304 kan
+  besvares uten disk-IO. URL-er fra thumb_url() har ?v=<hash av kilde-URL> og
+  caches som immutable i ett år
+
+ENV:
+- IMG_CACHE_DIR       (default: data/img; tom = bare minne, for tester)
+- IMG_CACHE_MB        (default: 256)
+- IMG_SIZES           (default: "64,128,256,512"; andre størrelser gir 404)
+- IMG_QUALITY         (default: 80)
+- IMG_MAX_SOURCE_MB   (default: 10)
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote
+import asyncio
+import hashlib
+import importlib.util
+import io
+import os
+import threading
+
+from fastapi import Request
+from fastapi.responses import Response
+
+import http_pool
+import metrics
+from respcache import etag_matches
+from sources import SingleFlight
+
+# valgfri: uten Pillow serveres originalen (sjekkes uten å importere pakken)
+HAVE_PILLOW = importlib.util.find_spec("PIL") is not None
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "").strip() or default)
+    except ValueError:
+        return default
+
+
+CACHE_DIR = os.getenv("IMG_CACHE_DIR", "data/img").strip()
+CACHE_BYTES = _env_int("IMG_CACHE_MB", 256) * 1024 * 1024
+SIZES = frozenset(int(s) for s in os.getenv("IMG_SIZES", "64,128,256,512").split(",") if s.strip().isdigit())
+QUALITY = _env_int("IMG_QUALITY", 80)
+MAX_SOURCE_BYTES = _env_int("IMG_MAX_SOURCE_MB", 10) * 1024 * 1024
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_CONTROL = "public, max-age=86400"
+
+IMAGES = metrics.counter("pbw_img_requests_total", "Image proxy responses by cache result", ("result",))
+
+
+class ImageError(Exception):
+    pass
+
+
+# -------- disk-LRU --------
+class DiskLRU:
+    """
+    Filer i én katalog, eldste (minst brukt) slettes når summen går over budsjettet.
+    Indeksen bygges fra katalogen ved første bruk (rekkefølge = mtime). Flere
+    workere kan dele katalogen; en fil en annen worker har slettet blir en bom.
+    get/put gjør blokkerende fil-IO og kalles fra tråd (asyncio.to_thread);
+    indeksen beskyttes av en lås, selve lesingen/skrivingen skjer utenfor den.
+    """
+
+    def __init__(self, path: Optional[str] = CACHE_DIR, budget: int = CACHE_BYTES):
+        self.path = path
+        self.budget = budget
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._mem: Dict[str, bytes] = {}   # uten katalog
+        self._scanned = False
+        self._lock = threading.Lock()
+        self.total = 0
+        self.evictions = 0
+
+    def _scan(self) -> None:
+        """Kall under self._lock."""
+        self._scanned = True
+        if not self.path:
+            return
+        try:
+            entries = [e for e in os.scandir(self.path) if e.is_file() and not e.name.endswith(".tmp")]
+        except OSError:
+            return
+        files = []
+        for e in entries:
+            try:
+                st = e.stat()
+            except OSError:   # slettet (LRU i en annen worker) mellom scandir og stat
+                continue
+            files.append((st.st_mtime, e.name, st.st_size))
+        for _, name, size in sorted(files):
+            self._index[name] = size
+            self.total += size
+        self._evict()
+
+    def get(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            if not self._scanned:
+                self._scan()
+            if name not in self._index:
+                return None
+        try:
+            if self.path:
+                with open(os.path.join(self.path, name), "rb") as f:
+                    data = f.read()
+            else:
+                data = self._mem[name]
+        except (OSError, KeyError):
+            with self._lock:
+                self.total -= self._index.pop(name, 0)
+            return None
+        with self._lock:
+            if name in self._index:
+                self._index.move_to_end(name)
+        return data
+
+    def put(self, name: str, data: bytes) -> None:
+        with self._lock:
+            if not self._scanned:
+                self._scan()
+        if self.path:
+            try:
+                os.makedirs(self.path, exist_ok=True)
+                tmp = os.path.join(self.path, f"{name}.{os.getpid()}.tmp")
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, os.path.join(self.path, name))
+            except OSError as e:
+                print(f"[WARN] image cache write failed: {e}")
+                return
+        else:
+            self._mem[name] = data
+        with self._lock:
+            self.total += len(data) - self._index.pop(name, 0)
+            self._index[name] = len(data)
+            self._evict()
+
+    def _evict(self) -> None:
+        """Kall under self._lock."""
+        while self.total > self.budget and len(self._index) > 1:
+            name, size = self._index.popitem(last=False)
+            self.total -= size
+            self.evictions += 1
+            if self.path:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+            else:
+                self._mem.pop(name, None)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+# -------- bilder --------
+_MAGIC = ((b"\x89PNG", "image/png"), (b"\xff\xd8", "image/jpeg"), (b"GIF8", "image/gif"))
+
+
+def sniff(data: bytes) -> str:
+    for magic, media_type in _MAGIC:
+        if data.startswith(magic):
+            return media_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def _resize(data: bytes, size: int, fmt: str) -> bytes:
+    """Skaler ned til maks size x size (beholder forholdet). Kjøres i tråd."""
+    from PIL import Image, ImageOps
+    with Image.open(io.BytesIO(data)) as im:
+        im.draft("RGB", (size, size))   # JPEG: dekod direkte i redusert oppløsning
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail((size, size), Image.LANCZOS)
+        alpha = im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info)
+        im = im.convert("RGBA" if alpha else "RGB")
+        out = io.BytesIO()
+        if fmt == "webp":
+            im.save(out, "WEBP", quality=QUALITY, method=4)
+        else:
+            if alpha:
+                bg = Image.new("RGB", im.size, (255, 255, 255))
+                bg.paste(im, mask=im.getchannel("A"))
+                im = bg
+            im.save(out, "JPEG", quality=QUALITY, optimize=True, progressive=True)
+        return out.getvalue()
+
+
+def _digest(*parts) -> str:
+    return hashlib.blake2b("\0".join(map(str, parts)).encode("utf-8"), digest_size=12).hexdigest()
+
+
+def version(url: str) -> str:
+    return _digest(url)[:10]
+
+
+def thumb_url(pid: str, image: str, size: int) -> str:
+    """Stabil URL for en variant; endres når produktets bilde-URL endres (id-en URL-encodes)."""
+    return f"/img/{quote(pid, safe='')}/{size}?v={version(image)}"
+
+
+def accepts_webp(request: Request) -> bool:
+    return "image/webp" in request.headers.get("accept", "")
+
+
+@dataclass(frozen=True)
+class Variant:
+    name: str     # filnavn i cachen
+    fmt: str      # "webp" | "jpeg" | "orig"
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.name.rsplit(".", 1)[0]}"'
+
+
+class ImageProxy:
+    def __init__(self, cache: Optional[DiskLRU] = None, resize: bool = HAVE_PILLOW):
+        self.cache = cache if cache is not None else DiskLRU()
+        self.resize = resize
+        self._flight = SingleFlight()
+        self.fetches = 0
+        self.renders = 0
+
+    def variant(self, url: str, size: int, webp: bool) -> Variant:
+        if not self.resize:
+            return Variant(f"src-{_digest(url)}.bin", "orig")
+        fmt = "webp" if webp else "jpeg"
+        return Variant(f"{_digest(url, size, fmt, QUALITY)}.{fmt}", fmt)
+
+    async def _fetch(self, url: str) -> bytes:
+        """Kildebildet; strømmes og avbrytes så snart det passerer MAX_SOURCE_BYTES."""
+        too_big = f"{url}: exceeds IMG_MAX_SOURCE_MB ({MAX_SOURCE_BYTES} bytes)"
+        buf = bytearray()
+        try:
+            async with http_pool.stream("GET", url, follow_redirects=True) as r:
+                if r.status_code != 200:
+                    raise ImageError(f"{url}: HTTP {r.status_code}")
+                length = r.headers.get("content-length", "")
+                if length.isdigit() and int(length) > MAX_SOURCE_BYTES:
+                    raise ImageError(too_big)
+                async for chunk in r.aiter_bytes():
+                    buf += chunk
+                    if len(buf) > MAX_SOURCE_BYTES:
+                        raise ImageError(too_big)
+        except ImageError:
+            raise
+        except Exception as e:
+            raise ImageError(f"{url}: {type(e).__name__}: {e}") from e
+        data = bytes(buf)
+        if sniff(data) == "application/octet-stream":
+            raise ImageError(f"{url}: not an image")
+        self.fetches += 1
+        return data
+
+    async def source(self, url: str) -> bytes:
+        name = f"src-{_digest(url)}.bin"
+        data = await asyncio.to_thread(self.cache.get, name)
+        if data is not None:
+            return data
+
+        async def fetch() -> bytes:
+            data = await self._fetch(url)
+            await asyncio.to_thread(self.cache.put, name, data)
+            return data
+        return await self._flight.do(name, fetch)
+
+    async def get(self, url: str, size: int, webp: bool) -> Tuple[Variant, bytes]:
+        v = self.variant(url, size, webp)
+        data = await asyncio.to_thread(self.cache.get, v.name)
+        if data is not None:
+            IMAGES.inc("hit")
+            return v, data
+        if v.fmt == "orig":
+            IMAGES.inc("miss")
+            return v, await self.source(url)
+
+        async def render() -> bytes:
+            src = await self.source(url)
+            try:
+                out = await asyncio.to_thread(_resize, src, size, v.fmt)
+            except Exception as e:   # Pillow kaster mange ulike typer for ødelagte bilder
+                raise ImageError(f"{url}: cannot resize: {type(e).__name__}: {e}") from e
+            await asyncio.to_thread(self.cache.put, v.name, out)
+            self.renders += 1
+            return out
+        IMAGES.inc("miss")
+        return v, await self._flight.do(v.name, render)
+
+    async def respond(self, request: Request, url: str, size: int) -> Response:
+        v = self.variant(url, size, accepts_webp(request))
+        cache_control = IMMUTABLE if request.query_params.get("v") == version(url) else CACHE_CONTROL
+        headers = {"ETag": v.etag, "Cache-Control": cache_control, "Vary": "Accept"}
+        if etag_matches(request.headers.get("if-none-match"), v.etag):
+            IMAGES.inc("not_modified")
+            return Response(status_code=304, headers=headers)
+        try:
+            v, data = await self.get(url, size, accepts_webp(request))
+        except ImageError as e:
+            IMAGES.inc("error")
+            print(f"[WARN] image proxy: {e}")
+            return Response(status_code=502, headers={"Cache-Control": "no-store"})
+        media_type = sniff(data) if v.fmt == "orig" else f"image/{v.fmt}"
+        return Response(data, media_type=media_type, headers=headers)
+
+    def stats(self) -> dict:
+        return {"files": len(self.cache), "bytes": self.cache.total, "budget": self.cache.budget,
+                "evictions": self.cache.evictions, "fetches": self.fetches, "renders": self.renders,
+                "coalesced": self._flight.shared, "resize": self.resize}
+
+
+PROXY = ImageProxy()
@@ -0,0 +1,241 @@
+# jobqueue.py
+"""
+Asynkron jobbkø for manuelle triggere (/trigger/*) og andre jobber med sideeffekter.
+
+- submit() returnerer med en gang; jobben kjøres av et fast antall workere
+  (JOB_QUEUE_WORKERS) med timeout per jobb
+- Samme nøkkel mens en jobb står i kø eller kjører -> samme jobb (dedup); ti
+  raske triggere gir én kjøring og én GitHub-commit
+- Køen er begrenset (JOB_QUEUE_MAX); full kø gir QueueFull (HTTP 503)
+- Status, varighet og resultat hentes med get(id) (/jobs/{id}); de siste
+  JOB_QUEUE_KEEP ferdige jobbene huskes
+- Bare i minnet og per worker-prosess; jobber som ikke må kjøre i to workere
+  samtidig tar i tillegg leader.file_lock (se main.topsellers_job)
+
+ENV:
+- JOB_QUEUE_WORKERS   (default: 2)
+- JOB_QUEUE_MAX       (default: 50 jobber i kø)
+- JOB_QUEUE_TIMEOUT   (default: 300 sek per jobb)
+- JOB_QUEUE_KEEP      (default: 200 ferdige jobber)
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+import asyncio
+import os
+import time
+import uuid
+
+import metrics
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "").strip() or default)
+    except ValueError:
+        return default
+
+
+WORKERS = int(_env_float("JOB_QUEUE_WORKERS", 2))
+MAX_QUEUED = int(_env_float("JOB_QUEUE_MAX", 50))
+TIMEOUT = _env_float("JOB_QUEUE_TIMEOUT", 300.0)
+KEEP = int(_env_float("JOB_QUEUE_KEEP", 200))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, TIMED_OUT, CANCELLED = (
+    "queued", "running", "succeeded", "failed", "timeout", "cancelled")
+FINISHED = frozenset((SUCCEEDED, FAILED, TIMED_OUT, CANCELLED))
+
+QUEUE_JOBS = metrics.counter("pbw_queue_jobs_total", "Queued jobs by kind and outcome", ("kind", "result"))
+QUEUE_DURATION = metrics.histogram("pbw_queue_job_duration_seconds", "Queued job run time", ("kind",),
+                                   metrics.JOB_BUCKETS)
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _iso(t: Optional[float]) -> Optional[str]:
+    return None if t is None else datetime.fromtimestamp(t, timezone.utc).isoformat(timespec="milliseconds")
+
+
+class JobRun:
+    def __init__(self, kind: str, func: Callable[[], Awaitable[object]], key: Optional[Hashable],
+                 timeout: Optional[float], now: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.func = func
+        self.key = key
+        self.timeout = timeout
+        self.status = QUEUED
+        self.created = now
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.result: object = None
+        self.error: Optional[str] = None
+        self.submits = 1                  # 1 + antall deduperte innsendinger
+        self._done = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED
+
+    async def wait(self) -> "JobRun":
+        await self._done.wait()
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created": _iso(self.created),
+            "started": _iso(self.started),
+            "finished": _iso(self.finished),
+            "duration_s": None if self.duration is None else round(self.duration, 4),
+            "result": self.result,
+            "error": self.error,
+            "submits": self.submits,
+        }
+
+
+class JobQueue:
+    def __init__(self, workers: int = WORKERS, max_queued: int = MAX_QUEUED, timeout: float = TIMEOUT,
+                 keep: int = KEEP, clock: Callable[[], float] = time.time):
+        self.workers = max(workers, 1)
+        self.max_queued = max(max_queued, 1)
+        self.timeout = timeout
+        self.keep = keep
+        self.clock = clock
+        self._queue: "asyncio.Queue[JobRun]" = asyncio.Queue()
+        self._jobs: "OrderedDict[str, JobRun]" = OrderedDict()   # id -> jobb, eldste først
+        self._inflight: Dict[Hashable, JobRun] = {}              # nøkkel -> jobb i kø/kjører
+        self._tasks: List[asyncio.Task] = []
+        self.submitted = 0
+        self.deduped = 0
+        self.rejected = 0
+
+    # -------- API --------
+    def submit(self, kind: str, func: Callable[[], Awaitable[object]], key: Optional[Hashable] = None,
+               timeout: Optional[float] = None) -> Tuple[JobRun, bool]:
+        """(jobb, dedupet). Dedup gjelder (kind, key); key=None gir alltid en ny jobb."""
+        dedup_key = None if key is None else (kind, key)
+        job = self.inflight(kind, key)
+        if job is not None:
+            job.submits += 1
+            self.deduped += 1
+            return job, True
+        if self._queue.qsize() >= self.max_queued:
+            self.rejected += 1
+            QUEUE_JOBS.inc(kind, "rejected")
+            raise QueueFull(f"job queue full ({self.max_queued})")
+        job = JobRun(kind, func, dedup_key, self.timeout if timeout is None else timeout, self.clock())
+        self._jobs[job.id] = job
+        if dedup_key is not None:
+            self._inflight[dedup_key] = job
+        self._queue.put_nowait(job)
+        self.submitted += 1
+        self._prune()
+        return job, False
+
+    def inflight(self, kind: str, key: Optional[Hashable]) -> Optional[JobRun]:
+        return None if key is None else self._inflight.get((kind, key))
+
+    def get(self, job_id: str) -> Optional[JobRun]:
+        return self._jobs.get(job_id)
+
+    def recent(self, limit: int = 20) -> List[JobRun]:
+        """Nyeste først."""
+        jobs = list(self._jobs.values())
+        return jobs[::-1][:limit]
+
+    def _prune(self) -> None:
+        """Glem de eldste ferdige jobbene utover keep (jobber i kø/kjører beholdes)."""
+        extra = len(self._jobs) - self.keep
+        if extra <= 0:
+            return
+        for job_id in [j.id for j in self._jobs.values() if j.done][:extra]:
+            del self._jobs[job_id]
+
+    # -------- livssyklus --------
+    def start(self) -> None:
+        self._tasks = [t for t in self._tasks if not t.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Vent på køen innen timeout, avbryt deretter det som gjenstår."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self._queue.empty():
+            self._finish(self._queue.get_nowait(), CANCELLED, error="shutdown")
+
+    # -------- worker --------
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: JobRun) -> None:
+        job.status = RUNNING
+        job.started = self.clock()
+        t0 = time.perf_counter()
+        try:
+            if job.timeout:
+                result = await asyncio.wait_for(job.func(), timeout=job.timeout)
+            else:
+                result = await job.func()
+        except asyncio.CancelledError:
+            self._finish(job, CANCELLED, t0, error="cancelled")
+            raise
+        except asyncio.TimeoutError:
+            self._finish(job, TIMED_OUT, t0, error=f"timed out after {job.timeout:g}s")
+        except Exception as e:
+            self._finish(job, FAILED, t0, error=f"{type(e).__name__}: {e}"[:200])
+            print(f"[WARN] queued job {job.kind} {job.id} failed: {job.error}")
+        else:
+            self._finish(job, SUCCEEDED, t0, result=result)
+
+    def _finish(self, job: JobRun, status: str, t0: Optional[float] = None,
+                result: object = None, error: Optional[str] = None) -> None:
+        job.status = status
+        job.finished = self.clock()
+        job.result = result
+        job.error = error
+        job.func = None               # slipp closure (kan holde på store objekter)
+        if t0 is not None:
+            job.duration = time.perf_counter() - t0
+            QUEUE_DURATION.observe(job.duration, job.kind)
+        if job.key is not None and self._inflight.get(job.key) is job:
+            del self._inflight[job.key]
+        QUEUE_JOBS.inc(job.kind, status)
+        job._done.set()
+
+    def stats(self) -> dict:
+        counts: Dict[str, int] = {}
+        for j in self._jobs.values():
+            counts[j.status] = counts.get(j.status, 0) + 1
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize(),
+            "by_status": counts,
+            "submitted": self.submitted,
+            "deduped": self.deduped,
+            "rejected": self.rejected,
+        }
+
+
+QUEUE = JobQueue()
+metrics.gauge("pbw_queue_depth", "Jobs waiting in the job queue", fn=lambda: QUEUE._queue.qsize())
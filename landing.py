@@ -1,6 +1,6 @@
-# site.py
+# landing.py
 from fastapi import APIRouter
-from fastapi.responses import HTMLResponse
+from static_pages import add_page
 
 router = APIRouter()
 
@@ -133,6 +133,5 @@ PBW_HTML = """
 </html>
 """
 
-@router.get("/", response_class=HTMLResponse)
-async def homepage():
-  return HTMLResponse(content=PBW_HTML, status_code=200)
\ No newline at end of file
+# Encodes og komprimeres én gang ved import; serveres med ETag/Cache-Control
+homepage = add_page(router, "/", PBW_HTML)
\ No newline at end of file
@@ -0,0 +1,194 @@
+# leader.py
+"""
+Leder-valg mellom uvicorn-workere (--workers N) på samme maskin/volum.
+
+- Bare lederen kjører bakgrunnsjobbene (startup-ping, heartbeat, top-sellers,
+  idéer); alle workere svarer fortsatt på HTTP
+- Med fcntl (Linux/macOS): eksklusiv flock på lease-fila. Låsen slippes av
+  kjernen når prosessen dør, så en annen worker tar over ved neste forsøk
+- Uten fcntl: lease-fil med utløpstid (JOBS_LEASE_TTL) som lederen fornyer;
+  en ny leder kan ta over når leasen har gått ut
+- Lease-fila inneholder hvem som er leder (vert:pid) og når, for feilsøking
+- file_lock(sti): eksklusiv flock for kritiske seksjoner som flere workere deler
+  (append/komprimering av filer under data/, én top-sellers-kjøring om gangen);
+  no-op uten fcntl
+
+ENV:
+- JOBS_LEASE      (default: data/jobs.lease; tom = alltid leder, f.eks. lokalt)
+- JOBS_LEASE_TTL  (default: 30 sek; forsøk/fornyelse hver TTL/3)
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Iterator, Optional
+import asyncio
+import json
+import os
+import socket
+import time
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "").strip() or default)
+    except ValueError:
+        return default
+
+
+LEASE_PATH = os.getenv("JOBS_LEASE", "data/jobs.lease").strip()
+LEASE_TTL = _env_float("JOBS_LEASE_TTL", 30.0)
+
+Callback = Callable[[], Awaitable[object]]
+
+
+@contextmanager
+def file_lock(path: Optional[str], blocking: bool = True) -> Iterator[bool]:
+    """
+    Eksklusiv lås på tvers av prosesser. blocking=True venter til den er ledig
+    (kall fra en tråd, ikke event-loopen); blocking=False gir False med en gang
+    hvis en annen holder den. Uten sti eller fcntl: alltid True.
+    """
+    if not path or fcntl is None:
+        yield True
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+    finally:
+        os.close(fd)   # slipper låsen
+
+
+class LeaderLease:
+    def __init__(self, path: Optional[str] = LEASE_PATH, ttl: float = LEASE_TTL,
+                 use_flock: bool = fcntl is not None, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.ttl = max(ttl, 3.0)
+        self.use_flock = use_flock and fcntl is not None
+        self.clock = clock
+        self.identity = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self.since: Optional[float] = None
+        self.elections = 0
+        self._fd: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # -------- lås / lease --------
+    def _info(self) -> bytes:
+        now = self.clock()
+        return json.dumps({"owner": self.identity, "renewed": round(now, 3),
+                           "expires": round(now + self.ttl, 3)}).encode("utf-8")
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                info = json.load(f)
+            return info if isinstance(info, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _try_flock(self) -> bool:
+        if self._fd is not None:
+            return True   # låsen holdes så lenge fd-en er åpen
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, self._info(), 0)
+        return True
+
+    def _try_lease(self) -> bool:
+        info = self._read()
+        mine = info.get("owner") == self.identity
+        if not mine and float(info.get("expires") or 0) > self.clock():
+            return False
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(self._info())
+        os.replace(tmp, self.path)
+        # to workere kan ha skrevet samtidig: siste skriver vinner
+        return self._read().get("owner") == self.identity
+
+    def try_acquire(self) -> bool:
+        """Bli (eller forbli) leder. Fornyer leasen hvis vi allerede er leder."""
+        if not self.path:
+            return True
+        try:
+            return self._try_flock() if self.use_flock else self._try_lease()
+        except OSError as e:
+            print(f"[WARN] leader lease {self.path}: {e}")
+            return False
+
+    def release(self) -> None:
+        if self._fd is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+        elif self.path and not self.use_flock and self._read().get("owner") == self.identity:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        self.is_leader = False
+        self.since = None
+
+    # -------- livssyklus --------
+    def start(self, on_elected: Callback, on_lost: Optional[Callback] = None) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop(on_elected, on_lost))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.release()
+
+    async def _loop(self, on_elected: Callback, on_lost: Optional[Callback]) -> None:
+        while True:
+            leader = self.try_acquire()
+            if leader and not self.is_leader:
+                self.is_leader, self.since = True, self.clock()
+                self.elections += 1
+                print(f"[INFO] {self.identity} is now leader for background jobs")
+                await _safe(on_elected, "on_elected")
+            elif self.is_leader and not leader:
+                self.is_leader, self.since = False, None
+                print(f"[WARN] {self.identity} lost leadership")
+                if on_lost is not None:
+                    await _safe(on_lost, "on_lost")
+            await asyncio.sleep(self.ttl / 3)
+
+    def stats(self) -> dict:
+        return {
+            "identity": self.identity,
+            "leader": self.is_leader,
+            "since": self.since,
+            "elections": self.elections,
+            "mode": "off" if not self.path else "flock" if self.use_flock else "lease",
+            "holder": self._read().get("owner") if self.path else self.identity,
+        }
+
+
+async def _safe(cb: Callback, what: str) -> None:
+    try:
+        await cb()
+    except Exception as e:
+        print(f"[WARN] leader {what} failed: {type(e).__name__}: {e}")
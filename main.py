@@ -4,9 +4,25 @@ PureBloomWorld Agent — stabil base
 Hva den gjør:
 - Startup-ping til Discord (+ ENV-dump light)
 - Heartbeat hver N minutter (ENV: HEARTBEAT_MINUTES, >0)
-- /healthz, /debug/ping
+- Rutene her (router) monteres av app.create_app() sammen med site_routes og landing
+- /healthz, /debug/ping, /debug/discord (kø-statistikk), /debug/startup (oppstartstider)
+- Discord-meldinger går via bakgrunnskø (rate-limit, batching, dedup)
 - Manuell trigger: GET /trigger/topsellers (poster topp 5 fra mock-DB)
-- (Valgfritt) bakgrunnsloop for top-sellers hvert M min hvis TOPSELLER_ENABLE=true
+- Triggere legges i jobbkøen (jobqueue.py) og svarer 202 med jobb-id; status på
+  /jobs/{id}. Samme jobb som allerede står i kø/kjører gjenbrukes. Triggere og
+  /debug/ping er begrenset med token bucket (ratelimit.py, 429 + Retry-After)
+- Top-sellers-kjøringen holder en fil-lås ved siden av JOBS_LEASE (topsellers.lock),
+  så bare én worker kjører/committer den om gangen; de andre hopper over
+- (Valgfritt) top-sellers hvert M min hvis TOPSELLER_ENABLE=true
+- Rangeringshistorikk (rank_history.py): topp-listen lagres hver time og ved hver
+  top-sellers-kjøring; spørringer på /history/*, status på /debug/history
+- Daglige idéer 08:00 Europe/Oslo (IDEAS_ENABLE), manuelt via /trigger/ideas,
+  ukesplan (forhåndsvisning) på /debug/ideas/week
+- Alle jobber kjøres av scheduler.Scheduler (status: /debug/jobs)
+- Med flere workere (uvicorn --workers N) kjører bare lederen bakgrunnsjobbene
+  (leader.py, status: /debug/leader); topp-listen deles via shared_top.py
+- Metrikker i Prometheus-format på /metrics (ruter, utgående HTTP, jobber, katalog)
+- GitHub-pipelinen og idé-motoren lages ved første bruk, ikke ved import
 
 ENV (Railway):
 - DISCORD_WEBHOOK         (påkrevd)
@@ -14,154 +30,327 @@ ENV (Railway):
 - HEARTBEAT_MINUTES       (default: 60)  # bruk 1 for rask test, ikke "00"
 - TOPSELLER_ENABLE        (default: false)
 - TOPSELLER_INTERVAL_MIN  (default: 60)
+- IDEAS_ENABLE            (default: true)
+- IDEAS_CORPUS, IDEAS_HISTORY, IDEAS_NO_REPEAT_DAYS, IDEAS_CATEGORY_WEIGHTS, IDEAS_SEED (se ideas.py)
+- SCHEDULER_STATE         (default: data/scheduler_state.json)
+- CATALOG_FEED            (valgfri; JSONL/CSV produktfeed)
+- CATALOG_SNAPSHOT        (default: data/catalog.snap)
+- CLICK_LOG, CLICK_FLUSH_SEC, CLICK_HALF_LIFE_H, CLICK_WEIGHT (se clicks.py)
+- JOBS_LEASE, JOBS_LEASE_TTL (se leader.py)
+- MARKETPLACE_URLS, SOURCE_* (valgfri; produktkilder, se sources.py)
+- TOPSELLER_SHARED, TOPSELLER_SHARE_SEC (default: 30) (se shared_top.py)
+- RANK_HISTORY, RANK_HISTORY_* (se rank_history.py)
+- JOB_QUEUE_* (se jobqueue.py); TRIGGER_RATE_PER_MIN, TRIGGER_BURST, PING_RATE_PER_MIN, PING_BURST (se ratelimit.py)
 - GH_TOKEN                (valgfri; kreves for commit)
 - GH_OWNER, GH_REPO, GH_BRANCH (kreves bare hvis GH_TOKEN satt)
 """
 
-import os, asyncio, json
+import asyncio, json, math, os
 from datetime import datetime, timezone
-import httpx
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from typing import Optional
+from fastapi import APIRouter, Query
+from fastapi.responses import JSONResponse, Response
 
 # --- Lokal mock av produkter
 from products import get_top_sellers
+import http_pool
+from discord_queue import DiscordDispatcher
+from gh_push import CommitPipeline, CommitResult
+from scheduler import Scheduler, Interval
+from idea_jobs import register_daily_ideas, compose_idea_message, plan_week
+from catalog_loader import boot_catalog
+from products import CATALOG
+import clicks
+import metrics
+from leader import LeaderLease, file_lock
+import jobqueue
+import rank_history
+import ratelimit
+import shared_top
+import sources
+from boottime import BOOT
+from config import get_settings
 
-app = FastAPI()
+router = APIRouter()
 UTC = timezone.utc
 
-# -------- Config helpers --------
-def env_bool(name: str, default: bool=False) -> bool:
-    val = os.getenv(name, "").strip().lower()
-    if val in ("1","true","yes","y","on"): return True
-    if val in ("0","false","no","n","off"): return False
-    return default
+# -------- Config (leses én gang, se config.py) --------
+cfg = get_settings()
+SERVICE_NAME = cfg.service_name
+DISCORD_WEBHOOK = cfg.discord_webhook
+HEARTBEAT_MINUTES = cfg.heartbeat_minutes
 
-def env_int(name: str, default: int) -> int:
-    try:
-        return int(os.getenv(name, "").strip() or default)
-    except Exception:
-        return default
-
-SERVICE_NAME = os.getenv("SERVICE_NAME", "purebloomworld-agent").strip()
-DISCORD_WEBHOOK = os.getenv("DISCORD_WEBHOOK", "").strip()
-HEARTBEAT_MINUTES = env_int("HEARTBEAT_MINUTES", 60)
-
-TOPSELLER_ENABLE = env_bool("TOPSELLER_ENABLE", False)
-TOPSELLER_INTERVAL_MIN = env_int("TOPSELLER_INTERVAL_MIN", 60)
-
-GH_TOKEN  = os.getenv("GH_TOKEN", "").strip()
-GH_OWNER  = os.getenv("GH_OWNER", "").strip()
-GH_REPO   = os.getenv("GH_REPO", "").strip()
-GH_BRANCH = os.getenv("GH_BRANCH", "main").strip()
+TOPSELLER_ENABLE = cfg.topseller_enable
+TOPSELLER_INTERVAL_MIN = cfg.topseller_interval_min
+IDEAS_ENABLE = cfg.ideas_enable
+TOPSELLER_SHARE_SEC = cfg.topseller_share_sec
 
 # -------- Discord helpers --------
-async def discord_send(message: str):
-    if not DISCORD_WEBHOOK:
-        return
-    payload = {"content": message}
-    async with httpx.AsyncClient(timeout=15) as client:
-        try:
-            await client.post(DISCORD_WEBHOOK, json=payload)
-        except Exception:
-            pass  # aldri crash appen pga Discord
+discord = DiscordDispatcher(DISCORD_WEBHOOK)
+metrics.gauge("pbw_discord_queue_depth", "Discord messages waiting to be sent",
+              fn=lambda: discord.stats()["queue_depth"])
+metrics.gauge("pbw_discord_messages", "Discord messages by outcome since start", ("outcome",),
+              fn=lambda: {(k,): discord.stats()[k] for k in ("sent", "dropped", "deduped", "failed", "rate_limited")})
+
+async def discord_send(message: str) -> bool:
+    """Legger meldingen i kø; sendes i bakgrunnen (aldri crash appen pga Discord)."""
+    return discord.enqueue(message)
 
 def ts() -> str:
     return datetime.now(UTC).isoformat(timespec="seconds")
 
 # -------- GitHub commit (valgfritt) --------
+_github: Optional[CommitPipeline] = None
+
+def github() -> CommitPipeline:
+    """Lages ved første commit (leser blob-cachen fra disk), ikke ved oppstart."""
+    global _github
+    if _github is None:
+        _github = CommitPipeline(cfg.gh_owner, cfg.gh_repo, cfg.gh_branch, cfg.gh_token)
+    return _github
+
+GITHUB_COMMITS = metrics.counter("pbw_github_commits_total", "GitHub commit attempts", ("result",))
+
 async def commit_list_to_github(filename: str, content: str) -> bool:
     """
     Oppretter/oppdaterer en fil i repo hvis GH_TOKEN/OWNER/REPO er satt.
-    Returnerer True ved suksess, ellers False. Ingen exceptions bobler opp.
+    Returnerer True ved suksess (også når innholdet er uendret), ellers False.
+    Ingen exceptions bobler opp.
     """
-    if not (GH_TOKEN and GH_OWNER and GH_REPO and GH_BRANCH):
-        return False
-
-    api_url = f"https://api.github.com/repos/{GH_OWNER}/{GH_REPO}/contents/{filename}"
-    headers = {
-        "Authorization": f"token {GH_TOKEN}",
-        "Accept": "application/vnd.github+json",
-        "User-Agent": "PureBloomWorld-Agent"
-    }
-
-    import base64
-    b64 = base64.b64encode(content.encode("utf-8")).decode("utf-8")
-
-    async with httpx.AsyncClient(timeout=30, headers=headers) as client:
-        # Finn sha hvis fil finnes
-        sha = None
-        try:
-            r_get = await client.get(api_url, params={"ref": GH_BRANCH})
-            if r_get.status_code == 200:
-                sha = r_get.json().get("sha")
-        except Exception:
-            pass
-
-        data = {
-            "message": f"chore: update {filename} [{ts()}]",
-            "content": b64,
-            "branch": GH_BRANCH
-        }
-        if sha: data["sha"] = sha
+    return (await commit_files_to_github({filename: content})).ok
 
-        try:
-            r_put = await client.put(api_url, json=data)
-            return r_put.status_code in (200,201)
-        except Exception:
-            return False
+async def commit_files_to_github(files: dict) -> CommitResult:
+    """Flere filer i én commit; uendrede filer koster ingen API-kall."""
+    names = ", ".join(sorted(files))
+    res = await github().commit(files, f"chore: update {names} [{ts()}]")
+    GITHUB_COMMITS.inc("ok" if res.ok and res.changed else "unchanged" if res.ok else "failed")
+    return res
 
 # -------- Schedulers --------
-async def heartbeat_loop():
-    if HEARTBEAT_MINUTES <= 0:
-        return
-    while True:
-        await discord_send(f"💓 Heartbeat {SERVICE_NAME}\n• time: {ts()}\n• heartbeat: every {HEARTBEAT_MINUTES} min")
-        await asyncio.sleep(HEARTBEAT_MINUTES * 60)
-
-async def topseller_loop():
-    if not TOPSELLER_ENABLE:
-        return
-    # første run med en liten delay, deretter fast intervall
-    await asyncio.sleep(5)
-    while True:
-        await run_topsellers(post_to_discord=True, try_commit=True)
-        await asyncio.sleep(max(TOPSELLER_INTERVAL_MIN, 1) * 60)
+scheduler = Scheduler()
+leader = LeaderLease()
+LEADER_JOBS = ("share_top", "heartbeat", "topsellers", "daily_ideas", "rank_history")
+
+async def send_heartbeat():
+    await discord_send(f"💓 Heartbeat {SERVICE_NAME}\n• time: {ts()}\n• heartbeat: every {HEARTBEAT_MINUTES} min")
+
+# Jobbkøen dedupliserer per prosess; låsen hindrer at en trigger på én worker og
+# lederens planlagte kjøring committer top_sellers.json samtidig (uvicorn --workers N)
+TOPSELLERS_LOCK = os.path.join(os.path.dirname(leader.path) or ".", "topsellers.lock") if leader.path else None
+
+async def topsellers_job():
+    with file_lock(TOPSELLERS_LOCK, blocking=False) as mine:
+        if not mine:
+            return {"skipped": "already running on another worker"}
+        return await run_topsellers(post_to_discord=True, try_commit=True)
+
+async def scheduled_topsellers():
+    # via køen: faller sammen med en manuell trigger som allerede kjører
+    job, _ = jobqueue.QUEUE.submit("topsellers", topsellers_job, key="topsellers", timeout=300)
+    await job.wait()
+    if job.status != jobqueue.SUCCEEDED:
+        raise RuntimeError(f"topsellers job {job.id}: {job.error}")
+
+async def record_ranking(items=None):
+    """Lagre topp-listen i rangeringshistorikken (filskriving i tråd)."""
+    if items is None:
+        items = await get_top_sellers(limit=rank_history.TOP_N)
+    await asyncio.to_thread(rank_history.HISTORY.record, items[:rank_history.TOP_N])
+
+async def flush_clicks():
+    # fil-IO og flock i tråd; tellerne tas ut her, på samme tråd som hit()
+    await asyncio.to_thread(clicks.TRACKER.flush, clicks.TRACKER.take())
+    # scorene skrives på event-loopen: handlerne leser katalogen der, og en tråd
+    # hjelper ikke på sorteringen uansett (den holder GIL-en)
+    clicks.TRACKER.apply(CATALOG)
+
+async def publish_top():
+    """Lederen regner ut topp-listen én gang og deler den med de andre workerne."""
+    items = await get_top_sellers(limit=shared_top.SHARED_N)
+    shared_top.SHARED.publish(items, shared_top.SHARED_N, owner=leader.identity)
+
+def register_jobs():
+    """Jobber som hver worker kjører selv (egne klikk-tellere)."""
+    scheduler.add("clicks", flush_clicks, Interval(clicks.FLUSH_SEC), persist=False)
+
+def register_leader_jobs():
+    """Jobber som bare lederen kjører."""
+    if shared_top.SHARED.path:
+        scheduler.add("share_top", publish_top, Interval(max(TOPSELLER_SHARE_SEC, 1), initial_delay=0),
+                      persist=False)
+    if rank_history.INTERVAL_MIN > 0:
+        scheduler.add("rank_history", record_ranking, Interval(rank_history.INTERVAL_MIN * 60, initial_delay=60),
+                      timeout=300)
+    # heartbeat og topsellers kjører ved oppstart/valg som før scheduleren: ikke persistert
+    if HEARTBEAT_MINUTES > 0:
+        scheduler.add("heartbeat", send_heartbeat, Interval(HEARTBEAT_MINUTES * 60, initial_delay=0),
+                      persist=False)
+    if TOPSELLER_ENABLE:
+        # første run med en liten delay, deretter fast intervall
+        scheduler.add("topsellers", scheduled_topsellers,
+                      Interval(max(TOPSELLER_INTERVAL_MIN, 1) * 60, initial_delay=5),
+                      jitter=5, timeout=300, persist=False)
+    if IDEAS_ENABLE:
+        register_daily_ideas(scheduler, discord_send)
 
 # -------- Core job --------
-async def run_topsellers(post_to_discord: bool, try_commit: bool):
-    items = get_top_sellers(limit=5)
+async def run_topsellers(post_to_discord: bool, try_commit: bool) -> dict:
+    ranked = await get_top_sellers(limit=max(5, rank_history.TOP_N))
+    if leader.is_leader:   # /trigger/* kan havne på hvilken som helst worker; bare lederen skriver historikk
+        await record_ranking(ranked)
+    items = ranked[:5]
     line = "🛒 Top sellers (mock) — topp 5:\n" + \
            "".join([f"{i+1}. {p['title']}\n" for i, p in enumerate(items)])
+    committed = None
     if post_to_discord:
         await discord_send(line + "(full liste committes til GitHub)")
     if try_commit:
-        if GH_TOKEN and GH_OWNER and GH_REPO:
+        if cfg.github_configured:
             full_json = json.dumps(items, indent=2, ensure_ascii=False)
-            ok = await commit_list_to_github("data/top_sellers.json", full_json)
-            if not ok:
+            committed = await commit_list_to_github("data/top_sellers.json", full_json)
+            if not committed:
                 await discord_send("⚠️ Klarte ikke å committe til GitHub (sjekk GH_* vars).")
         else:
             await discord_send("⚠️ Skipper GitHub-commit: GH_TOKEN/OWNER/REPO ikke satt.")
+    return {"items": [p["id"] for p in items], "posted": post_to_discord, "committed": committed}
+
+async def ideas_job():
+    await discord_send(compose_idea_message())
+    return {"posted": True}
 
-# -------- FastAPI lifecycle & routes --------
-@app.on_event("startup")
+# -------- Triggere: jobbkø + token bucket --------
+TRIGGER_BUCKETS = {kind: ratelimit.TokenBucket(f"trigger_{kind}", ratelimit.TRIGGER_RATE, ratelimit.TRIGGER_BURST)
+                   for kind in ("topsellers", "ideas")}
+PING_BUCKET = ratelimit.TokenBucket("debug_ping", ratelimit.PING_RATE, ratelimit.PING_BURST)
+
+def rate_limited(wait: float) -> JSONResponse:
+    return JSONResponse({"ok": False, "error": "rate limited", "retry_after_s": round(wait, 1)},
+                        status_code=429, headers={"Retry-After": str(math.ceil(wait))})
+
+def enqueue_trigger(kind: str, func, timeout: Optional[float] = None) -> JSONResponse:
+    """202 + jobb-id. En lik jobb i kø/kjører gjenbrukes uten å bruke et token."""
+    if jobqueue.QUEUE.inflight(kind, kind) is None:
+        wait = TRIGGER_BUCKETS[kind].take()
+        if wait:
+            return rate_limited(wait)
+    try:
+        job, deduped = jobqueue.QUEUE.submit(kind, func, key=kind, timeout=timeout)
+    except jobqueue.QueueFull as e:
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=503, headers={"Retry-After": "5"})
+    url = f"/jobs/{job.id}"
+    return JSONResponse({"ok": True, "job": job.id, "status": job.status, "deduped": deduped, "url": url},
+                        status_code=202, headers={"Location": url})
+
+# -------- Lifecycle (registreres av app.create_app) & routes --------
 async def startup_event():
-    await discord_send(f"✅ Startup {SERVICE_NAME} (prod)\n• time: {ts()}\n• heartbeat: every {HEARTBEAT_MINUTES} min")
-    # start tasks
-    asyncio.create_task(heartbeat_loop())
-    asyncio.create_task(topseller_loop())
+    # HTTP-klientene (httpx) lages ved første utgående kall, ikke her
+    discord.start()
+    with BOOT.phase("catalog"):
+        try:
+            # parsing/mmap av stor katalog tar tid; ikke blokker event-loopen
+            report = await asyncio.to_thread(boot_catalog)
+            if report:
+                print(f"[INFO] catalog loaded from {report.source}: {report.loaded} products "
+                      f"({report.rejected} rejected) in {report.seconds:.2f}s")
+        except Exception as e:
+            await discord_send(f"⚠️ Klarte ikke å laste katalog-feed: {e}")
+    sources.FEED.prefetch()
+    with BOOT.phase("clicks"):
+        clicks.TRACKER.load()
+        clicks.TRACKER.apply(CATALOG)
+    # start jobber; bakgrunnsjobbene startes når (hvis) denne workeren blir leder
+    with BOOT.phase("scheduler"):
+        jobqueue.QUEUE.start()
+        register_jobs()
+        scheduler.start()
+        leader.start(on_elected, on_lost)
+    BOOT.ready()
 
-@app.get("/healthz")
+async def on_elected():
+    await discord_send(f"✅ Startup {SERVICE_NAME} (prod)\n• time: {ts()}\n• heartbeat: every {HEARTBEAT_MINUTES} min"
+                       f"\n• leader: {leader.identity}")
+    register_leader_jobs()
+
+async def on_lost():
+    for name in LEADER_JOBS:
+        scheduler.remove(name)
+
+async def shutdown_event():
+    await scheduler.stop()
+    await leader.stop()
+    await jobqueue.QUEUE.stop()
+    await flush_clicks()
+    await discord.stop()
+    await http_pool.shutdown()
+
+@router.get("/healthz")
 async def healthz():
+    BOOT.healthy()
     return JSONResponse({"ok": True, "service": SERVICE_NAME, "time": ts()})
 
-@app.get("/debug/ping")
+@router.get("/debug/ping")
 async def debug_ping():
+    wait = PING_BUCKET.take()
+    if wait:
+        return rate_limited(wait)
     await discord_send(f"🔧 Debug ping fra {SERVICE_NAME} @ {ts()}")
     return {"sent": True}
 
-@app.get("/trigger/topsellers")
+@router.get("/debug/discord")
+async def debug_discord():
+    return discord.stats()
+
+@router.get("/debug/startup")
+async def debug_startup():
+    return BOOT.stats()
+
+@router.get("/debug/clicks")
+async def debug_clicks():
+    return clicks.TRACKER.stats()
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@router.get("/debug/jobs")
+async def debug_jobs():
+    return scheduler.stats()
+
+@router.get("/debug/sources")
+async def debug_sources():
+    return sources.FEED.stats()
+
+@router.get("/debug/history")
+async def debug_history():
+    return await asyncio.to_thread(rank_history.HISTORY.stats)
+
+@router.get("/debug/leader")
+async def debug_leader():
+    return {**leader.stats(), "shared_top": shared_top.SHARED.stats()}
+
+@router.get("/debug/ideas/week")
+async def debug_ideas_week():
+    """Forhåndsvisning av neste 7 dagers idéer (endrer ikke historikken)."""
+    return [{"day": d.day.isoformat(), "products": d.products, "articles": d.articles}
+            for d in plan_week()]
+
+@router.get("/trigger/ideas")
+async def trigger_ideas():
+    return enqueue_trigger("ideas", ideas_job)
+
+@router.get("/trigger/topsellers")
 async def trigger_topsellers():
-    await run_topsellers(post_to_discord=True, try_commit=True)
-    return {"ok": True, "time": ts()}
\ No newline at end of file
+    return enqueue_trigger("topsellers", topsellers_job, timeout=300)
+
+@router.get("/jobs")
+async def list_jobs(limit: int = Query(20, ge=1, le=200)):
+    return {**jobqueue.QUEUE.stats(),
+            "limits": {b.name: b.stats() for b in (*TRIGGER_BUCKETS.values(), PING_BUCKET)},
+            "recent": [j.to_dict() for j in jobqueue.QUEUE.recent(limit)]}
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = jobqueue.QUEUE.get(job_id)
+    if job is None:
+        return JSONResponse({"ok": False, "error": "unknown job"}, status_code=404)
+    return job.to_dict()
@@ -0,0 +1,256 @@
+# metrics.py
+"""
+Innebygde metrikker i Prometheus tekstformat (GET /metrics).
+
+- Counter, Gauge og Histogram med faste label-navn; ingen avhengigheter
+- Verdier ligger i vanlige dicts (nøkkel = label-tuppel); observe() er et
+  bisect + to tillegg, så varm sti koster ~1 µs
+- Gauge kan ha en callback som leses først ved scrape (katalogstørrelse, kø-lengde)
+- MetricsMiddleware (ren ASGI) måler latens per rute-mal (ikke rå sti, så
+  /r/{pid} blir én serie) og teller status
+- Oppdateres fra event-loopen; sjeldne kall fra tråder (sync HTTP) kan i verste
+  fall miste et tillegg, noe vi aksepterer for å slippe lås på varm sti
+"""
+from __future__ import annotations
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import abc
+import math
+import time
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+Labels = Tuple[str, ...]
+
+
+def _fmt(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    if v == -math.inf:
+        return "-Inf"
+    if v != v:
+        return "NaN"
+    if float(v).is_integer() and abs(v) < 1e15:
+        return str(int(v))
+    return repr(float(v))
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labelstr(names: Tuple[str, ...], values: Labels, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric(abc.ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+
+    @abc.abstractmethod
+    def _samples(self) -> List[str]:
+        ...
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        v = self._values
+        v[labels] = v.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_labelstr(self.labelnames, k)} {_fmt(v)}"
+                for k, v in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (),
+                 fn: Optional[Callable[[], object]] = None):
+        super().__init__(name, help, labels)
+        self._values: Dict[Labels, float] = {}
+        self.fn = fn   # () -> tall, eller {label-tuppel: tall} når gaugen har labels
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = float(value)
+
+    def _samples(self) -> List[str]:
+        values = self._values
+        if self.fn is not None:
+            try:
+                got = self.fn()
+            except Exception as e:
+                print(f"[WARN] metric {self.name} callback failed: {e}")
+                return []
+            values = got if isinstance(got, dict) else {(): float(got)}
+        return [f"{self.name}{_labelstr(self.labelnames, k)} {_fmt(v)}"
+                for k, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label-tuppel -> [telling per bøtte ..., +Inf, sum]
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        s = self._series.get(labels)
+        if s is None:
+            s = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        s[bisect_left(self.buckets, value)] += 1
+        s[-1] += value
+
+    def count(self, *labels: str) -> int:
+        s = self._series.get(labels)
+        return int(sum(s[:-1])) if s else 0
+
+    def _samples(self) -> List[str]:
+        out: List[str] = []
+        names = self.labelnames
+        for k, s in sorted(self._series.items()):
+            acc = 0
+            for le, n in zip(self.buckets + (math.inf,), s):
+                acc += n
+                le_label = 'le="' + _fmt(le) + '"'
+                out.append(f"{self.name}_bucket{_labelstr(names, k, le_label)} {acc}")
+            out.append(f"{self.name}_sum{_labelstr(names, k)} {_fmt(s[-1])}")
+            out.append(f"{self.name}_count{_labelstr(names, k)} {acc}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        old = self._metrics.get(metric.name)
+        if old is not None:
+            return old   # modul importert på nytt (reload/tester): behold serien
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics.values():
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def counter(name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labels))
+
+
+def gauge(name: str, help: str, labels: Iterable[str] = (),
+          fn: Optional[Callable[[], object]] = None) -> Gauge:
+    g = REGISTRY.register(Gauge(name, help, labels, fn))
+    if fn is not None:
+        g.fn = fn
+    return g
+
+
+def histogram(name: str, help: str, labels: Iterable[str] = (),
+              buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labels, buckets))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# -------- felles metrikker --------
+HTTP_REQUESTS = counter("pbw_http_requests_total", "HTTP requests handled", ("method", "route", "status"))
+HTTP_LATENCY = histogram("pbw_http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+OUTBOUND_REQUESTS = counter("pbw_outbound_requests_total", "Outbound HTTP calls", ("host", "status"))
+OUTBOUND_LATENCY = histogram("pbw_outbound_request_duration_seconds", "Outbound HTTP latency", ("host",))
+JOB_RUNS = counter("pbw_job_runs_total", "Scheduler job runs", ("job", "result"))
+JOB_DURATION = histogram("pbw_job_duration_seconds", "Scheduler job duration", ("job",), JOB_BUCKETS)
+JOB_LAG = histogram("pbw_job_lag_seconds", "Delay from planned to actual job start", ("job",), JOB_BUCKETS)
+RANKING = histogram("pbw_ranking_duration_seconds", "Catalog ranking time", ("op",))
+
+
+# -------- ASGI --------
+UNMATCHED = "<unmatched>"
+
+
+class MetricsMiddleware:
+    """
+    Ren ASGI-middleware (ingen BaseHTTPMiddleware => ingen ekstra task per request).
+    Rute-label hentes fra endpointet routeren satte i scope, slått opp i en
+    tabell endpoint -> rute-mal som bygges første gang.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Optional[Dict[object, str]] = None
+
+    def _route_table(self, root) -> Dict[object, str]:
+        table: Dict[object, str] = {}
+
+        def walk(routes, prefix: str) -> None:
+            for r in routes:
+                sub = getattr(r, "routes", None)
+                if sub is not None and not hasattr(r, "endpoint"):   # Mount
+                    walk(sub, prefix + getattr(r, "path", ""))
+                elif hasattr(r, "endpoint"):
+                    table[r.endpoint] = prefix + r.path
+
+        walk(getattr(root, "routes", ()), "")
+        return table
+
+    def _label(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED
+        routes = self._routes
+        if routes is None or endpoint not in routes:
+            routes = self._routes = self._route_table(scope.get("app"))
+            routes.setdefault(endpoint, UNMATCHED)   # ikke bygg tabellen igjen for samme endpoint
+        return routes[endpoint]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = self._label(scope)
+            method = scope["method"]
+            HTTP_LATENCY.observe(time.perf_counter() - t0, method, route)
+            HTTP_REQUESTS.inc(method, route, str(status))
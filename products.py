@@ -1,26 +1,30 @@
 # products.py
 from __future__ import annotations
-from dataclasses import dataclass, asdict
-from typing import List, Dict, Optional
+from dataclasses import dataclass, asdict, replace
+from typing import Awaitable, Callable, List, Dict, Optional, Iterable, Iterator, Tuple
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
 import os
-import asyncio
+import base64
+import json
+import threading
+import time
+
+import affiliate
+import metrics
 
 # Kilde/marketplace for visning i meldinger
 SOURCE_NAME = os.getenv("PRODUCT_SOURCE", "amazon")
 
-# TODO: Når du får affiliate-tag (f.eks. tag=xxx), sett den her:
-AFFIL_TAG = os.getenv("AFFIL_TAG", "").strip()
+# Katalog-backend: "dict" (standard) eller "columnar" (krever numpy)
+CATALOG_BACKEND = os.getenv("CATALOG_BACKEND", "dict").strip().lower()
 
 def with_affiliate(url: str) -> str:
     """
-    Legg til affiliate-tag senere. Nå returnerer vi bare url uendret.
-    Eksempel for Amazon senere:
-    - hvis '?tag=' ikke finnes -> append '?tag=AFFIL_TAG'
+    Affiliate-tag/UTM/normalisering etter regelsettet i affiliate.py
+    (ENV AFFIL_RULES, evt. AFFIL_TAG for Amazon).
     """
-    if not AFFIL_TAG:
-        return url
-    # plassholder – implementeres når vi har konkrete partnere
-    return url
+    return affiliate.rewrite(url)
 
 @dataclass
 class Product:
@@ -30,6 +34,8 @@ class Product:
     url: str              # merchant-url (vi kan bytte til affiliate senere)
     price: Optional[float] = None
     score: float = 0.0    # enkel ranking-score
+    category: str = ""    # Health / Lifestyle / Tech / Eco ...
+    tags: Tuple[str, ...] = ()
 
     def to_public(self) -> Dict:
         d = asdict(self)
@@ -46,6 +52,8 @@ PRODUCT_DB: List[Product] = [
         url="https://www.amazon.com/dp/B09B2SB8QK",
         price=49.99,
         score=9.3,
+        category="Tech",
+        tags=('smart-home', 'speaker'),
     ),
     Product(
         id="amz-airfryer",
@@ -54,6 +62,8 @@ PRODUCT_DB: List[Product] = [
         url="https://www.amazon.com/dp/B07Q2VFX3L",
         price=119.99,
         score=8.9,
+        category="Lifestyle",
+        tags=('kitchen',),
     ),
     Product(
         id="amz-anker-pb",
@@ -62,6 +72,8 @@ PRODUCT_DB: List[Product] = [
         url="https://www.amazon.com/dp/B0B7QJZ1WZ",
         price=39.99,
         score=8.5,
+        category="Tech",
+        tags=('charging', 'travel'),
     ),
     Product(
         id="amz-apple-airpods2",
@@ -70,6 +82,8 @@ PRODUCT_DB: List[Product] = [
         url="https://www.amazon.com/dp/B0BDHWDR12",
         price=99.00,
         score=9.1,
+        category="Tech",
+        tags=('audio',),
     ),
     Product(
         id="amz-fire-tv",
@@ -78,6 +92,8 @@ PRODUCT_DB: List[Product] = [
         url="https://www.amazon.com/dp/B08XVYZ1Y5",
         price=34.99,
         score=8.7,
+        category="Tech",
+        tags=('streaming',),
     ),
     Product(
         id="amz-hydroflask",
@@ -86,6 +102,8 @@ PRODUCT_DB: List[Product] = [
         url="https://www.amazon.com/dp/B07TB3Z9S4",
         price=44.95,
         score=8.2,
+        category="Eco",
+        tags=('reusable', 'outdoor'),
     ),
 ]
 
@@ -94,12 +112,235 @@ def _rank_key(p: Product):
     # (kan byttes til salgstall/klikk senere)
     return (-p.score, p.price if p.price is not None else 1e9, p.title.lower())
 
+def rank_key(p: Product) -> tuple:
+    # id til slutt gjør nøkkelen unik, så bisect finner riktig rad
+    return _rank_key(p) + (p.id,)
+
+class Catalog:
+    """
+    In-memory katalog med id-indeks og en sortert ranking-indeks.
+    - get(pid): O(1) oppslag via dict
+    - top(k): leser de k første fra rankingen uten å sortere hele katalogen
+    - upsert/remove: holder rankingen sortert inkrementelt (bisect)
+    - iter_ranked(after): lat iterasjon i ranking-rekkefølge fra en cursor-nøkkel
+    Endre produkter via upsert(), ikke ved å mutere Product-objektene direkte.
+    Endringer kan komme fra tråder (oppstart, klikk), så lesere som bruker mer enn
+    ett felt (top, iter_ranked) tar self._lock; tunge skrivere (load) bygger ny
+    tilstand utenfor låsen og holder den bare mens den byttes inn.
+    """
+
+    def __init__(self, products: Iterable[Product] = ()):
+        self._lock = threading.RLock()
+        self._by_id: Dict[str, Product] = {}
+        self._keys: Dict[str, tuple] = {}
+        self._ranking: List[tuple] = []   # sortert liste av (rank_key..., id)
+        self._listeners: List[Callable[[Optional[List[str]]], None]] = []
+        self._score_listeners: List[Callable[[Optional[List[str]]], None]] = []
+        self.version = 0                  # økes ved hver endring
+        self.load(products)
+
+    def add_listener(self, fn: Callable[[Optional[List[str]]], None]) -> None:
+        """fn(pids) kalles etter upsert/remove; fn(None) etter load (alt byttet)."""
+        self._listeners.append(fn)
+
+    def add_score_listener(self, fn: Callable[[Optional[List[str]]], None]) -> None:
+        """fn(pids) kalles etter set_scores med id-ene som fikk ny score."""
+        self._score_listeners.append(fn)
+
+    def _changed(self, pids: Optional[List[str]], listeners=None) -> None:
+        for fn in self._listeners if listeners is None else listeners:
+            fn(pids)
+
+    _key = staticmethod(rank_key)
+
+    def _unrank(self, pid: str) -> None:
+        key = self._keys.pop(pid, None)
+        if key is None:
+            return
+        i = bisect_left(self._ranking, key)
+        if i < len(self._ranking) and self._ranking[i] == key:
+            del self._ranking[i]
+
+    def load(self, products: Iterable[Product], expect_version: Optional[int] = None) -> bool:
+        """
+        Erstatt hele katalogen (én sortering, ikke n insort-kall). Med expect_version
+        byttes den bare inn hvis katalogen ikke er endret siden; ellers False.
+        """
+        by_id = {p.id: p for p in products}
+        keys = {pid: self._key(p) for pid, p in by_id.items()}
+        ranking = sorted(keys.values())
+        with self._lock:
+            if expect_version is not None and self.version != expect_version:
+                return False
+            self._by_id, self._keys, self._ranking = by_id, keys, ranking
+            self.version += 1
+        self._changed(None)
+        return True
+
+    def upsert(self, p: Product) -> None:
+        with self._lock:
+            self._unrank(p.id)
+            key = self._key(p)
+            self._by_id[p.id] = p
+            self._keys[p.id] = key
+            insort(self._ranking, key)
+            self.version += 1
+        self._changed([p.id])
+
+    def remove(self, pid: str) -> bool:
+        with self._lock:
+            if pid not in self._by_id:
+                return False
+            self._unrank(pid)
+            del self._by_id[pid]
+            self.version += 1
+        self._changed([pid])
+        return True
+
+    def set_scores(self, scores: Dict[str, float]) -> int:
+        """
+        Oppdater score for mange id-er på én gang (f.eks. klikk-boost).
+        Mange endringer => én ny sortering; få => inkrementelt. Varsler bare
+        score-lytterne (kun score endres). Returnerer antall endrede.
+        """
+        with self._lock:
+            changed = [(pid, s) for pid, s in scores.items()
+                       if pid in self._by_id and self._by_id[pid].score != s]
+            if not changed:
+                return 0
+            resort = len(changed) * 32 > len(self._ranking)
+            for pid, s in changed:
+                if not resort:
+                    self._unrank(pid)
+                p = self._by_id[pid] = replace(self._by_id[pid], score=s)
+                self._keys[pid] = self._key(p)
+                if not resort:
+                    insort(self._ranking, self._keys[pid])
+            if resort:
+                self._ranking = sorted(self._keys.values())
+            self.version += 1
+        self._changed([pid for pid, _ in changed], self._score_listeners)
+        return len(changed)
+
+    def get(self, pid: str) -> Optional[Product]:
+        return self._by_id.get(pid)
+
+    def top(self, limit: int = 10) -> List[Product]:
+        with self._lock:
+            by_id = self._by_id
+            return [by_id[k[-1]] for k in self._ranking[:max(limit, 0)]]
+
+    def iter_ranked(self, after: Optional[tuple] = None, chunk: int = 256) -> Iterator[Product]:
+        """
+        Produkter i ranking-rekkefølge, etter nøkkelen `after` (eksklusiv).
+        Leser rankingen i små biter og fortsetter fra siste nøkkel, så
+        endringer underveis verken gir dobbel eller hoppet-over rad.
+        """
+        last = after
+        while True:
+            with self._lock:
+                i = 0 if last is None else bisect_right(self._ranking, last)
+                keys = self._ranking[i:i + chunk]
+                rows = [self._by_id[k[-1]] for k in keys]
+            if not rows:
+                return
+            yield from rows
+            last = keys[-1]
+
+    def iter_ranked_ids(self, chunk: int = 1024) -> Iterator[str]:
+        """Bare id-ene i ranking-rekkefølge (billigere enn iter_ranked når raden ikke trengs)."""
+        last = None
+        while True:
+            with self._lock:
+                i = 0 if last is None else bisect_right(self._ranking, last)
+                keys = self._ranking[i:i + chunk]
+            if not keys:
+                return
+            for k in keys:
+                yield k[-1]
+            last = keys[-1]
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, pid: str) -> bool:
+        return pid in self._by_id
+
+def make_catalog(products: Iterable[Product] = ()) -> Catalog:
+    """Lag katalog med valgt backend; faller tilbake til dict om numpy mangler."""
+    if CATALOG_BACKEND == "columnar":
+        try:
+            from columnar import ColumnarCatalog
+        except ImportError as e:
+            print(f"[WARN] columnar backend unavailable ({e}); using dict catalog")
+        else:
+            return ColumnarCatalog(products)
+    return Catalog(products)
+
+CATALOG = make_catalog(PRODUCT_DB)
+CATALOG.add_listener(affiliate.forget)
+metrics.gauge("pbw_catalog_products", "Products in the catalog", fn=lambda: len(CATALOG))
+metrics.gauge("pbw_catalog_version", "Catalog version counter", fn=lambda: CATALOG.version)
+
+def catalog_version() -> int:
+    """Økes ved hver endring i katalogen; brukes som cache-nøkkel."""
+    return CATALOG.version
+
+def encode_cursor(p: Product) -> str:
+    """Opak cursor = ranking-nøkkelen til siste produkt på forrige side."""
+    raw = json.dumps(rank_key(p), ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    """ValueError ved ugyldig cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        neg_score, price, title, pid = json.loads(raw)
+        return (float(neg_score), float(price), str(title), str(pid))
+    except Exception as e:
+        raise ValueError("invalid cursor") from e
+
+def iter_ranked(cursor: Optional[str] = None) -> Iterator[Product]:
+    return CATALOG.iter_ranked(decode_cursor(cursor) if cursor else None)
+
+def page_ranked(cursor: Optional[str] = None, limit: int = 100) -> Tuple[List[Dict], Optional[str]]:
+    """Én side i ranking-rekkefølge + cursor til neste side (None på siste)."""
+    t0 = time.perf_counter()
+    rows = list(islice(iter_ranked(cursor), limit + 1))
+    metrics.RANKING.observe(time.perf_counter() - t0, "page")
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return [p.to_public() for p in rows], (encode_cursor(rows[-1]) if more else None)
+
+# Kilde-lag (sources.ProductFeed.ensure_fresh) kobles på her; None = bare lokal katalog
+_source_refresh: Optional[Callable[[], Awaitable[None]]] = None
+
+def set_source(refresh: Optional[Callable[[], Awaitable[None]]]) -> None:
+    global _source_refresh
+    _source_refresh = refresh
+
+async def refresh_source() -> None:
+    """Sørg for at katalogen er fersk nok før den leses (no-op uten produktkilder)."""
+    if _source_refresh is not None:
+        await _source_refresh()
+
+def get_product(pid: str) -> Optional[Product]:
+    return CATALOG.get(pid)
+
+def upsert_product(p: Product) -> None:
+    CATALOG.upsert(p)
+
+def remove_product(pid: str) -> bool:
+    return CATALOG.remove(pid)
+
 async def get_top_sellers(limit: int = 10) -> List[Dict]:
     """
     Returnerer en liste med dicts for topp-produkter.
-    Asynk for å matche kallene i main.py, selv om vi bruker in‑memory DB nå.
+    Med produktkilder (sources.py) sørges det først for at katalogen er fersk
+    nok; det venter bare når det ikke finnes brukbar data ennå.
     """
-    # Simuler evt. IO hvis vi senere henter fra API
-    await asyncio.sleep(0)
-    items = sorted(PRODUCT_DB, key=_rank_key)[:limit]
-    return [p.to_public() for p in items]
\ No newline at end of file
+    await refresh_source()
+    t0 = time.perf_counter()
+    top = CATALOG.top(limit)
+    metrics.RANKING.observe(time.perf_counter() - t0, "top")
+    return [p.to_public() for p in top]
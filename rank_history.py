@@ -0,0 +1,571 @@
+# rank_history.py
+"""
+Historikk for topp-listen: én rangering per kjøring, lagret kompakt på disk.
+
+- Append-only binærlogg. Hver ramme er en rangering (produkt-id, plass, score, pris)
+  delta-kodet mot forrige: bare plassene som er endret skrives, med varint-kodede
+  tall, og score/pris som differanse mot produktets forrige verdi
+- Hver KEY_EVERY ramme er en nøkkelramme (uavhengig av alt før den). Indeksfilen
+  (<logg>.idx) har (tidspunkt, offset) per nøkkelramme, så et oppslag leser bare
+  fra nærmeste nøkkelramme og fremover, aldri hele loggen
+- Spørringer: at(t), rank_over_time(pid, since, until), movers(t1, t2)
+- Komprimering (hver COMPACT_EVERY append, eller compact()): skriver loggen på nytt
+  uten rangeringer som er like forrige, med valgfri nedsampling til én per døgn
+  for gamle data og valgfri sletting; avrevet siste ramme (krasj) kuttes bort
+- Bare lederen skriver (jobben "rank_history" og run_topsellers i main.py); alle
+  workere kan lese. Append og komprimering tar i tillegg flock på <logg>.lock, så
+  to skrivere aldri fletter rammer eller mister hverandres append
+
+Timesrangeringer av 50 produkter i 3 år tar ~1-2 MB (se bench_history.py).
+
+ENV:
+- RANK_HISTORY            (default: data/rank_history.bin; tom = bare minne)
+- RANK_HISTORY_N          (default: 50 plasser per rangering)
+- RANK_HISTORY_INTERVAL_MIN (default: 60; 0 = ingen egen jobb, bare run_topsellers)
+- RANK_HISTORY_KEY_EVERY  (default: 168 rammer mellom nøkkelrammer)
+- RANK_HISTORY_COMPACT_EVERY (default: 720 append mellom komprimeringer; 0 = av)
+- RANK_HISTORY_HOURLY_DAYS (default: 0; >0 = eldre enn dette beholdes én per døgn)
+- RANK_HISTORY_RETENTION_DAYS (default: 0 = behold alt)
+"""
+from __future__ import annotations
+from bisect import bisect_right
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+import os
+import struct
+import threading
+import time
+
+from leader import file_lock
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "").strip() or default)
+    except ValueError:
+        return default
+
+
+PATH = os.getenv("RANK_HISTORY", "data/rank_history.bin").strip()
+TOP_N = _env_int("RANK_HISTORY_N", 50)
+INTERVAL_MIN = _env_int("RANK_HISTORY_INTERVAL_MIN", 60)
+KEY_EVERY = _env_int("RANK_HISTORY_KEY_EVERY", 168)
+COMPACT_EVERY = _env_int("RANK_HISTORY_COMPACT_EVERY", 720)
+HOURLY_DAYS = _env_int("RANK_HISTORY_HOURLY_DAYS", 0)
+RETENTION_DAYS = _env_int("RANK_HISTORY_RETENTION_DAYS", 0)
+
+_HEADER = struct.Struct("<8sI")      # magic, generasjon (loggen og indeksen må ha samme)
+_LOG_MAGIC = b"PBWRANK1"
+_IDX_MAGIC = b"PBWRIDX1"
+_IDX_ENTRY = struct.Struct("<qQ")    # tidspunkt, offset
+_KEY, _DELTA = 1, 2
+SCORE_SCALE = 10_000                 # score lagres i 1e-4
+DAY = 86400
+
+
+class Entry(NamedTuple):
+    pid: str
+    score: float
+    price: Optional[float]
+
+
+class Snapshot(NamedTuple):
+    t: int
+    entries: Tuple[Entry, ...]
+
+    def ranks(self) -> Dict[str, int]:
+        return {e.pid: i + 1 for i, e in enumerate(self.entries)}
+
+
+# -------- varint --------
+def _put(out: bytearray, n: int) -> None:
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _get(buf: bytes, pos: int) -> Tuple[int, int]:
+    n = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _zig(n: int) -> int:
+    return n << 1 if n >= 0 else (-n << 1) - 1
+
+
+def _unzig(n: int) -> int:
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+
+def _price_code(price: Optional[float]) -> int:
+    return 0 if price is None else round(price * 100) + 1
+
+
+# Intern form av én plass: (pid, score i 1e-4, priskode)
+_Row = Tuple[str, int, int]
+
+
+class _Block:
+    """Tilstand koderen og dekoderen deler innenfor én nøkkelramme-blokk."""
+
+    def __init__(self):
+        self.table: List[str] = []           # ref -> pid
+        self.refs: Dict[str, int] = {}       # pid -> ref
+        self.last: Dict[str, Tuple[int, int]] = {}
+        self.prev: List[_Row] = []
+        self.t = 0
+        self.frames = 0
+
+
+def _encode(block: _Block, t: int, rows: List[_Row], key: bool) -> bytes:
+    """Kod rows som ramme etter block (t må være >= block.t). Oppdaterer block."""
+    if key:
+        block.__init__()
+    out = bytearray([_KEY if key else _DELTA])
+    _put(out, t if key else t - block.t)
+    _put(out, len(rows))
+    prev = block.prev
+    changed = [r for r, row in enumerate(rows) if r >= len(prev) or prev[r] != row]
+    _put(out, len(changed))
+    last_r = -1
+    for r in changed:
+        pid, s, pc = rows[r]
+        _put(out, r - last_r - 1)
+        last_r = r
+        ls, lp = block.last.get(pid, (0, 0))
+        flags = (s != ls) | (pc != lp) << 1
+        ref = block.refs.get(pid)
+        if ref is None:
+            _put(out, flags)
+            raw = pid.encode("utf-8")
+            _put(out, len(raw))
+            out += raw
+            block.refs[pid] = len(block.table)
+            block.table.append(pid)
+        else:
+            _put(out, (ref + 1) << 2 | flags)
+        if flags & 1:
+            _put(out, _zig(s - ls))
+        if flags & 2:
+            _put(out, _zig(pc - lp))
+        block.last[pid] = (s, pc)
+    block.prev = rows
+    block.t = t
+    block.frames += 1
+    frame = bytearray()
+    _put(frame, len(out))
+    return bytes(frame + out)
+
+
+def _decode(block: _Block, payload: bytes) -> Tuple[int, bool]:
+    """Dekod én ramme inn i block (block.prev blir rangeringen). Returnerer (t, nøkkelramme)."""
+    key = payload[0] == _KEY
+    if key:
+        block.__init__()
+    v, pos = _get(payload, 1)
+    t = v if key else block.t + v
+    n, pos = _get(payload, pos)
+    count, pos = _get(payload, pos)
+    rows = block.prev[:n]
+    r = -1
+    for _ in range(count):
+        gap, pos = _get(payload, pos)
+        r += gap + 1
+        code, pos = _get(payload, pos)
+        flags, ref = code & 3, (code >> 2) - 1
+        if ref < 0:
+            size, pos = _get(payload, pos)
+            pid = payload[pos:pos + size].decode("utf-8")
+            pos += size
+            block.refs[pid] = len(block.table)
+            block.table.append(pid)
+        else:
+            pid = block.table[ref]
+        s, pc = block.last.get(pid, (0, 0))
+        if flags & 1:
+            d, pos = _get(payload, pos)
+            s += _unzig(d)
+        if flags & 2:
+            d, pos = _get(payload, pos)
+            pc += _unzig(d)
+        block.last[pid] = (s, pc)
+        if r < len(rows):
+            rows[r] = (pid, s, pc)
+        else:
+            rows.append((pid, s, pc))
+    block.prev = rows
+    block.t = t
+    block.frames = 1 if key else block.frames + 1
+    return t, key
+
+
+def _frames(buf: bytes, pos: int = 0) -> Iterator[Tuple[int, int, bytes]]:
+    """(offset, slutt, payload) for hver hele ramme; stopper ved avrevet hale."""
+    end = len(buf)
+    while pos < end:
+        try:
+            size, start = _get(buf, pos)
+        except IndexError:
+            return
+        if size == 0 or start + size > end:
+            return
+        yield pos, start + size, buf[start:start + size]
+        pos = start + size
+
+
+def _snapshot(t: int, rows: List[_Row]) -> Snapshot:
+    return Snapshot(t, tuple(Entry(pid, s / SCORE_SCALE, None if pc == 0 else (pc - 1) / 100)
+                             for pid, s, pc in rows))
+
+
+class RankHistory:
+    def __init__(self, path: Optional[str] = PATH, key_every: int = KEY_EVERY,
+                 compact_every: int = COMPACT_EVERY, hourly_days: int = HOURLY_DAYS,
+                 retention_days: int = RETENTION_DAYS, clock=time.time):
+        self.path = path
+        self.key_every = max(key_every, 1)
+        self.compact_every = compact_every
+        self.hourly_days = hourly_days
+        self.retention_days = retention_days
+        self.clock = clock
+        self._lock = threading.Lock()        # indeks og lesing
+        self._wlock = threading.Lock()       # append og komprimering
+        self._mem = bytearray()              # uten sti
+        self._gen = 0
+        self._key_ts: List[int] = []         # indeks: tidspunkt per nøkkelramme ...
+        self._key_off: List[int] = []        # ... og offset i loggen
+        self._seen: Optional[Tuple[int, int]] = None   # (inode, størrelse) da indeksen ble lest
+        self._writer: Optional[_Block] = None
+        self._end = 0                        # slutt på siste hele ramme (skriveren)
+        self._appended = 0
+        self.appends = 0
+        self.compactions = 0
+
+    @property
+    def idx_path(self) -> str:
+        return self.path + ".idx"
+
+    @property
+    def lock_path(self) -> Optional[str]:
+        return self.path + ".lock" if self.path else None
+
+    # -------- lagring --------
+    def _read(self, start: int = 0, end: Optional[int] = None) -> bytes:
+        if not self.path:
+            return bytes(self._mem[start:end])
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(start)
+                return f.read(-1 if end is None else max(end - start, 0))
+        except OSError:
+            return b""
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        if not self.path:
+            return (0, len(self._mem))
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_size)
+
+    def _header(self) -> Optional[int]:
+        head = self._read(0, _HEADER.size)
+        if len(head) < _HEADER.size:
+            return None
+        magic, gen = _HEADER.unpack(head)
+        return gen if magic == _LOG_MAGIC else None
+
+    # -------- indeks --------
+    def _sync(self) -> None:
+        """Les indeksen på nytt hvis loggen er byttet ut (komprimert) eller har vokst."""
+        st = self._stat()
+        if st == self._seen:
+            return
+        if st is None:
+            self._key_ts, self._key_off, self._seen = [], [], None
+            return
+        if self._seen is not None and st[0] == self._seen[0] and st[1] > self._seen[1] and self._key_off:
+            self._seen = st
+            self._scan_keys(self._key_off[-1])
+            return
+        self._seen = st
+        self._gen = self._header() or 0
+        self._key_ts, self._key_off = [], []
+        if self.path:
+            try:
+                with open(self.idx_path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = b""
+            if len(data) >= _HEADER.size and _HEADER.unpack_from(data) == (_IDX_MAGIC, self._gen):
+                body = data[_HEADER.size:]
+                body = body[:len(body) - len(body) % _IDX_ENTRY.size]
+                for ts, off in _IDX_ENTRY.iter_unpack(body):
+                    if off >= st[1]:
+                        break
+                    self._key_ts.append(ts)
+                    self._key_off.append(off)
+        # nøkkelrammer skrevet etter siste indekslinje (eller ingen indeks: hele loggen)
+        self._scan_keys(self._key_off[-1] if self._key_off else _HEADER.size)
+
+    def _scan_keys(self, start: int) -> None:
+        buf = self._read(start)
+        for off, _, payload in _frames(buf):
+            if payload[0] == _KEY and start + off not in self._key_off[-1:]:
+                t, _ = _get(payload, 1)
+                self._key_ts.append(t)
+                self._key_off.append(start + off)
+
+    def _start_for(self, t: int) -> int:
+        i = bisect_right(self._key_ts, t) - 1
+        return self._key_off[max(i, 0)] if self._key_off else _HEADER.size
+
+    def _end_for(self, t: int) -> Optional[int]:
+        i = bisect_right(self._key_ts, t)
+        return self._key_off[i] if i < len(self._key_off) else None
+
+    # -------- lesing --------
+    def snapshots(self, since: Optional[float] = None, until: Optional[float] = None) -> Iterator[Snapshot]:
+        """Rangeringene med since <= t <= until, eldste først."""
+        for t, rows in self._rows(since, until):
+            yield _snapshot(t, rows)
+
+    def _rows(self, since: Optional[float], until: Optional[float]) -> Iterator[Tuple[int, List[_Row]]]:
+        with self._lock:
+            self._sync()
+            lo = None if since is None else int(since)
+            hi = None if until is None else int(until)
+            start = _HEADER.size if lo is None else self._start_for(lo)
+            end = None if hi is None else self._end_for(hi)
+            buf = self._read(start, end)
+        block = _Block()
+        started = False
+        for _, _, payload in _frames(buf):
+            if not started and payload[0] != _KEY:
+                continue   # delta uten nøkkelramme foran (ødelagt start); hopp til neste nøkkel
+            started = True
+            t, _ = _decode(block, payload)
+            if hi is not None and t > hi:
+                return
+            if lo is None or t >= lo:
+                yield t, block.prev
+
+    def at(self, t: Optional[float] = None) -> Optional[Snapshot]:
+        """Siste rangering med tidspunkt <= t (None = nyeste)."""
+        t = int(self.clock() if t is None else t)
+        with self._lock:
+            self._sync()
+            i = bisect_right(self._key_ts, t) - 1
+            if i < 0:
+                return None
+            buf = self._read(self._key_off[i], self._end_for(t))
+        block = _Block()
+        found: Optional[Tuple[int, List[_Row]]] = None
+        for _, _, payload in _frames(buf):
+            ft, _ = _decode(block, payload)
+            if ft > t:
+                break
+            found = (ft, block.prev)
+        return None if found is None else _snapshot(*found)
+
+    def rank_over_time(self, pid: str, since: Optional[float] = None,
+                       until: Optional[float] = None) -> List[dict]:
+        """Plass (1 = best, None = utenfor listen), score og pris per rangering."""
+        out = []
+        for t, rows in self._rows(since, until):
+            for i, (p, s, pc) in enumerate(rows):
+                if p == pid:
+                    out.append({"t": t, "rank": i + 1, "score": s / SCORE_SCALE,
+                                "price": None if pc == 0 else (pc - 1) / 100})
+                    break
+            else:
+                out.append({"t": t, "rank": None, "score": None, "price": None})
+        return out
+
+    def movers(self, t1: float, t2: float, limit: int = 10) -> dict:
+        """Endring i plass fra rangeringen ved t1 til den ved t2."""
+        a, b = self.at(t1), self.at(t2)
+        ra = a.ranks() if a else {}
+        rb = b.ranks() if b else {}
+        moved = [{"id": pid, "from": ra[pid], "to": r, "change": ra[pid] - r}
+                 for pid, r in rb.items() if pid in ra and ra[pid] != r]
+        up = sorted((m for m in moved if m["change"] > 0), key=lambda m: (-m["change"], m["to"]))
+        down = sorted((m for m in moved if m["change"] < 0), key=lambda m: (m["change"], m["to"]))
+        return {
+            "from": a.t if a else None,
+            "to": b.t if b else None,
+            "up": up[:limit],
+            "down": down[:limit],
+            "new": [{"id": pid, "to": r} for pid, r in sorted(rb.items(), key=lambda x: x[1]) if pid not in ra][:limit],
+            "dropped": [{"id": pid, "from": r} for pid, r in sorted(ra.items(), key=lambda x: x[1]) if pid not in rb][:limit],
+        }
+
+    # -------- skriving --------
+    def _open_writer(self) -> None:
+        """Gjenoppbygg koderens tilstand fra siste nøkkelramme; kutt avrevet hale."""
+        self._sync()
+        if self._header() is None:
+            size = (self._stat() or (0, 0))[1]
+            if size:
+                print(f"[WARN] rank history {self.path}: unknown format, starting a new log")
+                if self.path:
+                    try:
+                        os.replace(self.path, self.path + ".corrupt")
+                    except OSError:
+                        pass
+            self._reset(int.from_bytes(os.urandom(4), "little"))
+        start = self._key_off[-1] if self._key_off else _HEADER.size
+        buf = self._read(start)
+        block = _Block()
+        end = start
+        for _, fend, payload in _frames(buf):
+            if payload[0] != _KEY and not block.frames:
+                break
+            _decode(block, payload)
+            end = start + fend
+        total = (self._stat() or (0, 0))[1]
+        if end < total:
+            print(f"[WARN] rank history: dropping {total - end} bytes of torn tail")
+            self._truncate(end)
+        self._writer, self._end = block, end
+
+    def _reset(self, gen: int) -> None:
+        head = _HEADER.pack(_LOG_MAGIC, gen)
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "wb") as f:
+                f.write(head)
+            with open(self.idx_path, "wb") as f:
+                f.write(_HEADER.pack(_IDX_MAGIC, gen))
+        else:
+            self._mem = bytearray(head)
+        self._gen, self._key_ts, self._key_off, self._seen = gen, [], [], self._stat()
+
+    def _truncate(self, end: int) -> None:
+        if self.path:
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+        else:
+            del self._mem[end:]
+        self._key_off = [o for o in self._key_off if o < end]
+        self._key_ts = self._key_ts[:len(self._key_off)]
+        self._seen = self._stat()
+
+    def _write(self, frame: bytes, t: int, key: bool) -> None:
+        if self.path:
+            with open(self.path, "ab") as f:
+                f.write(frame)
+            if key:
+                with open(self.idx_path, "ab") as f:
+                    f.write(_IDX_ENTRY.pack(t, self._end))
+        else:
+            self._mem += frame
+        if key:
+            self._key_ts.append(t)
+            self._key_off.append(self._end)
+        self._end += len(frame)
+        self._seen = self._stat()
+
+    def append(self, entries: Sequence[Tuple[str, float, Optional[float]]], t: Optional[float] = None) -> int:
+        """Legg til én rangering (beste først). Returnerer antall bytes skrevet."""
+        t = int(self.clock() if t is None else t)
+        rows = [(pid, round(score * SCORE_SCALE), _price_code(price)) for pid, score, price in entries]
+        with self._wlock, file_lock(self.lock_path):
+            with self._lock:
+                try:
+                    # en annen prosess kan ha skrevet siden sist: bygg koderen på nytt
+                    if self._writer is None or self._stat() != self._seen:
+                        self._open_writer()
+                    block = self._writer
+                    t = max(t, block.t)   # tidspunktene i loggen er stigende (indeksen bisect-es)
+                    key = not block.frames or block.frames >= self.key_every
+                    frame = _encode(block, t, rows, key)
+                    self._write(frame, t, key)
+                except OSError as e:
+                    print(f"[WARN] rank history write failed: {e}")
+                    self._writer = None
+                    return 0
+                self.appends += 1
+                self._appended += 1
+            if self.compact_every > 0 and self._appended >= self.compact_every:
+                self._compact(int(self.clock()))
+        return len(frame)
+
+    def record(self, items: Sequence[dict], t: Optional[float] = None) -> int:
+        """Fra get_top_sellers()-dicts."""
+        return self.append([(p["id"], float(p.get("score") or 0.0), p.get("price")) for p in items], t)
+
+    # -------- komprimering --------
+    def _kept(self, now: int) -> Iterator[Tuple[int, List[_Row]]]:
+        cutoff = now - self.retention_days * DAY if self.retention_days > 0 else None
+        hourly = now - self.hourly_days * DAY if self.hourly_days > 0 else None
+        prev: Optional[List[_Row]] = None
+        pending: Optional[Tuple[int, List[_Row]]] = None   # siste rangering i døgnet (nedsampling)
+        for t, rows in self._rows(cutoff, None):
+            if pending is not None and (t >= hourly or pending[0] // DAY != t // DAY):
+                if pending[1] != prev:
+                    prev = pending[1]
+                    yield pending
+                pending = None
+            if hourly is not None and t < hourly:
+                pending = (t, rows)
+            elif rows != prev:
+                prev = rows
+                yield t, rows
+        if pending is not None and pending[1] != prev:
+            yield pending
+
+    def compact(self, now: Optional[float] = None) -> dict:
+        """Skriv loggen på nytt (se modul-doc). Lesere ser enten gammel eller ny logg."""
+        with self._wlock, file_lock(self.lock_path):
+            return self._compact(int(self.clock() if now is None else now))
+
+    def _compact(self, now: int) -> dict:
+        t0 = time.perf_counter()
+        before = (self._stat() or (0, 0))[1]
+        gen = (self._gen + 1) & 0xFFFFFFFF
+        out = bytearray(_HEADER.pack(_LOG_MAGIC, gen))
+        idx = bytearray(_HEADER.pack(_IDX_MAGIC, gen))
+        block = _Block()
+        kept = 0
+        for t, rows in self._kept(now):
+            key = not block.frames or block.frames >= self.key_every
+            if key:
+                idx += _IDX_ENTRY.pack(t, len(out))
+            out += _encode(block, t, rows, key)
+            kept += 1
+        with self._lock:
+            try:
+                if self.path:
+                    for dst, data in ((self.path, out), (self.idx_path, idx)):
+                        tmp = f"{dst}.{os.getpid()}.tmp"
+                        with open(tmp, "wb") as f:
+                            f.write(data)
+                        os.replace(tmp, dst)
+                else:
+                    self._mem = out
+            except OSError as e:
+                print(f"[WARN] rank history compaction failed: {e}")
+                return {}
+            self._seen, self._writer, self._appended = None, None, 0
+            self.compactions += 1
+        return {"snapshots": kept, "bytes_before": before, "bytes_after": len(out),
+                "seconds": round(time.perf_counter() - t0, 3)}
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._sync()
+            size = (self._stat() or (0, 0))[1]
+            return {"path": self.path or None, "bytes": size, "key_frames": len(self._key_off),
+                    "first": self._key_ts[0] if self._key_ts else None,
+                    "appends": self.appends, "compactions": self.compactions}
+
+
+HISTORY = RankHistory()
@@ -0,0 +1,69 @@
+# ratelimit.py
+"""
+Token bucket for endepunkter som gir sideeffekter utad (Discord, GitHub).
+
+- rate tokens per sekund fylles på, opptil burst; hvert kall bruker ett
+- take() returnerer 0 når kallet slippes inn, ellers sekunder til neste token
+  (brukes som Retry-After i 429-svaret)
+- Per worker-prosess: med N workere er total grense N x rate
+
+ENV (brukes av main.py):
+- TRIGGER_RATE_PER_MIN  (default: 6; /trigger/*, egen bøtte per trigger)
+- TRIGGER_BURST         (default: 3)
+- PING_RATE_PER_MIN     (default: 6; /debug/ping)
+- PING_BURST            (default: 3)
+"""
+from __future__ import annotations
+from typing import Callable
+import os
+import time
+
+import metrics
+
+LIMITED = metrics.counter("pbw_rate_limited_total", "Requests rejected by token bucket", ("bucket",))
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "").strip() or default)
+    except ValueError:
+        return default
+
+
+TRIGGER_RATE = _env_float("TRIGGER_RATE_PER_MIN", 6) / 60
+TRIGGER_BURST = _env_float("TRIGGER_BURST", 3)
+PING_RATE = _env_float("PING_RATE_PER_MIN", 6) / 60
+PING_BURST = _env_float("PING_BURST", 3)
+
+
+class TokenBucket:
+    def __init__(self, name: str, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.rate = max(rate, 1e-9)
+        self.burst = max(burst, 1.0)
+        self.clock = clock
+        self.tokens = self.burst
+        self.updated = clock()
+        self.allowed = 0
+        self.rejected = 0
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, n: float = 1.0) -> float:
+        """0 = sluppet inn; ellers sekunder til det er nok tokens."""
+        self._refill()
+        if self.tokens >= n:
+            self.tokens -= n
+            self.allowed += 1
+            return 0.0
+        self.rejected += 1
+        LIMITED.inc(self.name)
+        return (n - self.tokens) / self.rate
+
+    def stats(self) -> dict:
+        self._refill()
+        return {"tokens": round(self.tokens, 2), "rate_per_min": round(self.rate * 60, 2),
+                "burst": self.burst, "allowed": self.allowed, "rejected": self.rejected}
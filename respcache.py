@@ -0,0 +1,135 @@
+# respcache.py
+"""
+Versjonert respons-cache for sider som bare endres når katalogen endres.
+
+- Nøkkel: (rute, katalog-versjon). Ny versjon => bygges på nytt ved neste hit.
+- Lagrer ferdig-encodede bytes + gzip-variant.
+- Sterk ETag per representasjon: gzip-varianten får "-gzip"-suffiks, så en 304
+  aldri bekrefter feil koding bak Vary: Accept-Encoding. If-None-Match besvares
+  med 304 før noe sendes.
+- Accept-Encoding forhandles med q-verdier (choose_encoding, delt med static_pages),
+  så "gzip;q=0" gir identity
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+import gzip
+import hashlib
+
+from fastapi import Request
+from fastapi.responses import Response
+
+CACHE_CONTROL = "public, max-age=60"
+MIN_GZIP_BYTES = 512   # under dette lønner det seg ikke å komprimere
+
+
+@dataclass(frozen=True)
+class CachedBody:
+    version: int
+    etag: str
+    media_type: str
+    body: bytes
+    gzip_body: Optional[bytes]
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """ETag for en Content-Encoding-variant ("abc" -> "abc-gzip"); identity beholder taggen."""
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def _accepted(header: str) -> Dict[str, float]:
+    """Accept-Encoding -> {koding: q}."""
+    out: Dict[str, float] = {}
+    for part in header.lower().split(","):
+        name, *params = (s.strip() for s in part.split(";"))
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        out[name] = q
+    return out
+
+
+def choose_encoding(accept_encoding: str, available) -> Optional[str]:
+    """Beste tilgjengelige koding (br foretrekkes ved lik q), eller None = identity."""
+    acc = _accepted(accept_encoding or "")
+    best, best_q = None, 0.0
+    for enc in ("br", "gzip"):
+        if enc not in available:
+            continue
+        q = acc.get(enc, acc.get("*", 0.0))
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+def make_body(version: int, body: bytes, media_type: str) -> CachedBody:
+    gz = gzip.compress(body, compresslevel=6, mtime=0) if len(body) >= MIN_GZIP_BYTES else None
+    if gz is not None and len(gz) >= len(body):
+        gz = None
+    return CachedBody(version, etag_for(body), media_type, body, gz)
+
+
+def not_modified(etag: str, cache_control: str = CACHE_CONTROL) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control,
+                                              "Vary": "Accept-Encoding"})
+
+
+def _encoding(request: Request, entry: CachedBody) -> Optional[str]:
+    if entry.gzip_body is None:
+        return None
+    return choose_encoding(request.headers.get("accept-encoding", ""), ("gzip",))
+
+
+def send_body(request: Request, entry: CachedBody, cache_control: str = CACHE_CONTROL) -> Response:
+    enc = _encoding(request, entry)
+    headers = {"ETag": encoded_etag(entry.etag, enc), "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if enc == "gzip":
+        headers["Content-Encoding"] = "gzip"
+        return Response(entry.gzip_body, media_type=entry.media_type, headers=headers)
+    return Response(entry.body, media_type=entry.media_type, headers=headers)
+
+
+class ResponseCache:
+    def __init__(self):
+        self._entries: Dict[str, CachedBody] = {}
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    async def respond(self, request: Request, key: str, version: int,
+                      build: Callable[[], Awaitable[bytes]], media_type: str) -> Response:
+        """
+        Svar fra cache hvis versjonen stemmer, ellers bygg på nytt med build().
+        Gyldig If-None-Match gir 304 uten å kalle build().
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry.version != version:
+            entry = make_body(version, await build(), media_type)
+            self._entries[key] = entry
+        etag = encoded_etag(entry.etag, _encoding(request, entry))
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag)
+        return send_body(request, entry)
@@ -0,0 +1,357 @@
+# scheduler.py
+"""
+Felles jobb-scheduler (erstatter while True + asyncio.sleep-løkkene).
+
+- Én timer-heap og én bakgrunnstask for alle jobber
+- Regler: Interval(sek) og Cron("min time dag mnd ukedag", tz)
+- Neste kjøring regnes fra planlagt tid, ikke fra når jobben ble ferdig (ingen drift)
+- Jitter, maks samtidige kjøringer per jobb, misfire-policy "catchup" eller "skip"
+- Tilstand (sist fullførte planlagte kjøring per jobb) lagres i en JSON-fil når
+  kjøringen er ferdig, så en restart verken dobbel-fyrer eller hopper over f.eks.
+  08:00 Oslo; en kjøring som ble avbrutt av krasj/restart tas igjen (misfire-policy).
+  Interval-jobber med persist=False starter på nytt fra initial_delay ved oppstart
+- Varighet, forsinkelse (lag) og utfall per jobb eksporteres via metrics
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+import asyncio
+import heapq
+import json
+import os
+import random
+import time
+
+import metrics
+
+STATE_PATH = os.getenv("SCHEDULER_STATE", "data/scheduler_state.json")
+MAX_SLEEP = 60.0   # sjekk veggklokka minst så ofte (NTP/suspend)
+
+
+# -------- regler --------
+class Interval:
+    def __init__(self, seconds: float, initial_delay: Optional[float] = None):
+        self.seconds = max(float(seconds), 1.0)
+        self.initial_delay = self.seconds if initial_delay is None else initial_delay
+
+    def first(self, now: float) -> float:
+        return now + self.initial_delay
+
+    def next_after(self, t: float) -> float:
+        return t + self.seconds
+
+    def __repr__(self) -> str:
+        return f"Interval({self.seconds:g}s)"
+
+
+def _parse_field(spec: str, lo: int, hi: int) -> Set[int]:
+    out: Set[int] = set()
+    for part in spec.split(","):
+        rng, _, step = part.partition("/")
+        step_n = int(step) if step else 1
+        if rng in ("*", ""):
+            a, b = lo, hi
+        elif "-" in rng:
+            a, b = (int(x) for x in rng.split("-", 1))
+        else:
+            a = int(rng)
+            b = hi if step else a
+        if a < lo or b > hi or a > b:
+            raise ValueError(f"cron field out of range: {spec!r}")
+        out.update(range(a, b + 1, step_n))
+    return out
+
+
+class Cron:
+    """
+    Standard 5-felts cron i en gitt tidssone, f.eks. Cron("0 8 * * *", "Europe/Oslo").
+    Ukedag: 0/7 = søndag.
+    """
+
+    def __init__(self, expr: str, tz="UTC"):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron needs 5 fields: {expr!r}")
+        self.expr = expr
+        self.tz = ZoneInfo(tz) if isinstance(tz, str) else tz
+        self.minutes = sorted(_parse_field(fields[0], 0, 59))
+        self.hours = sorted(_parse_field(fields[1], 0, 23))
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in _parse_field(fields[4], 0, 7)}
+        self._any_day = fields[2] == "*"
+        self._any_wday = fields[4] == "*"
+
+    def _day_ok(self, d: datetime) -> bool:
+        if d.month not in self.months:
+            return False
+        dom = d.day in self.days
+        dow = (d.isoweekday() % 7) in self.weekdays
+        # cron-regel: begrenses begge, holder det at én matcher
+        if self._any_day:
+            return dow
+        if self._any_wday:
+            return dom
+        return dom or dow
+
+    def first(self, now: float) -> float:
+        return self.next_after(now)
+
+    def next_after(self, t: float) -> float:
+        local = datetime.fromtimestamp(t, self.tz).replace(second=0, microsecond=0)
+        day = local.replace(hour=0, minute=0)
+        for _ in range(366 * 5):
+            if self._day_ok(day):
+                for h in self.hours:
+                    for m in self.minutes:
+                        cand = day.replace(hour=h, minute=m)
+                        ts = cand.timestamp()
+                        if ts > t:
+                            return ts
+            day = (day + timedelta(days=1)).replace(hour=0, minute=0)
+        raise ValueError(f"cron never fires: {self.expr!r}")
+
+    def __repr__(self) -> str:
+        return f"Cron({self.expr!r}, {self.tz.key})"
+
+
+def daily(hour: int, minute: int = 0, tz="UTC") -> Cron:
+    return Cron(f"{minute} {hour} * * *", tz)
+
+
+# -------- jobber --------
+JobFunc = Callable[[], Awaitable[object]]
+
+
+@dataclass
+class Job:
+    name: str
+    func: JobFunc
+    rule: object
+    jitter: float = 0.0
+    max_concurrency: int = 1
+    misfire: str = "skip"          # "skip" eller "catchup"
+    max_catchup: int = 1
+    timeout: Optional[float] = None
+    persist: bool = True           # lagre sist fullførte planlagte kjøring i state-fila
+
+    # runtime / metrikk
+    next_due: float = 0.0
+    last_due: Optional[float] = None
+    running: int = 0
+    runs: int = 0
+    failures: int = 0
+    skipped: int = 0               # hoppet over pga max_concurrency
+    skipped_due: float = 0.0       # siste hoppet over; lagres når kjøringen som sperret er ferdig
+    catchups: int = 0
+    last_error: Optional[str] = None
+    last_duration: Optional[float] = None
+    total_duration: float = 0.0
+    max_duration: float = 0.0
+    last_lag: Optional[float] = None
+    max_lag: float = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "rule": repr(self.rule),
+            "next_due": _iso(self.next_due),
+            "last_due": _iso(self.last_due),
+            "running": self.running,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "catchups": self.catchups,
+            "last_error": self.last_error,
+            "last_duration_s": _r(self.last_duration),
+            "avg_duration_s": _r(self.total_duration / self.runs) if self.runs else None,
+            "max_duration_s": _r(self.max_duration),
+            "last_lag_s": _r(self.last_lag),
+            "max_lag_s": _r(self.max_lag),
+        }
+
+
+def _iso(t: Optional[float]) -> Optional[str]:
+    if not t:
+        return None
+    return datetime.fromtimestamp(t, timezone.utc).isoformat(timespec="seconds")
+
+
+def _r(x: Optional[float]) -> Optional[float]:
+    return None if x is None else round(x, 4)
+
+
+class Scheduler:
+    def __init__(self, state_path: Optional[str] = STATE_PATH, clock: Callable[[], float] = time.time):
+        self.state_path = state_path
+        self.clock = clock
+        self.jobs: Dict[str, Job] = {}
+        self._heap: List[Tuple[float, int, Job, float]] = []   # (fire_at, seq, jobb, due)
+        self._seq = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+        self._state: Dict[str, float] = self._load_state()
+
+    # -------- tilstand --------
+    def _load_state(self) -> Dict[str, float]:
+        if not self.state_path:
+            return {}
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return {k: float(v) for k, v in json.load(f).items()}
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def _save_state(self) -> None:
+        if not self.state_path:
+            return
+        # fila kan deles med andre prosesser: skriv bare våre egne jobber over
+        merged = self._load_state()
+        merged.update({n: self._state[n] for n, j in self.jobs.items() if j.persist and n in self._state})
+        try:
+            os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+            tmp = f"{self.state_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(merged, f)
+            os.replace(tmp, self.state_path)
+        except OSError as e:
+            print(f"[WARN] scheduler state write failed: {e}")
+
+    # -------- registrering --------
+    def add(self, name: str, func: JobFunc, rule, **opts) -> Job:
+        job = Job(name=name, func=func, rule=rule, **opts)
+        self.jobs[name] = job
+        now = self.clock()
+        # en annen prosess (forrige leder) kan ha skrevet tilstanden siden oppstart
+        self._state.update(self._load_state())
+        last = self._state.get(name)
+        if last is None:
+            job.next_due = rule.first(now)
+        else:
+            job.last_due = last
+            job.next_due = rule.next_after(last)
+            if job.next_due <= now:
+                job.next_due = self._misfire(job, now)
+        self._push(job, job.next_due)
+        return job
+
+    def remove(self, name: str) -> bool:
+        """Fjern jobben (kjøring som pågår får fullføre). Ventende heap-oppføringer ignoreres."""
+        return self.jobs.pop(name, None) is not None
+
+    def _misfire(self, job: Job, now: float) -> float:
+        """Planlagte kjøringer ble bommet (f.eks. under restart)."""
+        if job.misfire == "catchup":
+            missed, due = 0, job.next_due
+            while due <= now and missed < job.max_catchup:
+                self._push(job, due, fire_at=now)
+                missed += 1
+                due = job.rule.next_after(due)
+            job.catchups += missed
+        return job.rule.next_after(now)
+
+    def _push(self, job: Job, due: float, fire_at: Optional[float] = None) -> None:
+        if fire_at is None:
+            fire_at = due + (random.uniform(0, job.jitter) if job.jitter else 0.0)
+        self._seq += 1
+        heapq.heappush(self._heap, (fire_at, self._seq, job, due))
+        if self._wake is not None:
+            self._wake.set()
+
+    # -------- livssyklus --------
+    def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        tasks = [t for t in (self._task, *self._running) if t is not None]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._running.clear()
+
+    def stats(self) -> Dict[str, dict]:
+        return {name: job.stats() for name, job in self.jobs.items()}
+
+    # -------- kjerne --------
+    async def _loop(self) -> None:
+        assert self._wake is not None
+        while True:
+            self._wake.clear()
+            if not self._heap:
+                await self._wake.wait()
+                continue
+            fire_at, _, job, due = self._heap[0]
+            delay = fire_at - self.clock()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=min(delay, MAX_SLEEP))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            if self.jobs.get(job.name) is not job:   # fjernet eller erstattet
+                continue
+            self._fire(job, due)
+            if due >= job.next_due:   # catch-up-kjøringer planlegger ikke på nytt
+                job.next_due = job.rule.next_after(due)
+                self._push(job, job.next_due)
+
+    def _fire(self, job: Job, due: float) -> None:
+        job.last_due = due
+        if job.running >= job.max_concurrency:
+            job.skipped += 1
+            job.skipped_due = max(job.skipped_due, due)
+            return
+        # telles før tasken starter: catch-up-kjøringer fra samme runde ser hverandre
+        job.running += 1
+        task = asyncio.create_task(self._execute(job, due))
+        self._running.add(task)
+        task.add_done_callback(lambda t: self._finished(job, t))
+
+    def _finished(self, job: Job, task: asyncio.Task) -> None:
+        # i done-callback, ikke finally: en task som avbrytes før den starter kjører aldri finally
+        job.running -= 1
+        self._running.discard(task)
+
+    def _done(self, job: Job, due: float) -> None:
+        """Kjøringen for due er ferdig; lagres først nå, så et krasj midt i den tas igjen."""
+        if job.running <= 1:   # ingen andre kjører: det som ble hoppet over imens er dekket
+            due = max(due, job.skipped_due)
+        if job.persist and due > self._state.get(job.name, float("-inf")):
+            self._state[job.name] = due
+            self._save_state()
+
+    async def _execute(self, job: Job, due: float) -> None:
+        start = self.clock()
+        lag = max(start - due, 0.0)
+        t0 = time.perf_counter()
+        result = "ok"
+        try:
+            if job.timeout:
+                await asyncio.wait_for(job.func(), timeout=job.timeout)
+            else:
+                await job.func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            result = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            job.failures += 1
+            job.last_error = f"{type(e).__name__}: {e}"[:200]
+            print(f"[WARN] job {job.name} failed: {job.last_error}")
+        self._done(job, due)   # også ved feil: bare avbrutte kjøringer tas igjen
+        dur = time.perf_counter() - t0
+        job.runs += 1
+        job.last_duration = dur
+        job.total_duration += dur
+        job.max_duration = max(job.max_duration, dur)
+        job.last_lag = lag
+        job.max_lag = max(job.max_lag, lag)
+        metrics.JOB_RUNS.inc(job.name, result)
+        metrics.JOB_DURATION.observe(dur, job.name)
+        metrics.JOB_LAG.observe(lag, job.name)
@@ -0,0 +1,439 @@
+# search.py
+"""
+Søk, fasetter og filtre over katalogen (/search).
+
+- Invertert indeks: token -> sett av dokumentnumre, over tittel og tags
+  (flere tekstfelt, f.eks. beskrivelse, legges til i _doc_text)
+- Alle ord i spørringen må treffe (AND); siste ord (minst PREFIX_MIN tegn)
+  matcher også som prefiks (søk mens du skriver), utvidet til de
+  PREFIX_EXPAND vanligste tokens som starter med det
+- Fasetter: kategori og tag -> sett, med antall for gjeldende treffmengde.
+  Verdier med mange produkter har også en bitmap (Python-int), så antall for
+  store treffmengder er (bitmap & treff).bit_count() i stedet for settsnitt
+- Pris- og score-filtre via sorterte indekser (bisect) når intervallet er mer
+  selektivt enn resten av spørringen; ellers sjekkes treffene direkte
+- Sortering: rank (katalogens ranking), price_asc, price_desc. Tette
+  treffmengder leses i sortert rekkefølge til siden er full; små sorteres
+- Oppdateres inkrementelt: katalog-lytterne (upsert/remove og score-endringer)
+  tar ingen lås, de legger bare id-ene i en kø som tas inn først i neste søk.
+  Slik blokkerer aldri en katalogendring på event-loopen mens et søk eller en
+  ombygging kjører i en tråd. load() (eller over PENDING_MAX ventende) gir full
+  ombygging ved neste søk; score-indeksen flyttes per endret produkt
+"""
+from __future__ import annotations
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+import heapq
+import math
+import re
+import sys
+import threading
+import time
+import unicodedata
+
+import metrics
+from products import CATALOG, Product, rank_key
+
+PREFIX_MIN = 2          # korteste prefiks som utvides
+PREFIX_EXPAND = 64      # maks antall tokens et prefiks utvides til (de med flest treff)
+PREFIX_SCAN = 2048      # maks antall kandidat-tokens som vurderes per prefiks
+WALK_COST = 12          # å sortere ett treff koster omtrent like mye som å lese så mange i rekkefølge
+MAX_OFFSET = 10_000
+TOP_TAGS = 20
+BITMAP_MIN = 64         # fasettverdier med færre produkter klarer seg med sett
+SORTS = ("rank", "price_asc", "price_desc")
+PENDING_MAX = 20_000    # flere ventende endringer enn dette => full ombygging i stedet
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    text = text.casefold()
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return _WORD.findall(text)
+
+
+def _doc_text(p: Product) -> str:
+    return p.title + " " + " ".join(p.tags)
+
+
+class _SortedIndex:
+    """Sortert liste av (verdi, dok); intervall-oppslag med bisect."""
+
+    def __init__(self, pairs: Iterable[Tuple[float, int]] = ()):
+        self.items: List[Tuple[float, int]] = sorted(pairs)
+
+    def add(self, value: float, doc: int) -> None:
+        insort(self.items, (value, doc))
+
+    def discard(self, value: float, doc: int) -> None:
+        i = bisect_left(self.items, (value, doc))
+        if i < len(self.items) and self.items[i] == (value, doc):
+            del self.items[i]
+
+    def bounds(self, lo: float, hi: float) -> Tuple[int, int]:
+        return bisect_left(self.items, (lo, -1)), bisect_right(self.items, (hi, math.inf))
+
+
+class SearchIndex:
+    def __init__(self, catalog=CATALOG):
+        self.catalog = catalog
+        self._lock = threading.RLock()
+        self._dirty = True
+        self._scores_dirty = False
+        self._pending: Deque[str] = deque()          # id-er endret siden forrige søk
+        self._pending_scores: Deque[str] = deque()   # id-er med ny score siden forrige søk
+        self.builds = 0
+        self._reset()
+        catalog.add_listener(self._on_change)
+        catalog.add_score_listener(self._on_scores)
+
+    # -------- bygging / vedlikehold --------
+    def _reset(self) -> None:
+        self._doc: Dict[str, int] = {}
+        self._pids: List[Optional[str]] = []
+        self._terms: List[Tuple[str, ...]] = []
+        self._cats: List[str] = []
+        self._tags: List[Tuple[str, ...]] = []
+        self._prices: List[Optional[float]] = []
+        self._free: List[int] = []                  # gjenbrukbare dokumentnumre
+        self._postings: Dict[str, Set[int]] = {}
+        self._vocab: List[str] = []                 # sortert, for prefiks-oppslag
+        self._by_cat: Dict[str, Set[int]] = {}
+        self._by_tag: Dict[str, Set[int]] = {}
+        self._cat_bits: Dict[str, int] = {}
+        self._tag_bits: Dict[str, int] = {}
+        self._no_price: Set[int] = set()
+        self._price_idx = _SortedIndex()
+        self._scores: List[Optional[float]] = []
+        self._score_idx = _SortedIndex()
+
+    # Lytterne kalles fra katalogen (ofte på event-loopen) og må aldri vente på
+    # self._lock, som et søk i en worker-tråd kan holde lenge; deque.extend er trådsikker.
+    def _on_change(self, pids: Optional[List[str]]) -> None:
+        if pids is None or len(self._pending) > PENDING_MAX:
+            self._dirty = True
+        else:
+            self._pending.extend(pids)
+
+    def _on_scores(self, pids: Optional[List[str]]) -> None:
+        if pids is None or len(self._pending_scores) > PENDING_MAX:
+            self._scores_dirty = True
+        else:
+            self._pending_scores.extend(pids)
+
+    def _sync(self) -> None:
+        """Ta inn ventende katalogendringer; kall under self._lock."""
+        if self._dirty:
+            # tøm køene før ombyggingen leser katalogen: det som kommer etterpå tas neste gang
+            self._pending.clear()
+            self._pending_scores.clear()
+            self._scores_dirty = False
+            self._rebuild()
+            return
+        changed = _drain(self._pending)
+        for pid in changed:
+            self._remove(pid)
+            p = self.catalog.get(pid)
+            if p is not None:
+                self._add(p, incremental=True)
+        rescored = _drain(self._pending_scores) - changed
+        if self._scores_dirty or len(rescored) * 32 > len(self._doc):
+            self._scores_dirty = False
+            self._reindex_scores()
+        else:
+            for pid in rescored:
+                d = self._doc.get(pid)
+                p = self.catalog.get(pid) if d is not None else None
+                if p is not None and p.score != self._scores[d]:
+                    self._score_idx.discard(self._scores[d], d)
+                    self._scores[d] = p.score
+                    self._score_idx.add(p.score, d)
+
+    def _reindex_scores(self) -> None:
+        """Les alle scorer på nytt fra katalogen og bygg score-indeksen (mange endringer)."""
+        get, scores = self.catalog.get, self._scores
+        for pid, d in self._doc.items():
+            p = get(pid)
+            if p is not None:
+                scores[d] = p.score
+        self._score_idx = _SortedIndex((v, d) for d, v in enumerate(scores) if v is not None)
+
+    def _rebuild(self) -> None:
+        t0 = time.perf_counter()
+        self._reset()
+        version = self.catalog.version
+        for p in self.catalog.iter_ranked():
+            self._add(p, incremental=False)
+        self._vocab = sorted(self._postings)
+        self._price_idx = _SortedIndex((v, d) for d, v in enumerate(self._prices) if v is not None)
+        self._score_idx = _SortedIndex((v, d) for d, v in enumerate(self._scores) if v is not None)
+        for groups, bits in ((self._by_cat, self._cat_bits), (self._by_tag, self._tag_bits)):
+            for k, docs in groups.items():
+                if len(docs) >= BITMAP_MIN:
+                    bits[k] = _to_bits(docs)
+        self._dirty = False
+        self.builds += 1
+        if self.catalog.version != version:
+            self._dirty = True   # endret under byggingen; ta det igjen neste gang
+        metrics.RANKING.observe(time.perf_counter() - t0, "search_build")
+
+    def _add(self, p: Product, incremental: bool) -> None:
+        if self._free:
+            d = self._free.pop()
+        else:
+            d = len(self._pids)
+            for col in (self._pids, self._terms, self._cats, self._tags, self._prices, self._scores):
+                col.append(None)
+        terms = tuple(map(sys.intern, set(tokenize(_doc_text(p)))))   # én strengkopi per token
+        self._doc[p.id] = d
+        self._pids[d], self._terms[d], self._cats[d] = p.id, terms, p.category
+        self._tags[d], self._prices[d], self._scores[d] = p.tags, p.price, p.score
+        for t in terms:
+            posting = self._postings.get(t)
+            if posting is None:
+                posting = self._postings[t] = set()
+                if incremental:
+                    insort(self._vocab, t)
+            posting.add(d)
+        if p.category:
+            _add(self._by_cat, self._cat_bits, p.category, d)
+        for tag in p.tags:
+            _add(self._by_tag, self._tag_bits, tag, d)
+        if p.price is None:
+            self._no_price.add(d)
+        elif incremental:
+            self._price_idx.add(p.price, d)
+        if incremental:
+            self._score_idx.add(p.score, d)
+
+    def _remove(self, pid: str) -> None:
+        d = self._doc.pop(pid, None)
+        if d is None:
+            return
+        for t in self._terms[d]:
+            posting = self._postings[t]
+            posting.discard(d)
+            if not posting:
+                del self._postings[t]
+                i = bisect_left(self._vocab, t)
+                if i < len(self._vocab) and self._vocab[i] == t:
+                    del self._vocab[i]
+        _discard(self._by_cat, self._cat_bits, self._cats[d], d)
+        for tag in self._tags[d]:
+            _discard(self._by_tag, self._tag_bits, tag, d)
+        if self._prices[d] is None:
+            self._no_price.discard(d)
+        else:
+            self._price_idx.discard(self._prices[d], d)
+        self._score_idx.discard(self._scores[d], d)
+        self._pids[d], self._terms[d], self._tags[d] = None, (), ()
+        self._prices[d] = self._scores[d] = None
+        self._free.append(d)
+
+    # -------- spørring --------
+    def _text(self, q: str) -> Optional[List[Set[int]]]:
+        terms = tokenize(q)
+        if not terms:
+            return None
+        sets = [self._postings.get(t, _EMPTY) for t in terms[:-1]]
+        last = terms[-1]
+        exact = self._postings.get(last, _EMPTY)
+        if len(last) >= PREFIX_MIN:
+            i = bisect_left(self._vocab, last)
+            words = [w for w in self._vocab[i:i + PREFIX_SCAN] if w != last and w.startswith(last)]
+            if len(words) > PREFIX_EXPAND:   # de vanligste fullføringene
+                words = heapq.nlargest(PREFIX_EXPAND, words, key=lambda w: len(self._postings[w]))
+            if words:
+                exact = exact.union(*(self._postings[w] for w in words))
+        sets.append(exact)
+        return sets
+
+    def _range(self, cand: Optional[Set[int]], idx: _SortedIndex, values: Sequence,
+               lo: Optional[float], hi: Optional[float]) -> Set[int]:
+        lo = -math.inf if lo is None else lo
+        hi = math.inf if hi is None else hi
+        i, j = idx.bounds(lo, hi)
+        if cand is None or j - i < len(cand) * 4:   # å lage sett av et utsnitt er billigere per rad
+            docs = {d for _, d in idx.items[i:j]}
+            return docs if cand is None else docs & cand
+        return {d for d in cand if values[d] is not None and lo <= values[d] <= hi}
+
+    def _facet(self, groups: Dict[str, Set[int]], bits: Dict[str, int], cand: Optional[Set[int]],
+               cand_bits: Optional[int], values, multi: bool) -> Dict[str, int]:
+        if cand is None:
+            return {k: len(s) for k, s in groups.items()}
+        if cand_bits is None:   # få treff: tell treffene
+            counts: Dict[str, int] = {}
+            get = counts.get
+            for d in cand:
+                for v in (values[d] if multi else (values[d],)):
+                    counts[v] = get(v, 0) + 1
+            counts.pop("", None)
+            return counts
+        out = {}
+        for k, s in groups.items():
+            b = bits.get(k)
+            n = (b & cand_bits).bit_count() if b is not None else len(s & cand)
+            if n:
+                out[k] = n
+        return out
+
+    def _ordered(self, sort: str) -> Iterator[int]:
+        if sort == "rank":
+            for d in map(self._doc.get, self.catalog.iter_ranked_ids()):
+                if d is not None:
+                    yield d
+            return
+        items = self._price_idx.items
+        yield from (d for _, d in (items if sort == "price_asc" else reversed(items)))
+        yield from sorted(self._no_price)
+
+    def _page(self, cand: Optional[Set[int]], sort: str, offset: int, limit: int) -> List[int]:
+        """
+        Les i sortert rekkefølge og hopp over ikke-treff, innenfor et budsjett
+        som tilsvarer å sortere treffene; tynne eller skjeve treff sorteres i stedet.
+        """
+        budget = len(self._doc) if cand is None else len(cand) * WALK_COST
+        out: List[int] = []
+        skip = offset
+        for d in self._ordered(sort):
+            budget -= 1
+            if budget < 0:
+                break
+            if cand is not None and d not in cand:
+                continue
+            if skip:
+                skip -= 1
+                continue
+            out.append(d)
+            if len(out) >= limit:
+                return out
+        if budget >= 0:
+            return out   # lest til enden
+        k = offset + limit
+        if sort == "rank":
+            get, pids = self.catalog.get, self._pids
+            keyed = ((rank_key(p), d) for d in cand for p in (get(pids[d]),) if p is not None)
+            return [d for _, d in heapq.nsmallest(k, keyed)][offset:]
+        prices = self._prices
+        sign = 1 if sort == "price_asc" else -1
+        key = lambda d: (prices[d] is None, sign * (prices[d] or 0.0), d)
+        return heapq.nsmallest(k, cand, key=key)[offset:]
+
+    def search(self, q: str = "", category: Optional[str] = None, tags: Sequence[str] = (),
+               min_price: Optional[float] = None, max_price: Optional[float] = None,
+               min_score: Optional[float] = None, max_score: Optional[float] = None,
+               sort: str = "rank", offset: int = 0, limit: int = 20) -> Dict:
+        """ValueError ved ukjent sortering."""
+        if sort not in SORTS:
+            raise ValueError(f"unknown sort {sort!r}")
+        t0 = time.perf_counter()
+        with self._lock:
+            self._sync()
+            sets = self._text(q) or []
+            facet_bits: List[Optional[int]] = []
+            if category:
+                name = _match(self._by_cat, category)
+                sets.append(self._by_cat.get(name, _EMPTY))
+                facet_bits.append(self._cat_bits.get(name))
+            for tag in tags:
+                tag = tag.strip().lower()
+                sets.append(self._by_tag.get(tag, _EMPTY))
+                facet_bits.append(self._tag_bits.get(tag))
+            cand: Optional[Set[int]] = None
+            cand_bits: Optional[int] = None
+            if sets:
+                if len(facet_bits) == len(sets) and None not in facet_bits:
+                    # bare fasettfiltre: treff-bitmapen er snittet av bitmapene
+                    cand_bits = facet_bits[0]
+                    for b in facet_bits[1:]:
+                        cand_bits &= b
+                sets.sort(key=len)
+                cand = sets[0].intersection(*sets[1:]) if len(sets) > 1 else sets[0]
+            ranged = cand
+            if min_price is not None or max_price is not None:
+                cand = self._range(cand, self._price_idx, self._prices, min_price, max_price)
+            if min_score is not None or max_score is not None:
+                cand = self._range(cand, self._score_idx, self._scores, min_score, max_score)
+            if cand is not None and len(cand) == len(self._doc):
+                cand = None   # alt treffer: fasetter/sider som uten filter
+            total = len(self._doc) if cand is None else len(cand)
+            if cand is not ranged:
+                cand_bits = None
+            if cand is not None and cand_bits is None and total >= max(BITMAP_MIN, len(self._by_tag)):
+                cand_bits = _to_bits(cand)
+            facets = {
+                "category": _sorted_counts(self._facet(self._by_cat, self._cat_bits, cand, cand_bits,
+                                                       self._cats, multi=False)),
+                "tags": _sorted_counts(self._facet(self._by_tag, self._tag_bits, cand, cand_bits,
+                                                   self._tags, multi=True), TOP_TAGS),
+            }
+            docs = self._page(cand, sort, min(offset, MAX_OFFSET), limit)
+            pids = [self._pids[d] for d in docs]
+        items = [p.to_public() for p in map(self.catalog.get, pids) if p is not None]
+        metrics.RANKING.observe(time.perf_counter() - t0, "search")
+        return {"total": total, "offset": offset, "limit": limit, "items": items, "facets": facets}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"docs": len(self._doc), "terms": len(self._postings), "categories": len(self._by_cat),
+                    "tags": len(self._by_tag), "builds": self.builds, "dirty": self._dirty,
+                    "pending": len(self._pending) + len(self._pending_scores)}
+
+
+_EMPTY: Set[int] = frozenset()
+
+
+def _drain(queue: Deque[str]) -> Set[str]:
+    """Tøm køen (popleft er trådsikker mot lytterne) og returner de unike id-ene."""
+    out: Set[str] = set()
+    while queue:
+        out.add(queue.popleft())
+    return out
+
+
+def _to_bits(docs: Iterable[int]) -> int:
+    """Sett av dokumentnumre -> bitmap (bit d satt for hvert dok)."""
+    docs = list(docs)
+    if not docs:
+        return 0
+    buf = bytearray((max(docs) >> 3) + 1)
+    for d in docs:
+        buf[d >> 3] |= 1 << (d & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _add(groups: Dict[str, Set[int]], bits: Dict[str, int], key: str, d: int) -> None:
+    groups.setdefault(key, set()).add(d)
+    if key in bits:
+        bits[key] |= 1 << d
+
+
+def _discard(groups: Dict[str, Set[int]], bits: Dict[str, int], key: str, d: int) -> None:
+    s = groups.get(key)
+    if s is not None:
+        s.discard(d)
+        if not s:
+            del groups[key]
+            bits.pop(key, None)
+        elif key in bits:
+            bits[key] &= ~(1 << d)
+
+
+def _match(groups: Dict[str, Set[int]], name: str) -> str:
+    """Kategori uten hensyn til store/små bokstaver."""
+    if name in groups:
+        return name
+    folded = name.strip().casefold()
+    return next((k for k in groups if k.casefold() == folded), name)
+
+
+def _sorted_counts(counts: Dict[str, int], limit: Optional[int] = None) -> Dict[str, int]:
+    top = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))
+    return dict(top[:limit] if limit else top)
+
+
+INDEX = SearchIndex()
@@ -0,0 +1,127 @@
+# shared_top.py
+"""
+Top-seller-resultatet delt mellom workere via en snapshot-fil.
+
+- Lederen (se leader.py) regner ut topp N og publiserer den atomisk
+  (tmp + os.replace) med et økende sekvensnummer
+- Andre workere leser fila bare når mtime har endret seg (stat maks én gang
+  per sekund), og bruker seq som cache-versjon i respcache
+- Eldre enn TOPSELLER_SHARED_MAX_AGE sek (leder borte) => None, og kalleren
+  regner ut selv som før
+
+ENV:
+- TOPSELLER_SHARED          (default: data/topsellers.shared.json; tom = av)
+- TOPSELLER_SHARED_MAX_AGE  (default: 300 sek)
+- TOPSELLER_SHARED_N        (default: 50 produkter)
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+import json
+import os
+import time
+
+SHARED_PATH = os.getenv("TOPSELLER_SHARED", "data/topsellers.shared.json").strip()
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "").strip() or default)
+    except ValueError:
+        return default
+
+
+MAX_AGE = _env_float("TOPSELLER_SHARED_MAX_AGE", 300.0)
+SHARED_N = int(_env_float("TOPSELLER_SHARED_N", 50))
+CHECK_EVERY = 1.0
+
+
+@dataclass(frozen=True)
+class TopSnapshot:
+    seq: int
+    time: float
+    owner: str
+    items: List[Dict]
+    limit: int          # topp-N listen ble regnet ut for (items kan være færre)
+
+
+class SharedTop:
+    def __init__(self, path: Optional[str] = SHARED_PATH, max_age: float = MAX_AGE,
+                 clock: Callable[[], float] = time.time):
+        self.path = path
+        self.max_age = max_age
+        self.clock = clock
+        self._snap: Optional[TopSnapshot] = None
+        self._mtime: Optional[float] = None
+        self._checked = 0.0
+        self.loads = 0
+        self.publishes = 0
+
+    def _refresh(self) -> None:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            self._snap, self._mtime = None, None
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                raw = json.load(f)
+            self._snap = TopSnapshot(int(raw["seq"]), float(raw["time"]), str(raw.get("owner", "")),
+                                     list(raw["items"]), int(raw.get("limit", len(raw["items"]))))
+            self._mtime = mtime
+            self.loads += 1
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[WARN] shared top-sellers unreadable ({e})")
+
+    def current(self) -> Optional[TopSnapshot]:
+        """Gjeldende snapshot, eller None hvis av/mangler/for gammel."""
+        if not self.path:
+            return None
+        now = self.clock()
+        if now - self._checked >= CHECK_EVERY:
+            self._checked = now
+            self._refresh()
+        snap = self._snap
+        if snap is None or now - snap.time > self.max_age:
+            return None
+        return snap
+
+    def publish(self, items: List[Dict], limit: int, owner: str = "") -> Optional[TopSnapshot]:
+        """
+        Skriv ny snapshot. Uendret liste beholder seq (samme ETag) og skrives bare
+        på nytt for å holde den fersk (etter max_age/2).
+        """
+        if not self.path:
+            return None
+        self._refresh()
+        now = self.clock()
+        old = self._snap
+        same = old is not None and old.items == items and old.limit == limit
+        if same and now - old.time < self.max_age / 2:
+            return old
+        snap = TopSnapshot(old.seq if same else (old.seq if old else 0) + 1, now, owner, items, limit)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"seq": snap.seq, "time": round(now, 3), "owner": owner, "limit": limit, "items": items},
+                      f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self.path)
+        self._snap, self._mtime = snap, os.stat(self.path).st_mtime
+        self.publishes += 1
+        return snap
+
+    def stats(self) -> dict:
+        snap = self._snap
+        return {
+            "path": self.path or None,
+            "seq": snap.seq if snap else None,
+            "age_s": round(self.clock() - snap.time, 1) if snap else None,
+            "owner": snap.owner if snap else None,
+            "loads": self.loads,
+            "publishes": self.publishes,
+        }
+
+
+SHARED = SharedTop()
@@ -1,46 +1,181 @@
 # site_routes.py
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse
-from products import get_top_sellers, get_product
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+from urllib.parse import quote
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from products import get_top_sellers, get_product, catalog_version, iter_ranked, page_ranked, refresh_source
+from respcache import ResponseCache
+from templates import Template, FragmentCache
+import affiliate
+import clicks
+import imgproxy
+import rank_history
+import search
+import shared_top
 
 router = APIRouter()
+page_cache = ResponseCache()
 
-@router.get("/healthz")
-def healthz():
-    return JSONResponse({"ok": True})
+def _top_source(key: str, limit: int):
+    """
+    (cache-nøkkel, versjon, items-funksjon): delt snapshot fra lederen hvis den
+    finnes og er fersk, ellers egen katalog. Egen nøkkel per kilde, så
+    versjonsnumrene ikke blandes.
+    """
+    snap = shared_top.SHARED.current()
+    if snap is not None and limit <= snap.limit:
+        async def items():
+            return snap.items[:limit]
+        return key + ":shared", snap.seq, items
+    return key, catalog_version(), lambda: get_top_sellers(limit)
 
 @router.get("/topsellers.json")
-def topsellers_json():
-    return JSONResponse({"items": get_top_sellers(10)})
+async def topsellers_json(request: Request):
+    key, version, items = _top_source("topsellers.json", 10)
+
+    async def body() -> bytes:
+        return json.dumps({"items": await items()}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return await page_cache.respond(request, key, version, body, "application/json")
+
+@router.get("/catalog.json")
+def catalog_page(cursor: Optional[str] = None, limit: int = Query(100, ge=1, le=1000)):
+    """Hele rangerte katalogen, side for side (cursor fra forrige svar)."""
+    try:
+        items, next_cursor = page_ranked(cursor, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return JSONResponse({"items": items, "next_cursor": next_cursor})
+
+def _ndjson_lines(rows, batch: int = 256):
+    buf = []
+    for p in rows:
+        buf.append(json.dumps(p.to_public(), ensure_ascii=False, separators=(",", ":")))
+        if len(buf) >= batch:
+            yield ("\n".join(buf) + "\n").encode("utf-8")
+            buf.clear()
+    if buf:
+        yield ("\n".join(buf) + "\n").encode("utf-8")
+
+@router.get("/search")
+async def search_products(
+    q: str = Query("", max_length=200),
+    category: Optional[str] = None,
+    tag: List[str] = Query([]),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    min_score: Optional[float] = None,
+    max_score: Optional[float] = None,
+    sort: str = Query("rank", pattern="^(rank|price_asc|price_desc)$"),
+    offset: int = Query(0, ge=0, le=search.MAX_OFFSET),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Fritekst + fasetter (kategori, tag) + pris/score-filtre, rangert og paginert."""
+    await refresh_source()
+    # søket (og ombygging av indeksen etter catalog.load) kjøres i tråd, ikke på event-loopen
+    return JSONResponse(await asyncio.to_thread(
+        search.INDEX.search, q, category=category, tags=tag, min_price=min_price, max_price=max_price,
+        min_score=min_score, max_score=max_score, sort=sort, offset=offset, limit=limit))
 
-@router.get("/r/{pid}")
-def redirect_aff(pid: str):
+def _when(raw: Optional[str], default: float) -> float:
+    """Tidspunkt som epoch-sekunder eller ISO 8601 (uten sone = UTC)."""
+    if not raw:
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        pass
+    try:
+        dt = datetime.fromisoformat(raw)
+    except ValueError:
+        raise HTTPException(400, f"bad time: {raw}") from None
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+@router.get("/history/products/{pid}")
+def product_history(pid: str, since: Optional[str] = None, until: Optional[str] = None):
+    """Plass i topp-listen over tid (default: siste 7 dager). Lest i tråd (fil-IO)."""
+    end = _when(until, time.time())
+    start = _when(since, end - 7 * 86400)
+    return JSONResponse({"id": pid, "points": rank_history.HISTORY.rank_over_time(pid, start, end)})
+
+@router.get("/history/movers")
+def ranking_movers(since: Optional[str] = None, until: Optional[str] = None,
+                   limit: int = Query(10, ge=1, le=100)):
+    """Største endringer i plass mellom to tidspunkt (default: siste døgn)."""
+    end = _when(until, time.time())
+    start = _when(since, end - 86400)
+    return JSONResponse(rank_history.HISTORY.movers(start, end, limit))
+
+@router.get("/catalog.ndjson")
+def catalog_ndjson(cursor: Optional[str] = None):
+    """Strømmer hele rangerte katalogen som NDJSON (ett produkt per linje)."""
+    try:
+        rows = iter_ranked(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return StreamingResponse(_ndjson_lines(rows), media_type="application/x-ndjson")
+
+@router.get("/r/{pid:path}")   # :path, så en id med %2F (dekodet til /) også treffer
+async def redirect_aff(pid: str):
+    # Varm sti: ferdig URL fra LRU, uten katalogoppslag
+    target = affiliate.cached_target(pid)
+    if target is None:
+        p = get_product(pid)
+        if not p or not p.url:
+            raise HTTPException(status_code=404, detail="Unknown product")
+        target = affiliate.remember_target(pid, p.url)
+    clicks.hit(pid)
+    return RedirectResponse(url=target, status_code=302)
+
+@router.get("/img/{pid:path}/{size}")
+async def product_image(pid: str, size: int, request: Request):
+    """Produktbilde skalert til size (se imgproxy.SIZES), fra lokal disk-cache."""
+    if size not in imgproxy.SIZES:
+        raise HTTPException(status_code=404, detail="Unsupported size")
     p = get_product(pid)
-    if not p or not p.url:
+    if not p or not p.image:
         raise HTTPException(status_code=404, detail="Unknown product")
-    # TODO: legg på dine affiliate-parametre/UTM her når du har IDs
-    target = p.url  # + "?tag=DIN_AMAZON_TAG" osv.
-    return RedirectResponse(url=target, status_code=302)
+    return await imgproxy.PROXY.respond(request, p.image, size)
 
-@router.get("/")
-def home():
-    items = get_top_sellers(5)
-    li = "".join([
-        f'''<li style="margin:1rem 0;display:flex;gap:1rem;align-items:center">
-            <img src="{x.get("image")}" alt="" width="64" height="64" loading="lazy"/>
+PRODUCT_LI = Template("""<li style="margin:1rem 0;display:flex;gap:1rem;align-items:center">
+            <img src="{{ thumb }}" srcset="{{ thumb2x }} 2x" alt="" width="64" height="64" loading="lazy"/>
             <div style="flex:1">
-              <div style="font-weight:600">{x.get("title")}</div>
-              <div style="opacity:.7">Score: {x.get("score")}{(" · $" + str(x.get("price"))) if x.get("price") else ""}</div>
+              <div style="font-weight:600">{{ p['title'] }}</div>
+              <div style="opacity:.7">Score: {{ p['score'] }}{% if p['price'] %} · ${{ p['price'] }}{% endif %}</div>
             </div>
-            <a href="/r/{x.get("id")}" style="padding:.5rem 1rem;border:1px solid #ddd;border-radius:.5rem;text-decoration:none">Se tilbud</a>
-        </li>'''
+            <a href="{{ href }}" style="padding:.5rem 1rem;border:1px solid #ddd;border-radius:.5rem;text-decoration:none">Se tilbud</a>
+        </li>""", "product_li")
+
+HOME_PAGE = Template("""<!doctype html><meta charset="utf-8">
+    <title>PureBloomWorld – {{ title }}</title>
+    <meta name="viewport" content="width=device-width,initial-scale=1"/>
+    <style>body{font-family:system-ui;margin:2rem;max-width:800px} h1{margin:0 0 1rem}</style>
+    <h1>{{ heading }}</h1>
+    <ul style="list-style:none;padding:0;margin:0">{{ items_html|safe }}</ul>
+    """, "home")
+
+# Ett fragment per produkt, nøkkel = id + feltene fragmentet viser (produktets "versjon")
+# id-er fra feeder/markedsplasser kan inneholde / ? #: URL-encodes i lenken
+product_fragments = FragmentCache(lambda p: PRODUCT_LI(
+    p=p, href="/r/" + quote(p["id"], safe=""), thumb=imgproxy.thumb_url(p["id"], p["image"], 64),
+    thumb2x=imgproxy.thumb_url(p["id"], p["image"], 128)))
+
+def render_product_list(items) -> str:
+    get = product_fragments.get
+    return "".join([
+        get((x["id"], x["title"], x["image"], x["score"], x["price"]), x)
         for x in items
     ])
-    html = f"""<!doctype html><meta charset="utf-8">
-    <title>PureBloomWorld – Toppselgere</title>
-    <meta name="viewport" content="width=device-width,initial-scale=1"/>
-    <style>body{{font-family:system-ui;margin:2rem;max-width:800px}} h1{{margin:0 0 1rem}}</style>
-    <h1>Dagens toppselgere</h1>
-    <ul style="list-style:none;padding:0;margin:0">{li}</ul>
-    """
-    return HTMLResponse(html)
\ No newline at end of file
+
+@router.get("/top")
+async def home(request: Request):
+    key, version, items = _top_source("home", 5)
+
+    async def body() -> bytes:
+        html = HOME_PAGE(title="Toppselgere", heading="Dagens toppselgere",
+                         items_html=render_product_list(await items()))
+        return html.encode("utf-8")
+    return await page_cache.respond(request, key, version, body, "text/html; charset=utf-8")
\ No newline at end of file
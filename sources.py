@@ -0,0 +1,380 @@
+# sources.py
+"""
+Async produktkilder (markedsplass-API-er) foran katalogen.
+
+- Kilder er plugbare: alt med `name` og `async fetch_page(page) -> (produkter, sider totalt)`
+  (HttpMarketplaceSource for JSON-API-er, se også standin.FakeMarketplace)
+- ProductFeed holder resultatet med TTL + stale-while-revalidate:
+    fersk            -> svar fra cache
+    gammel (stale)   -> svar fra cache, oppfrisk i bakgrunnen
+    mangler/utløpt   -> vent på oppfriskning
+  Oppfriskninger er single-flight: samtidige bommer deler ett upstream-kall
+- Fan-out over kilder og sider med felles semafor (SOURCE_CONCURRENCY)
+- Circuit breaker per kilde: etter N feil på rad hoppes kilden over i en
+  periode, og siste gode produkter fra den brukes (stale-if-error)
+- Nytt resultat flettes inn i katalogen bare når det er endret; produkter fra
+  feed/snapshot (catalog_loader) blir stående. Endret = annerledes enn forrige
+  resultat fra kilden, så klikk-boostet score i katalogen teller ikke som endring
+
+ENV:
+- MARKETPLACE_URLS         (f.eks. "acme=https://api.acme.test/v1,beta=https://..."; tom = av)
+- SOURCE_TTL               (default: 300 sek)
+- SOURCE_STALE_TTL         (default: 3600 sek; så lenge serveres gammel data mens vi oppfrisker)
+- SOURCE_CONCURRENCY       (default: 4 samtidige upstream-kall)
+- SOURCE_PAGE_SIZE         (default: 100)
+- SOURCE_BREAKER_FAILURES  (default: 5)
+- SOURCE_BREAKER_RESET     (default: 30 sek)
+"""
+from __future__ import annotations
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+import asyncio
+import os
+import time
+
+import http_pool
+import metrics
+import products
+from catalog_loader import validate
+from products import CATALOG, Product
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "").strip() or default)
+    except ValueError:
+        return default
+
+
+TTL = _env_float("SOURCE_TTL", 300.0)
+STALE_TTL = _env_float("SOURCE_STALE_TTL", 3600.0)
+CONCURRENCY = int(_env_float("SOURCE_CONCURRENCY", 4))
+PAGE_SIZE = int(_env_float("SOURCE_PAGE_SIZE", 100))
+BREAKER_FAILURES = int(_env_float("SOURCE_BREAKER_FAILURES", 5))
+BREAKER_RESET = _env_float("SOURCE_BREAKER_RESET", 30.0)
+
+FETCHES = metrics.counter("pbw_source_fetches_total", "Upstream product-source page fetches", ("source", "result"))
+CACHE = metrics.counter("pbw_source_cache_total", "Product-feed reads by cache state", ("state",))
+
+
+class SourceError(Exception):
+    pass
+
+
+class CircuitOpen(SourceError):
+    pass
+
+
+# -------- single-flight --------
+class SingleFlight:
+    """
+    Samtidige kall med samme nøkkel deler ett resultat (eller én feil).
+    fn kjører i en egen task som alle venter på via shield, så en kaller som
+    avbrytes (f.eks. klient som kobler fra) ikke avbryter de andre.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()   # merk som hentet (ingen "never retrieved"-advarsel)
+
+
+# -------- circuit breaker --------
+class CircuitBreaker:
+    """
+    closed -> (N feil på rad) -> open -> (etter reset_after) -> half_open -> closed/open.
+    I half_open slippes nøyaktig ett prøvekall inn; de andre avvises til det har
+    svart (eller til det er glemt etter reset_after).
+    """
+
+    def __init__(self, failures: int = BREAKER_FAILURES, reset_after: float = BREAKER_RESET,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_failures = max(failures, 1)
+        self.reset_after = reset_after
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_at: Optional[float] = None     # prøvekallet i half_open startet
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.clock() - self.opened_at >= self.reset_after else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open":
+            return False
+        now = self.clock()
+        if self.probe_at is not None and now - self.probe_at < self.reset_after:
+            return False
+        self.probe_at = now
+        return True
+
+    def success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probe_at = None
+
+    def failure(self) -> None:
+        self.failures += 1
+        self.probe_at = None
+        if self.opened_at is not None or self.failures >= self.max_failures:
+            # feil i half_open åpner igjen med ny periode
+            if self.opened_at is None:
+                self.trips += 1
+            self.opened_at = self.clock()
+
+
+# -------- kilder --------
+class HttpMarketplaceSource:
+    """
+    JSON-API: GET {base}/products?page=N&per_page=M ->
+    {"items": [{id,title,image,url,price,score}, ...], "pages": totalt antall sider}
+    """
+
+    def __init__(self, name: str, base_url: str, page_size: int = PAGE_SIZE):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.page_size = page_size
+
+    async def fetch_page(self, page: int) -> Tuple[List[Product], int]:
+        try:
+            r = await http_pool.request("GET", f"{self.base_url}/products",
+                                        params={"page": page, "per_page": self.page_size})
+        except Exception as e:
+            raise SourceError(f"{self.name}: {type(e).__name__}: {e}") from e
+        if r.status_code != 200:
+            raise SourceError(f"{self.name}: HTTP {r.status_code} on page {page}")
+        try:
+            data = r.json()
+            rows, pages = data["items"], int(data.get("pages", 1))
+        except (ValueError, KeyError, TypeError) as e:
+            raise SourceError(f"{self.name}: bad payload on page {page}: {e}") from e
+        out: List[Product] = []
+        for row in rows:
+            try:
+                out.append(validate(row))
+            except (ValueError, AttributeError):
+                continue
+        return out, pages
+
+
+def parse_sources(raw: str) -> List[HttpMarketplaceSource]:
+    out = []
+    for i, part in enumerate(p.strip() for p in raw.split(",") if p.strip()):
+        name, sep, url = part.partition("=")
+        if not sep:
+            name, url = f"source{i + 1}", part
+        out.append(HttpMarketplaceSource(name.strip(), url.strip()))
+    return out
+
+
+async def _gather_or_cancel(aws: List[Awaitable]) -> list:
+    """Som gather, men første feil avbryter resten (ingen sidekall som fortsetter for ingenting)."""
+    tasks = [asyncio.ensure_future(a) for a in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+# -------- feed --------
+class ProductFeed:
+    def __init__(self, sources: Sequence, catalog=CATALOG, ttl: float = TTL, stale_ttl: float = STALE_TTL,
+                 concurrency: int = CONCURRENCY, clock: Callable[[], float] = time.monotonic,
+                 breaker_factory: Callable[[], CircuitBreaker] = CircuitBreaker):
+        self.sources = list(sources)
+        self.catalog = catalog
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.clock = clock
+        self.breakers = {s.name: breaker_factory() for s in self.sources}
+        self._sem = asyncio.Semaphore(max(concurrency, 1))
+        self._flight = SingleFlight()
+        self._last_good: Dict[str, List[Product]] = {}
+        self._products: Optional[List[Product]] = None
+        self._fetched_at: Optional[float] = None
+        self._bg: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.upstream_calls = 0
+        self.last_error: Optional[str] = None
+
+    # -------- upstream --------
+    async def _page(self, source, page: int) -> Tuple[List[Product], int]:
+        async with self._sem:
+            self.upstream_calls += 1
+            try:
+                res = await source.fetch_page(page)
+            except SourceError:
+                FETCHES.inc(source.name, "error")
+                raise
+            FETCHES.inc(source.name, "ok")
+            return res
+
+    async def _fetch_source(self, source) -> List[Product]:
+        breaker = self.breakers[source.name]
+        if not breaker.allow():
+            raise CircuitOpen(f"{source.name}: circuit open")
+        try:
+            first, pages = await self._page(source, 1)
+            rest = await _gather_or_cancel([self._page(source, p) for p in range(2, pages + 1)])
+        except SourceError:
+            breaker.failure()
+            raise
+        breaker.success()
+        items = list(first)
+        for page_items, _ in rest:
+            items.extend(page_items)
+        return items
+
+    async def _refresh(self) -> List[Product]:
+        results = await asyncio.gather(*(self._fetch_source(s) for s in self.sources), return_exceptions=True)
+        merged: Dict[str, Product] = {}
+        errors = []
+        for source, res in zip(self.sources, results):
+            if isinstance(res, BaseException):
+                if not isinstance(res, SourceError):
+                    raise res
+                errors.append(str(res))
+                res = self._last_good.get(source.name)
+                if res is None:
+                    continue
+            else:
+                self._last_good[source.name] = res
+            for p in res:
+                merged.setdefault(p.id, p)   # første kilde vinner ved lik id
+        self.last_error = "; ".join(errors) or None
+        if not merged:
+            raise SourceError(self.last_error or "no products from any source")
+        fresh = list(merged.values())
+        if fresh != self._products:
+            await self._merge(fresh)
+        self._products = fresh
+        self._fetched_at = self.clock()
+        self.refreshes += 1
+        return fresh
+
+    async def _merge(self, fresh: List[Product]) -> None:
+        """
+        Flett kildene inn i katalogen: produkter fra feed/snapshot (catalog_loader)
+        beholdes, markedsplassen vinner ved lik id, og produkter som forsvant fra
+        kildene siden forrige runde fjernes. Få endringer => upsert/remove på loopen;
+        mange => ny katalog bygget i en tråd og byttet inn samlet (load med
+        expect_version, så endringer som kommer imens ikke går tapt).
+        """
+        prev = {p.id: p for p in self._products or ()}
+        fresh_ids = {p.id for p in fresh}
+        gone = [pid for pid in prev if pid not in fresh_ids]
+        for _ in range(3):
+            version = self.catalog.version
+            changed = self._diff(prev, fresh)
+            if not gone and not changed:
+                return
+            if (len(gone) + len(changed)) * 32 <= len(self.catalog):
+                break
+            if await asyncio.to_thread(self._reload, version, gone, changed):
+                return
+        else:
+            changed = self._diff(prev, fresh)   # katalogen endret seg under hver ombygging
+        for pid in gone:
+            self.catalog.remove(pid)
+        for p in changed:
+            self.catalog.upsert(p)
+
+    def _diff(self, prev: Dict[str, Product], fresh: List[Product]) -> List[Product]:
+        """
+        Produktene i fresh som må skrives til katalogen. Sammenlignes med forrige
+        resultat fra kildene, ikke med katalogen: der kan scoren være klikk-boostet,
+        og å skrive den tilbake ville nullstille boosten ved hver oppfriskning.
+        """
+        if not prev:
+            return [p for p in fresh if self.catalog.get(p.id) != p]
+        return [p for p in fresh if prev.get(p.id) != p or p.id not in self.catalog]
+
+    def _reload(self, version: int, gone: List[str], changed: List[Product]) -> bool:
+        """Katalogen uten gone, med changed byttet inn (kjøres i en tråd); False hvis endret siden version."""
+        drop = set(gone)
+        drop.update(p.id for p in changed)
+        rows = [p for p in self.catalog.iter_ranked() if p.id not in drop]
+        rows += changed
+        return self.catalog.load(rows, expect_version=version)
+
+    def refresh(self) -> Awaitable[List[Product]]:
+        return self._flight.do("refresh", self._refresh)
+
+    def prefetch(self) -> None:
+        """Start en oppfriskning i bakgrunnen (f.eks. ved oppstart)."""
+        if self.sources:
+            self._refresh_in_background()
+
+    def _refresh_in_background(self) -> None:
+        if self._bg is not None and not self._bg.done():
+            return
+
+        async def run():
+            try:
+                await self.refresh()
+            except SourceError as e:
+                print(f"[WARN] product sources refresh failed: {e}")
+
+        self._bg = asyncio.create_task(run())
+
+    # -------- lesing --------
+    async def ensure_fresh(self) -> None:
+        """Kalles før katalogen leses; venter bare når vi ikke har brukbar data."""
+        if not self.sources:
+            return
+        age = None if self._fetched_at is None else self.clock() - self._fetched_at
+        if age is not None and age < self.ttl:
+            CACHE.inc("fresh")
+            return
+        if age is not None and age < self.stale_ttl:
+            CACHE.inc("stale")
+            self._refresh_in_background()
+            return
+        CACHE.inc("miss")
+        try:
+            await self.refresh()
+        except SourceError as e:
+            # stale-if-error: behold det katalogen har (forrige resultat eller PRODUCT_DB)
+            print(f"[WARN] product sources unavailable: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "sources": [s.name for s in self.sources],
+            "products": len(self._products or ()),
+            "age_s": None if self._fetched_at is None else round(self.clock() - self._fetched_at, 1),
+            "refreshes": self.refreshes,
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self._flight.shared,
+            "breakers": {n: {"state": b.state, "failures": b.failures, "trips": b.trips}
+                         for n, b in self.breakers.items()},
+            "last_error": self.last_error,
+        }
+
+
+FEED = ProductFeed(parse_sources(os.getenv("MARKETPLACE_URLS", "")))
+if FEED.sources:
+    products.set_source(FEED.ensure_fresh)
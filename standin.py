@@ -0,0 +1,610 @@
+# standin.py
+"""
+Lokal stand-in HTTP-server for å teste utgående kall uten nett.
+
+- Kjører i egen tråd på 127.0.0.1 (tilfeldig port), HTTP/1.1 med keep-alive
+- Teller TCP-tilkoblinger og requests, så gjenbruk i http_pool kan verifiseres
+- handler(method, path, headers, body) -> (status, headers, body) kan byttes ut
+
+FakeGitHub er en in-memory handler for contents- og git-endepunktene.
+FakeMarketplace er et side-delt produkt-API med valgfri latens og feil.
+StaticFiles serverer faste filer (f.eks. bilder) og teller hentinger.
+
+Kjør `python standin.py` for å sjekke at http_pool gjenbruker tilkoblinger
+og at gh_push.CommitPipeline oppfører seg mot FakeGitHub.
+"""
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import urlsplit
+import base64
+import hashlib
+import json
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+
+Handler = Callable[[str, str, Dict[str, str], bytes], Tuple[int, Dict[str, str], bytes]]
+
+
+def echo_handler(method: str, path: str, headers: Dict[str, str], body: bytes):
+    out = json.dumps({"method": method, "path": path, "size": len(body)}).encode()
+    return 200, {"Content-Type": "application/json"}, out
+
+
+def _json(status: int, obj) -> Tuple[int, Dict[str, str], bytes]:
+    return status, {"Content-Type": "application/json"}, json.dumps(obj).encode()
+
+
+class FakeGitHub:
+    """
+    Minimal in-memory GitHub: contents GET/PUT og git ref/commits/trees.
+    conflicts=N får de N neste ref-oppdateringene til å feile med 422
+    (som om noen andre pushet i mellomtiden).
+    """
+
+    def __init__(self, branch: str = "main"):
+        self.blobs: Dict[str, bytes] = {}
+        self.trees: Dict[str, Dict[str, str]] = {}     # tree-sha -> {path: blob-sha}
+        self.commits: Dict[str, dict] = {}
+        self.refs: Dict[str, str] = {}
+        self.conflicts = 0
+        self.calls: List[Tuple[str, str]] = []
+        self._lock = threading.Lock()
+        root = self._commit(self._tree({}), [], "init")
+        self.refs[branch] = root
+
+    @staticmethod
+    def _sha(kind: str, payload: bytes) -> str:
+        return hashlib.sha1(kind.encode() + b"\0" + payload).hexdigest()
+
+    def _blob(self, data: bytes) -> str:
+        from gh_push import git_blob_sha
+        sha = git_blob_sha(data)
+        self.blobs[sha] = data
+        return sha
+
+    def _tree(self, files: Dict[str, str]) -> str:
+        sha = self._sha("tree", json.dumps(files, sort_keys=True).encode())
+        self.trees[sha] = dict(files)
+        return sha
+
+    def _commit(self, tree: str, parents: List[str], message: str) -> str:
+        sha = self._sha("commit", json.dumps([tree, parents, message, len(self.commits)]).encode())
+        self.commits[sha] = {"sha": sha, "tree": {"sha": tree}, "parents": [{"sha": p} for p in parents],
+                             "message": message}
+        return sha
+
+    def files(self, branch: str = "main") -> Dict[str, bytes]:
+        tree = self.trees[self.commits[self.refs[branch]]["tree"]["sha"]]
+        return {p: self.blobs[s] for p, s in tree.items()}
+
+    def __call__(self, method: str, path: str, headers: Dict[str, str], body: bytes):
+        with self._lock:
+            self.calls.append((method, path))
+            return self._route(method, path, json.loads(body) if body else {})
+
+    def _route(self, method: str, raw_path: str, data: dict):
+        parts = urlsplit(raw_path)
+        m = re.match(r"^/repos/[^/]+/[^/]+(/.*)$", parts.path)
+        if not m:
+            return _json(404, {"message": "Not Found"})
+        path = m.group(1)
+
+        if path.startswith("/contents/"):
+            fpath = path[len("/contents/"):]
+            branch = data.get("branch") or dict(
+                kv.split("=", 1) for kv in parts.query.split("&") if "=" in kv).get("ref", "main")
+            head = self.refs[branch]
+            files = self.trees[self.commits[head]["tree"]["sha"]]
+            if method == "GET":
+                if fpath not in files:
+                    return _json(404, {"message": "Not Found"})
+                return _json(200, {"sha": files[fpath], "path": fpath,
+                                   "content": base64.b64encode(self.blobs[files[fpath]]).decode()})
+            if method == "PUT":
+                if fpath in files and data.get("sha") != files[fpath]:
+                    return _json(409, {"message": "sha mismatch"})
+                new = dict(files)
+                new[fpath] = self._blob(base64.b64decode(data["content"]))
+                self.refs[branch] = self._commit(self._tree(new), [head], data.get("message", ""))
+                return _json(201 if fpath not in files else 200, {"content": {"sha": new[fpath]}})
+
+        if m2 := re.match(r"^/git/refs?/heads/(.+)$", path):
+            branch = m2.group(1)
+            if method == "GET":
+                return _json(200, {"object": {"sha": self.refs[branch], "type": "commit"}})
+            if method == "PATCH":
+                if self.conflicts > 0:
+                    self.conflicts -= 1
+                    # noen andre pushet: flytt branchen et hakk
+                    head = self.refs[branch]
+                    self.refs[branch] = self._commit(self.commits[head]["tree"]["sha"], [head], "other")
+                    return _json(422, {"message": "Update is not a fast forward"})
+                new = self.commits.get(data.get("sha"))
+                if new is None:
+                    return _json(422, {"message": "Object does not exist"})
+                parents = [p["sha"] for p in new["parents"]]
+                if not data.get("force") and self.refs[branch] not in parents:
+                    return _json(422, {"message": "Update is not a fast forward"})
+                self.refs[branch] = new["sha"]
+                return _json(200, {"object": {"sha": new["sha"]}})
+
+        if m2 := re.match(r"^/git/commits/?([0-9a-f]*)$", path):
+            if method == "GET":
+                c = self.commits.get(m2.group(1))
+                return _json(200, c) if c else _json(404, {"message": "Not Found"})
+            if method == "POST":
+                sha = self._commit(data["tree"], list(data.get("parents", [])), data.get("message", ""))
+                return _json(201, self.commits[sha])
+
+        if m2 := re.match(r"^/git/trees/?([0-9a-f]*)$", path):
+            if method == "GET":
+                files = self.trees.get(m2.group(1))
+                if files is None:
+                    return _json(404, {"message": "Not Found"})
+                return _json(200, {"sha": m2.group(1), "tree": [
+                    {"path": p, "type": "blob", "mode": "100644", "sha": s} for p, s in files.items()]})
+            if method == "POST":
+                files = dict(self.trees.get(data.get("base_tree"), {}))
+                for e in data.get("tree", []):
+                    if "content" in e:
+                        files[e["path"]] = self._blob(e["content"].encode("utf-8"))
+                    elif e.get("sha") is None:
+                        files.pop(e["path"], None)
+                    else:
+                        files[e["path"]] = e["sha"]
+                sha = self._tree(files)
+                return _json(201, {"sha": sha})
+
+        return _json(404, {"message": "Not Found"})
+
+
+class FakeMarketplace:
+    """
+    GET /products?page=N&per_page=M -> {"items": [...], "pages": P}
+    latency: sek per request; error_rate: andel 500-svar (seeded);
+    fail_next: de N neste requestene gir 503.
+    """
+
+    def __init__(self, n: int = 250, latency: float = 0.0, error_rate: float = 0.0, seed: int = 1,
+                 prefix: str = "mkt"):
+        self.products = [
+            {"id": f"{prefix}-{i}", "title": f"Marketplace product {i}",
+             "image": f"https://img.example/{i}.jpg", "url": f"https://shop.example/dp/{prefix}{i}",
+             "price": round(5 + (i * 7.3) % 300, 2), "score": round((i * 3.7) % 10, 2)}
+            for i in range(n)
+        ]
+        self.latency = latency
+        self.error_rate = error_rate
+        self.fail_next = 0
+        self.calls = 0
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, method: str, path: str, headers: Dict[str, str], body: bytes):
+        parts = urlsplit(path)
+        with self._lock:
+            self.calls += 1
+            fail = self.fail_next > 0 or self._rnd.random() < self.error_rate
+            if self.fail_next > 0:
+                self.fail_next -= 1
+        if self.latency:
+            time.sleep(self.latency)
+        if parts.path != "/products":
+            return _json(404, {"message": "Not Found"})
+        if fail:
+            return _json(503, {"message": "upstream unavailable"})
+        q = dict(kv.split("=", 1) for kv in parts.query.split("&") if "=" in kv)
+        page, per = max(int(q.get("page", 1)), 1), max(int(q.get("per_page", 100)), 1)
+        pages = max((len(self.products) + per - 1) // per, 1)
+        return _json(200, {"items": self.products[(page - 1) * per:page * per], "pages": pages})
+
+
+class StaticFiles:
+    """Faste filer: path -> (content-type, bytes). hits teller hentinger per path."""
+
+    def __init__(self, files: Dict[str, Tuple[str, bytes]], latency: float = 0.0):
+        self.files = files
+        self.latency = latency
+        self.hits: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, method: str, path: str, headers: Dict[str, str], body: bytes):
+        path = urlsplit(path).path
+        with self._lock:
+            self.hits[path] = self.hits.get(path, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+        if path not in self.files:
+            return 404, {"Content-Type": "text/plain"}, b"not found"
+        ctype, data = self.files[path]
+        return 200, {"Content-Type": ctype}, data
+
+
+def png(width: int, height: int, rgb: Tuple[int, int, int] = (200, 80, 40)) -> bytes:
+    """Ensfarget PNG uten Pillow (til StaticFiles)."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    row = b"\x00" + bytes(rgb) * width
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(row * height)) + chunk(b"IEND", b""))
+
+
+class StandIn:
+    def __init__(self, handler: Handler = echo_handler):
+        self.handler = handler
+        self.connections = 0
+        self.requests: List[Tuple[str, str]] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        standin = self
+
+        class _H(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep-alive
+
+            def setup(self):
+                super().setup()
+                with standin._lock:
+                    standin.connections += 1
+
+            def _serve(self):
+                size = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(size) if size else b""
+                with standin._lock:
+                    standin.requests.append((self.command, self.path))
+                status, headers, out = standin.handler(
+                    self.command, self.path, {k.lower(): v for k, v in self.headers.items()}, body)
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(out)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _serve
+
+            def log_message(self, *args):
+                pass
+
+        return _H
+
+    def start(self) -> "StandIn":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StandIn":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def pool_reuse_check(n: int = 50) -> Tuple[int, int]:
+    """Send n async + n sync kall via http_pool; returner (requests, connections)."""
+    import asyncio
+    import http_pool
+
+    with StandIn() as srv:
+        async def go():
+            await http_pool.startup()
+            for i in range(n):
+                await http_pool.request("POST", f"{srv.url}/webhook/{i}", json={"content": "x"})
+            for i in range(n):
+                http_pool.request_sync("GET", f"{srv.url}/contents/{i}")
+            await http_pool.shutdown()
+
+        asyncio.run(go())
+        return len(srv.requests), srv.connections
+
+
+def discord_check() -> None:
+    """DiscordDispatcher: 4xx telles som failed, bare advarsler droppes som nylig sendt."""
+    import asyncio
+    import http_pool
+    from discord_queue import DiscordDispatcher
+
+    def handler(method, path, headers, body):
+        return (404, {}, b"") if path.endswith("/gone") else (204, {}, b"")
+
+    with StandIn(handler) as srv:
+        async def go():
+            ok = DiscordDispatcher(srv.url + "/webhook", batch_window=0.01)
+            gone = DiscordDispatcher(srv.url + "/gone", batch_window=0.01)
+            ok.start()
+            gone.start()
+            for _ in range(2):
+                ok.enqueue("📈 topp 10")
+                ok.enqueue("⚠️ feed nede")
+                await asyncio.sleep(0.2)
+            gone.enqueue("hei")
+            await ok.stop()
+            await gone.stop()
+            await http_pool.shutdown()
+            return ok.stats(), gone.stats()
+
+        ok, gone = asyncio.run(go())
+    assert ok["sent"] == 3 and ok["deduped"] == 1 and ok["failed"] == 0, ok
+    assert gone["posts"] == 0 and gone["failed"] == 1 and gone["sent"] == 0, gone
+    print(f"discord: repeat sent, repeated warning collapsed, 404 -> failed={gone['failed']}")
+
+
+def github_pipeline_check() -> None:
+    """Kjør gh_push.CommitPipeline mot FakeGitHub og sjekk oppførselen."""
+    import asyncio
+    import http_pool
+    from gh_push import CommitPipeline
+
+    fake = FakeGitHub()
+    with StandIn(fake) as srv:
+        async def go():
+            pipe = CommitPipeline("o", "r", "main", token="t", api=srv.url, cache_path=None)
+            files = {"data/top_sellers.json": "[1]", "data/meta.json": "{}"}
+            first = await pipe.commit(files, "first")
+            assert first.ok and sorted(first.changed) == sorted(files), first
+            again = await pipe.commit(files, "again")
+            assert again.ok and again.api_calls == 0 and again.commit is None, again
+            fake.conflicts = 2
+            third = await pipe.commit({"data/top_sellers.json": "[2]"}, "third")
+            assert third.ok and third.changed == ["data/top_sellers.json"], third
+            await http_pool.shutdown()
+            return first, third
+
+        first, third = asyncio.run(go())
+    assert fake.files()["data/top_sellers.json"] == b"[2]"
+    assert fake.files()["data/meta.json"] == b"{}"
+    print(f"first commit: {first.api_calls} calls, unchanged: 0 calls, "
+          f"after 2 conflicts: {third.api_calls} calls")
+
+
+def marketplace_check() -> None:
+    """sources.ProductFeed mot FakeMarketplace: coalescing, stale-while-revalidate, breaker."""
+    import asyncio
+    import http_pool
+    from products import Catalog, Product
+    from sources import CircuitBreaker, HttpMarketplaceSource, ProductFeed, SingleFlight, SourceError
+
+    market = FakeMarketplace(n=250, latency=0.05)
+    with StandIn(market) as srv:
+        async def go():
+            # avbrutt første kaller skal ikke felle de andre som venter på samme nøkkel
+            flight = SingleFlight()
+
+            async def slow():
+                await asyncio.sleep(0.05)
+                return 42
+
+            first = asyncio.ensure_future(flight.do("k", slow))
+            second = asyncio.ensure_future(flight.do("k", slow))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            assert await second == 42
+            # half_open: nøyaktig ett prøvekall
+            t = [0.0]
+            probe = CircuitBreaker(1, 30, clock=lambda: t[0])
+            probe.failure()
+            t[0] = 31
+            assert probe.allow() and not probe.allow()
+            probe.success()
+            assert probe.allow() and probe.allow()
+            # én side feiler => de andre sidekallene avbrytes
+            cancelled = []
+
+            class Flaky:
+                name = "flaky"
+
+                async def fetch_page(self, page):
+                    if page == 1:
+                        return [], 4
+                    if page == 2:
+                        raise SourceError("flaky: page 2")
+                    try:
+                        await asyncio.sleep(10)
+                    except asyncio.CancelledError:
+                        cancelled.append(page)
+                        raise
+
+            try:
+                await ProductFeed([Flaky()], Catalog()).refresh()
+            except SourceError:
+                pass
+            assert sorted(cancelled) == [3, 4], cancelled
+
+            now = [0.0]
+            catalog = Catalog([Product("feed-1", "From feed", "https://img/f1.jpg", "https://shop/f1")])
+            feed = ProductFeed([HttpMarketplaceSource("mkt", srv.url, page_size=50)], catalog,
+                               ttl=10, stale_ttl=100, concurrency=4, clock=lambda: now[0],
+                               breaker_factory=lambda: CircuitBreaker(3, 30, clock=lambda: now[0]))
+            # 50 samtidige bommer => én oppfriskning (5 sider)
+            t = time.perf_counter()
+            await asyncio.gather(*(feed.ensure_fresh() for _ in range(50)))
+            cold = time.perf_counter() - t
+            assert len(catalog) == 251 and "feed-1" in catalog and market.calls == 5, (len(catalog), market.calls)
+            # fersk: ingen upstream
+            await feed.ensure_fresh()
+            assert market.calls == 5
+            # stale: svar med en gang, oppfrisk i bakgrunnen
+            now[0] = 20
+            t = time.perf_counter()
+            await feed.ensure_fresh()
+            stale = time.perf_counter() - t
+            await feed._bg
+            assert market.calls == 10 and stale < 0.01, (market.calls, stale)
+            # klikk-boostet score er ikke en endring fra kilden; bare endrede produkter skrives
+            catalog.set_scores({"mkt-1": 99.0})
+            market.products[2] = dict(market.products[2], price=1.0)
+            await feed.refresh()
+            assert catalog.get("mkt-1").score == 99.0 and catalog.get("mkt-2").price == 1.0
+            # upstream nede: siste gode data beholdes, breaker åpner etter 3 feil
+            market.fail_next = 1000
+            for _ in range(3):
+                await feed.refresh()
+            assert len(catalog) == 251 and feed.breakers["mkt"].state == "open"
+            assert catalog.get("mkt-1").score == 99.0
+            calls_open = market.calls
+            await feed.refresh()
+            assert market.calls == calls_open, "breaker should skip upstream"
+            # opp igjen: half_open etter reset => ett forsøk, lukker
+            market.fail_next = 0
+            now[0] += 31
+            await feed.refresh()
+            assert feed.breakers["mkt"].state == "closed" and market.calls == calls_open + 5
+            await http_pool.shutdown()
+            return cold, stale, feed.stats()
+
+        cold, stale, stats = asyncio.run(go())
+    print(f"cold refresh (50 concurrent misses, 5 pages @50ms): {cold * 1e3:.0f} ms, "
+          f"{stats['coalesced']} coalesced; stale read: {stale * 1e6:.0f} µs")
+
+
+def imgproxy_check() -> None:
+    """imgproxy mot StaticFiles: coalescing, disk-hit, 304, LRU-budsjett."""
+    import asyncio
+    import tempfile
+    import httpx
+    import http_pool
+    from fastapi import FastAPI
+    import imgproxy, site_routes
+    from products import CATALOG, Product
+
+    images = {f"/p/{i}.png": ("image/png", png(600, 600, (i * 40 % 256, 90, 160))) for i in range(6)}
+    static = StaticFiles(images, latency=0.05)
+    with StandIn(static) as srv, tempfile.TemporaryDirectory() as tmp:
+        CATALOG.load([Product(f"img-{i}", f"Image {i}", f"{srv.url}/p/{i}.png", f"https://shop.example/{i}")
+                      for i in range(6)])
+        src_bytes = len(images["/p/0.png"][1])
+        proxy = imgproxy.PROXY = imgproxy.ImageProxy(imgproxy.DiskLRU(tmp, budget=int(src_bytes * 3.5)))
+        app = FastAPI()
+        app.include_router(site_routes.router)
+
+        async def go():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as c:
+                h = {"Accept": "image/webp,image/*"}
+                rs = await asyncio.gather(*(c.get("/img/img-0/64", headers=h) for _ in range(20)))
+                assert all(r.status_code == 200 for r in rs) and static.hits["/p/0.png"] == 1, static.hits
+                first = rs[0]
+                again = await c.get("/img/img-0/64", headers=h)
+                assert again.content == first.content and static.hits["/p/0.png"] == 1
+                r304 = await c.get("/img/img-0/64", headers={**h, "If-None-Match": first.headers["etag"]})
+                assert r304.status_code == 304
+                v = imgproxy.version(f"{srv.url}/p/0.png")
+                assert "immutable" in (await c.get(f"/img/img-0/64?v={v}", headers=h)).headers["cache-control"]
+                assert (await c.get("/img/img-0/65")).status_code == 404
+                assert (await c.get("/img/nope/64")).status_code == 404
+                for i in range(1, 6):
+                    await c.get(f"/img/img-{i}/64", headers=h)
+            await http_pool.shutdown()
+            return first
+
+        first = asyncio.run(go())
+    st = proxy.stats()
+    assert st["bytes"] <= st["budget"] and st["evictions"] > 0, st
+    print(f"img: 20 concurrent -> 1 fetch ({st['coalesced']} coalesced), {first.headers['content-type']} "
+          f"{len(first.content)} bytes, resize={st['resize']}, lru {st['files']} files/{st['evictions']} evicted")
+
+
+def trigger_queue_check() -> None:
+    """/trigger/* via jobbkøen: dedup, 202 + /jobs/{id}, token bucket, timeout."""
+    import asyncio
+    import os
+    import httpx
+
+    fake = FakeGitHub()
+    with StandIn() as discord_srv, StandIn(fake) as github_srv:
+        os.environ.update({
+            "DISCORD_WEBHOOK": discord_srv.url + "/webhook",
+            "GH_API": github_srv.url, "GH_TOKEN": "t", "GH_OWNER": "o", "GH_REPO": "r",
+            "GH_BLOB_CACHE": "", "SCHEDULER_STATE": "", "CLICK_LOG": "", "CATALOG_FEED": "",
+            "JOBS_LEASE": "", "TOPSELLER_SHARED": "", "HEARTBEAT_MINUTES": "0", "IDEAS_ENABLE": "false",
+            "TRIGGER_RATE_PER_MIN": "6", "TRIGGER_BURST": "3", "PING_RATE_PER_MIN": "6", "PING_BURST": "2",
+        })
+        import jobqueue, main, rank_history
+        from app import create_app
+        from gh_push import CommitPipeline
+        # gh_push er allerede importert (GH_API lest); pek pipelinen og historikken hit
+        main._github = CommitPipeline("o", "r", "main", token="t", api=github_srv.url, cache_path=None)
+        rank_history.HISTORY = rank_history.RankHistory("")
+        app = create_app()
+
+        async def go():
+            await main.startup_event()
+            try:
+                async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as c:
+                    rs = await asyncio.gather(*(c.get("/trigger/topsellers") for _ in range(10)))
+                    assert all(r.status_code == 202 for r in rs), [r.status_code for r in rs]
+                    ids = {r.json()["job"] for r in rs}
+                    assert len(ids) == 1 and sum(r.json()["deduped"] for r in rs) == 9, ids
+                    url = rs[0].headers["location"]
+                    while (st := (await c.get(url)).json())["status"] in ("queued", "running"):
+                        await asyncio.sleep(0.01)
+                    assert st["status"] == "succeeded" and st["submits"] == 10 and st["result"]["committed"], st
+                    # burst 3: to til slipper inn, deretter 429 med Retry-After
+                    for _ in range(2):
+                        r = await c.get("/trigger/topsellers")
+                        assert r.status_code == 202
+                        await jobqueue.QUEUE.get(r.json()["job"]).wait()
+                    r = await c.get("/trigger/topsellers")
+                    assert r.status_code == 429 and int(r.headers["retry-after"]) >= 1, r
+                    pings = [(await c.get("/debug/ping")).status_code for _ in range(3)]
+                    assert pings == [200, 200, 429], pings
+                    assert (await c.get("/jobs/nope")).status_code == 404
+
+                # en annen worker kjører allerede: hopp over i stedet for å committe samtidig
+                import tempfile
+                from leader import file_lock
+                with tempfile.TemporaryDirectory() as tmp:
+                    main.TOPSELLERS_LOCK = os.path.join(tmp, "topsellers.lock")
+                    with file_lock(main.TOPSELLERS_LOCK):
+                        busy = await main.topsellers_job()
+                    assert "skipped" in busy, busy
+                    main.TOPSELLERS_LOCK = None
+
+                async def slow():
+                    await asyncio.sleep(1)
+                job, _ = jobqueue.QUEUE.submit("slow", slow, timeout=0.05)
+                await job.wait()
+                assert job.status == "timeout", job.to_dict()
+                return st
+            finally:
+                await main.shutdown_event()
+
+        st = asyncio.run(go())
+    commits = len(fake.commits) - 1
+    assert commits == 1, commits   # tre kjøringer, samme innhold: én commit
+    print(f"triggers: 10 hits -> 1 job ({st['duration_s'] * 1e3:.0f} ms), {commits} commit, "
+          f"rate limit 429 after burst")
+
+
+if __name__ == "__main__":
+    reqs, conns = pool_reuse_check()
+    print(f"requests={reqs} connections={conns}")
+    # én tilkobling for async-klienten + én for sync-klienten
+    assert conns <= 2, "http_pool gjenbruker ikke tilkoblinger"
+    print("OK: connections reused")
+    discord_check()
+    print("OK: discord dispatcher")
+    github_pipeline_check()
+    print("OK: github pipeline")
+    marketplace_check()
+    print("OK: product sources")
+    imgproxy_check()
+    print("OK: image proxy")
+    trigger_queue_check()
+    print("OK: trigger queue")
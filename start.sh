@@ -1,3 +1,3 @@
 #!/bin/bash
-echo "🚀 Starting Flask app manually..."
-python3 app.py
+echo "🚀 Starting app manually..."
+exec uvicorn app:app --host 0.0.0.0 --port "${PORT:-8000}"
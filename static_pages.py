@@ -0,0 +1,77 @@
+# static_pages.py
+"""
+Statiske sider bygget én gang ved import.
+
+- HTML encodes til UTF-8 og komprimeres (gzip, og brotli hvis pakken finnes) én gang
+- Accept-Encoding forhandles per request (q-verdier respekteres)
+- Ferdige bytes sendes med sterk ETag per koding (respcache.encoded_etag) og
+  Cache-Control; If-None-Match gir 304
+- add_page(router, path, html) registrerer en side og ruten i ett steg
+  (landingssiden nå, kategorisider senere)
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Dict
+import gzip
+import os
+
+from fastapi import APIRouter, Request
+from fastapi.responses import Response
+
+from respcache import choose_encoding, encoded_etag, etag_for, etag_matches, not_modified
+
+try:
+    import brotli  # valgfri
+except ImportError:
+    brotli = None
+
+STATIC_CACHE_CONTROL = os.getenv("STATIC_CACHE_CONTROL", "public, max-age=300").strip()
+
+
+@dataclass(frozen=True)
+class StaticPage:
+    body: bytes
+    etag: str
+    media_type: str
+    encoded: Dict[str, bytes] = field(default_factory=dict)   # "br"/"gzip" -> bytes
+
+
+def build_page(content: str, media_type: str = "text/html; charset=utf-8") -> StaticPage:
+    body = content.encode("utf-8")
+    encoded: Dict[str, bytes] = {}
+    gz = gzip.compress(body, compresslevel=9, mtime=0)
+    if len(gz) < len(body):
+        encoded["gzip"] = gz
+    if brotli is not None:
+        br = brotli.compress(body, quality=11)
+        if len(br) < len(body):
+            encoded["br"] = br
+    return StaticPage(body=body, etag=etag_for(body), media_type=media_type, encoded=encoded)
+
+
+def serve(request: Request, page: StaticPage, cache_control: str = STATIC_CACHE_CONTROL) -> Response:
+    enc = choose_encoding(request.headers.get("accept-encoding", ""), page.encoded)
+    etag = encoded_etag(page.etag, enc)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag, cache_control)
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if enc is None:
+        return Response(page.body, media_type=page.media_type, headers=headers)
+    headers["Content-Encoding"] = enc
+    return Response(page.encoded[enc], media_type=page.media_type, headers=headers)
+
+
+PAGES: Dict[str, StaticPage] = {}
+
+
+def add_page(router: APIRouter, path: str, content: str,
+             media_type: str = "text/html; charset=utf-8") -> StaticPage:
+    """Bygg siden nå og legg til en GET-rute som serverer de ferdige bytene."""
+    page = PAGES[path] = build_page(content, media_type)
+
+    async def handler(request: Request):
+        return serve(request, page)
+
+    handler.__name__ = "static_" + (path.strip("/").replace("/", "_") or "index")
+    router.add_api_route(path, handler, methods=["GET"], include_in_schema=False)
+    return page
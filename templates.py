@@ -0,0 +1,151 @@
+# templates.py
+"""
+Liten mal-motor for butikksidene.
+
+Syntaks:
+  {{ uttrykk }}          -> HTML-escapes automatisk (None blir "")
+  {{ uttrykk|safe }}     -> settes inn uendret (ferdig HTML, f.eks. cachede fragmenter)
+  {% if uttrykk %} ... {% elif uttrykk %} ... {% else %} ... {% endif %}
+  {% for navn in uttrykk %} ... {% endfor %}
+
+Malen parses én gang og kompileres til en Python-funksjon render(ctx) -> str.
+Uttrykk er vanlig Python (malene er våre egne, ikke brukerinput).
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional
+import ast
+import builtins
+import html
+import re
+
+_TOKEN = re.compile(r"{{(.*?)}}|{%(.*?)%}", re.S)
+
+
+class TemplateError(ValueError):
+    pass
+
+
+def escape(value) -> str:
+    if value is None:
+        return ""
+    return html.escape(str(value), quote=True)
+
+
+def _names(expr: str) -> List[str]:
+    try:
+        tree = ast.parse(expr.strip(), mode="eval")
+    except SyntaxError as e:
+        raise TemplateError(f"bad expression {expr.strip()!r}: {e.msg}") from None
+    return [n.id for n in ast.walk(tree) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)]
+
+
+class Template:
+    def __init__(self, source: str, name: str = "<template>"):
+        self.name = name
+        self.render: Callable[[Dict], str] = self._compile(source)
+
+    def __call__(self, ctx: Optional[Dict] = None, **kw) -> str:
+        if kw:
+            ctx = {**(ctx or {}), **kw}
+        return self.render(ctx or {})
+
+    def _compile(self, source: str) -> Callable[[Dict], str]:
+        lines: List[str] = []
+        used: set = set()
+        bound: set = set()
+        stack: List[str] = []
+        depth = 1
+
+        def emit(code: str) -> None:
+            lines.append("    " * depth + code)
+
+        pos = 0
+        for m in _TOKEN.finditer(source):
+            if m.start() > pos:
+                emit(f"_w({source[pos:m.start()]!r})")
+            pos = m.end()
+            if m.group(1) is not None:
+                expr = m.group(1).strip()
+                raw = expr.endswith("|safe")
+                if raw:
+                    expr = expr[:-5].strip()
+                used.update(_names(expr))
+                emit(f"_w(str({expr}))" if raw else f"_w(_e({expr}))")
+                continue
+            tag = m.group(2).strip()
+            word, _, rest = tag.partition(" ")
+            rest = rest.strip()
+            if word == "if":
+                used.update(_names(rest))
+                emit(f"if {rest}:")
+                stack.append("if")
+                depth += 1
+            elif word in ("elif", "else"):
+                if not stack or stack[-1] != "if":
+                    raise TemplateError(f"{self.name}: {word} without if")
+                emit("pass")   # tom gren er lov
+                depth -= 1
+                if word == "elif":
+                    used.update(_names(rest))
+                    emit(f"elif {rest}:")
+                else:
+                    emit("else:")
+                depth += 1
+            elif word == "for":
+                target, sep, it = rest.partition(" in ")
+                if not sep:
+                    raise TemplateError(f"{self.name}: bad for tag {tag!r}")
+                used.update(_names(it))
+                bound.update(_names(target))
+                emit(f"for {target.strip()} in {it.strip()}:")
+                stack.append("for")
+                depth += 1
+            elif word in ("endif", "endfor"):
+                if not stack or stack.pop() != word[3:]:
+                    raise TemplateError(f"{self.name}: unexpected {word}")
+                emit("pass")
+                depth -= 1
+            else:
+                raise TemplateError(f"{self.name}: unknown tag {word!r}")
+        if stack:
+            raise TemplateError(f"{self.name}: unclosed {stack[-1]}")
+        if pos < len(source):
+            emit(f"_w({source[pos:]!r})")
+
+        ctx_names = sorted(n for n in used - bound if not hasattr(builtins, n) and n != "_e")
+        head = ["def render(_ctx):", "    _out = []", "    _w = _out.append"]
+        head += [f"    {n} = _ctx.get({n!r})" for n in ctx_names]
+        code = "\n".join(head + lines + ["    return ''.join(_out)"])
+        ns: Dict = {"_e": escape}
+        exec(compile(code, self.name, "exec"), ns)
+        return ns["render"]
+
+
+class FragmentCache:
+    """
+    Begrenset LRU for ferdig-rendrede fragmenter.
+    Nøkkelen bør inneholde alt fragmentet avhenger av (f.eks. produkt-id + versjon).
+    """
+
+    def __init__(self, render: Callable[..., str], maxsize: int = 10_000):
+        self._render = render
+        self.maxsize = maxsize
+        self._items: "OrderedDict[Hashable, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, *args, **kw) -> str:
+        out = self._items.get(key)
+        if out is not None:
+            self.hits += 1
+            self._items.move_to_end(key)
+            return out
+        self.misses += 1
+        out = self._items[key] = self._render(*args, **kw)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return out
+
+    def clear(self) -> None:
+        self._items.clear()